@@ -1,44 +1,165 @@
 #!/usr/bin/python
 #
+## @file
+#
 # Handles "communication" with the THUM temperature reader.
 #
+# The THUM software writes the current temperature, humidity, etc.
+# to a text file (as a single line of "|" separated values). This
+# file is read by a halLib.sensorLogger thread. The latest values
+# are recorded for each frame of a film as the "thum" per-frame
+# meta-data, and are also saved in the film_name.log file at the end
+# of the film. All the (time stamped) readings taken during the
+# film are saved in the film_name.thum file.
+#
+# Hardware XML parameters (all optional):
+#
+#   data_file - The THUM data file.
+#   fields - The names of the values in the data file, comma separated.
+#   interval - The time between readings in seconds.
+#
 # Hazen 3/09
 #
 
+import numpy
 import time
 
-class Thum():
-    def __init__(self):
-        self.reading = ""
-        self.last_sample_time = 0
-        self.fp = 0
-        self.data = 0
-        self.frame_number = 0
-
-    def newData(self):
-        if self.fp:
-            current_time = time.time()
-            if (current_time - self.last_sample_time) > 5.0:
-                self.last_sample_time = current_time
-                data_fp = open("C:/users/Wenqin/THUM/html/temprh")
-                data = data_fp.readline()
-                data_fp.close()
-                data = data.split("|")
-                self.data = ""
-                for datum in data:
-                    self.data += str(datum) + ","
-                self.data = self.data[:-1]
-            self.fp.write(str(self.frame_number) + "," + self.data)
-            self.frame_number += 1
-
-    def startThum(self, filename):
-        self.frame_number = 1
-        self.fp = open(filename + ".log", "w")
-
-    def stopThum(self):
-        if self.fp:
-            self.fp.close()
-            self.fp = 0
+from PyQt4 import QtCore
+
+import halLib.frameMetadata as frameMetadata
+import halLib.halModule as halModule
+import halLib.sensorLogger as sensorLogger
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+## The default location of the THUM data file.
+default_data_file = "C:/users/Wenqin/THUM/html/temprh"
+
+
+## ThumSensor
+#
+# Sensor adapter for the THUM data file.
+#
+class ThumSensor():
+
+    ## __init__
+    #
+    # @param data_file The THUM data file.
+    # @param fields A list of the names of the values in the data file.
+    #
+    def __init__(self, data_file, fields):
+        self.data_file = data_file
+        self.fields = fields
+
+    ## getFields
+    #
+    # @return A list of the names of the values.
+    #
+    def getFields(self):
+        return self.fields
+
+    ## read
+    #
+    # @return A list of the values in the data file (NaN if a value is missing or not a number).
+    #
+    def read(self):
+        data_fp = open(self.data_file)
+        data = data_fp.readline().strip().split("|")
+        data_fp.close()
+        values = []
+        for i in range(len(self.fields)):
+            try:
+                values.append(float(data[i]))
+            except (IndexError, ValueError):
+                values.append(numpy.nan)
+        return values
+
+
+## Thum
+#
+# THUM HAL module (no GUI).
+#
+class Thum(QtCore.QObject, halModule.HalModule):
+
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parameters A parameters object.
+    # @param parent The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parameters, parent):
+        QtCore.QObject.__init__(self, parent)
+        halModule.HalModule.__init__(self)
+
+        data_file = default_data_file
+        fields = ["temperature", "humidity"]
+        interval = 5.0
+        if hardware:
+            if hasattr(hardware, "data_file"):
+                data_file = hardware.data_file
+            if hasattr(hardware, "fields"):
+                fields = map(lambda x: x.strip(), hardware.fields.split(","))
+            if hasattr(hardware, "interval"):
+                interval = hardware.interval
+
+        self.film_name = False
+        self.recorder = frameMetadata.getRecorder()
+        self.start_time = 0.0
+
+        self.logger = sensorLogger.SensorLogger(ThumSensor(data_file, fields), interval, parent = self)
+        self.logger.start(QtCore.QThread.LowPriority)
+
+    ## cleanup
+    #
+    @hdebug.debug
+    def cleanup(self):
+        self.logger.stopLogging()
+
+    ## newFrame
+    #
+    # Records the latest values for the frame.
+    #
+    # @param frame A frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrame(self, frame, filming):
+        if self.film_name and frame.master:
+            self.recorder.setValue(frame.number, "thum", self.logger.getLatest())
+
+    ## startFilm
+    #
+    # @param film_name The name of the film without any extensions, or False if the film is not being saved.
+    # @param run_shutters True/False the shutters should be run or not.
+    #
+    @hdebug.debug
+    def startFilm(self, film_name, run_shutters):
+        self.film_name = film_name
+        self.start_time = time.time()
+        if film_name:
+            fields = self.logger.getFields()
+            self.recorder.addField("thum", "float32", len(fields))
+            self.recorder.addTextExport(".log",
+                                        "frame " + " ".join(fields),
+                                        ["thum"],
+                                        ["%d"] + len(fields) * ["%.2f"])
+
+    ## stopFilm
+    #
+    # Saves the readings that were taken during the film.
+    #
+    # @param film_writer The film writer object.
+    #
+    @hdebug.debug
+    def stopFilm(self, film_writer):
+        if self.film_name:
+            readings = self.logger.getReadings(self.start_time)
+            fp = open(self.film_name + ".thum", "w")
+            fp.write("time " + " ".join(self.logger.getFields()) + "\n")
+            numpy.savetxt(fp, readings, fmt = "%.3f", delimiter = " ")
+            fp.close()
+        self.film_name = False
 
 
 #
@@ -46,14 +167,16 @@ class Thum():
 #
 
 if __name__ == "__main__":
-    thum = Thum()
-    thum.startThum("test.txt")
-    thum.newData()
+    import sys
+
+    sensor = ThumSensor(sys.argv[1], ["temperature", "humidity"])
+    logger = sensorLogger.SensorLogger(sensor, 1.0)
+    logger.start()
     for i in range(6):
-        time.sleep(5)
-        print i
-        thum.newData()
-    thum.stopThum()
+        time.sleep(1)
+        print i, logger.getLatest()
+    logger.stopLogging()
+    print logger.getReadings()
 
 
 #
@@ -79,4 +202,3 @@ if __name__ == "__main__":
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 #
-
@@ -13,6 +13,7 @@
 #
 
 from ctypes import *
+import numpy
 import time
 
 # Andor constants & structures.
@@ -28,6 +29,12 @@ drv_temp_stabilized = 20036
 drv_temp_not_reached = 20037
 drv_temp_drift = 20040
 
+## The (approximate) maximum size in bytes of the frame ring buffer used by getImages16().
+ring_bytes = 256 * 1024 * 1024
+
+## The minimum number of frames in the ring buffer.
+ring_min_frames = 64
+
 ## AndorCapabilities
 #
 # The Andor camera capabilities structure.
@@ -125,7 +132,12 @@ class AndorCamera:
         self.camera_handle = camera_handle
 
         # general
+        self.frame_numbers = []
+        self.frame_times = []
+        self.metadata = False
         self.pixels = 0
+        self.ring = None
+        self.ring_position = 0
 
         # camera properties storage
         self._props_ = {}
@@ -226,6 +238,13 @@ class AndorCamera:
         andorCheck(andor.GetEMGainRange(byref(low), byref(high)), "GetEMGainRange")
         self._props_["EMGainRange"] = [low.value, high.value]
 
+        # turn on the per-frame meta-data (time stamps), this is not
+        # available on all cameras / versions of the driver.
+        try:
+            self.metadata = (andor.SetMetaData(c_int(1)) == drv_success)
+        except:
+            self.metadata = False
+
     #
     # Helper functions.
     #
@@ -724,6 +743,14 @@ class AndorCamera:
         setCurrentCamera(self.camera_handle)
         self._abortIfAcquiring_()
 
+    ## cancelWait
+    #
+    # Cancel a wait for new images (see waitForImages16()). This can be
+    # called from another thread.
+    #
+    def cancelWait(self):
+        andor.CancelWait()
+
     ## getOldestImage16
     #
     # Returns the oldest image in the acquisition buffer. 
@@ -760,19 +787,48 @@ class AndorCamera:
         else:
             raise AssertionError, "GetOldestImage16 failed: " + str(status)
 
+    ## getFrameInfo
+    #
+    # Gets the driver image numbers and (if the meta-data is available)
+    # the time stamps of a range of images. The time stamps are the
+    # time from the start of the acquisition in seconds.
+    #
+    # @param first The number of the first image.
+    # @param last The number of the last image.
+    #
+    def getFrameInfo(self, first, last):
+        self.frame_numbers = range(first, last + 1)
+        self.frame_times = [None] * len(self.frame_numbers)
+        if self.metadata:
+            start_time = create_string_buffer(16) # SYSTEMTIME
+            time_from_start = c_float(0.0)
+            for i, number in enumerate(self.frame_numbers):
+                if (andor.GetMetaDataInfo(start_time, byref(time_from_start), c_uint(number - 1)) == drv_success):
+                    self.frame_times[i] = 0.001 * time_from_start.value
+
     ## getImages16
     #
     # Returns all the new images in the acquisition buffer.
     #
-    # Returns a 2 element array. The first element is an array
-    # containing the frames acquired (possibly an empty array). The 
-    # second is the current state of the camera.
+    # Returns a 3 element array. The first element is a (frames, pixels)
+    # numpy array containing the frames acquired (possibly an empty list).
+    # The second is the frame size and the third is the current state of
+    # the camera.
+    #
+    # The frames are transferred by the driver directly into a ring
+    # buffer (see getRingRows()) and the returned array is a view of
+    # the ring buffer, so the frames are not copied.
     #
-    # @return Returns the images as an array of ctypes string buffers each of which contains the frame data.
+    # The driver image numbers and time stamps of the frames are stored
+    # in self.frame_numbers and self.frame_times (see getFrameInfo()).
+    #
+    # @return [frames, [frame x size, frame y size], "idle" / "acquiring"]
     #
     def getImages16(self):
         setCurrentCamera(self.camera_handle)
         frames = []
+        self.frame_numbers = []
+        self.frame_times = []
 
         # Check whether camera is idle or acquiring first.
         state = self._getStatus_()
@@ -785,22 +841,26 @@ class AndorCamera:
         # There is new data.
         if (status == drv_success):
 
-            # Allocate space & get the data.
+            # Get the data.
             diff = last.value - first.value + 1
-            buffer_size = self.pixels * diff
-            data_buffer = create_string_buffer(2 * buffer_size)
+            data_buffer = self.getRingRows(diff)
             valid_first = c_long(0)
             valid_last = c_long(0)
-            status = andor.GetImages16(first, last, data_buffer, c_ulong(buffer_size), byref(valid_first), byref(valid_last))
+            status = andor.GetImages16(first,
+                                       last,
+                                       data_buffer.ctypes.data_as(POINTER(c_ushort)),
+                                       c_ulong(data_buffer.size),
+                                       byref(valid_first),
+                                       byref(valid_last))
             if (first.value != valid_first.value):
                 print "getImages16 first value problem", first.value, valid_first.value
             if (last.value != valid_last.value):
                 print "getImages16 last value problem", last.value, valid_last.value
 
-            # Got the data. Split the data buffer up into frames.
+            # Got the data.
             if (status == drv_success):
-                for i in range(diff):
-                    frames.append(data_buffer[2*i*self.pixels:2*(i+1)*self.pixels])
+                frames = data_buffer
+                self.getFrameInfo(valid_first.value, valid_last.value)
                 if (state == drv_idle):
                     return [frames, self.frame_size, "idle"]
                 else:
@@ -830,6 +890,50 @@ class AndorCamera:
 
 
 
+
+    ## waitForImages16
+    #
+    # Waits for new images with WaitForAcquisitionTimeOut, which returns
+    # as soon as a new image has been acquired, when the timeout expires
+    # or when the wait is cancelled with cancelWait().
+    #
+    # @param timeout The maximum time to wait in milliseconds.
+    #
+    # @return [frames, [frame x size, frame y size], "idle" / "acquiring"] (see getImages16()).
+    #
+    def waitForImages16(self, timeout):
+        [frames, frame_size, state] = self.getImages16()
+        if (len(frames) == 0) and (state == "acquiring"):
+            setCurrentCamera(self.camera_handle)
+            status = andor.WaitForAcquisitionTimeOut(c_int(timeout))
+            if (status != drv_success) and (status != drv_no_new_data):
+                raise AssertionError, "WaitForAcquisitionTimeOut failed: " + str(status)
+            [frames, frame_size, state] = self.getImages16()
+        return [frames, frame_size, state]
+
+    ## getRingRows
+    #
+    # Returns the next rows of the frame ring buffer. The frames that are
+    # returned by getImages16() are views of the ring buffer, so they stay
+    # valid until the ring buffer wraps around (at least ring_min_frames
+    # frames later). The ring buffer is (re)allocated if the frame size
+    # changes or if it is too small for the number of frames requested.
+    #
+    # @param n The number of rows (frames).
+    #
+    # @return A (n, pixels) numpy.uint16 array.
+    #
+    def getRingRows(self, n):
+        if (self.ring is None) or (self.ring.shape[1] != self.pixels) or (self.ring.shape[0] < n):
+            ring_frames = max(ring_min_frames, n, ring_bytes/(2 * max(self.pixels, 1)))
+            self.ring = numpy.empty((ring_frames, self.pixels), dtype = numpy.uint16)
+            self.ring_position = 0
+        if ((self.ring_position + n) > self.ring.shape[0]):
+            self.ring_position = 0
+        rows = self.ring[self.ring_position:self.ring_position+n]
+        self.ring_position += n
+        return rows
+
     ## shutdown
     #
     # Abort the current acquisition (if acquiring), close the shutter and
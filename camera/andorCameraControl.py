@@ -8,7 +8,6 @@
 #
 
 from PyQt4 import QtCore
-import numpy
 import os
 import platform
 import traceback
@@ -16,7 +15,6 @@ import traceback
 # Debugging
 import sc_library.hdebug as hdebug
 
-import camera.frame as frame
 import camera.cameraControl as cameraControl
 import andor.andorcontroller as andor
 
@@ -24,7 +22,7 @@ import andor.andorcontroller as andor
 #
 # The CameraControl class specialized to control a Andor camera.
 #
-class ACameraControl(cameraControl.CameraControl):
+class ACameraControl(cameraControl.EventCameraControl):
 
     ## __init__
     #
@@ -35,18 +33,27 @@ class ACameraControl(cameraControl.CameraControl):
     #
     @hdebug.debug
     def __init__(self, hardware, parent = None):
-        cameraControl.CameraControl.__init__(self, hardware, parent)
+        cameraControl.EventCameraControl.__init__(self, hardware, parent)
         
         if hasattr(hardware, "pci_card"):
             self.initCamera(hardware.pci_card)
         else:
             self.initCamera()
 
+    ## cancelWait
+    #
+    # Cancel the wait for new frames.
+    #
+    def cancelWait(self):
+        if self.got_camera:
+            self.camera.cancelWait()
+
     ## closeShutter
     #
     # Stop the camera and close the shutter.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def closeShutter(self):
         self.shutter = False
         self.stopCamera()
@@ -61,6 +68,7 @@ class ACameraControl(cameraControl.CameraControl):
     # Stop the camera and get the acquisition timings (basically the frame rate)
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def getAcquisitionTimings(self):
         self.stopCamera()
         if self.got_camera:
@@ -73,6 +81,7 @@ class ACameraControl(cameraControl.CameraControl):
     # Stop the camera and get the camera temperature.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def getTemperature(self):
         self.stopCamera()
         if self.got_camera:
@@ -188,9 +197,9 @@ class ACameraControl(cameraControl.CameraControl):
     # @param film_settings A film settings object or None.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def newFilmSettings(self, parameters, film_settings):
         self.stopCamera()
-        self.mutex.lock()
         p = parameters
         if self.got_camera:
             self.reached_max_frames = False
@@ -237,8 +246,6 @@ class ACameraControl(cameraControl.CameraControl):
                 else:
                     self.camera.setFanMode(0) # fan on full
 
-        self.mutex.unlock()
-
     ## newParameters
     #
     # Called when the user selects a new parameters file.
@@ -246,6 +253,7 @@ class ACameraControl(cameraControl.CameraControl):
     # @param parameters The new parameters object.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def newParameters(self, parameters):
         #self.initCamera()
         p = parameters
@@ -315,6 +323,7 @@ class ACameraControl(cameraControl.CameraControl):
     # Stops the camera and opens the camera shutter.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def openShutter(self):
         self.shutter = True
         self.stopCamera()
@@ -335,65 +344,6 @@ class ACameraControl(cameraControl.CameraControl):
         if self.got_camera:
             self.camera.shutdown()
 
-    ## run
-    #
-    # This is the thread loop that handles getting the new frames from 
-    # the camera, saving them in filming mode and signaling that the
-    # camera has new data, or that the camera is idle.
-    #
-    def run(self):
-        while(self.running):
-            self.mutex.lock()
-            if self.acquire.amActive() and self.got_camera:
-
-                # Get data from camera and create frame objects.
-                [frames, frame_size, state] = self.camera.getImages16()
-
-                # Check if we got new frame data.
-                if (len(frames) > 0):
-
-                    # Create frame objects.
-                    frame_data = []
-                    for raw_frame in frames:
-                        aframe = frame.Frame(numpy.fromstring(raw_frame, dtype = numpy.uint16),
-                                             self.frame_number,
-                                             frame_size[0],
-                                             frame_size[1],
-                                             "camera1",
-                                             True)
-                        frame_data.append(aframe)
-                        self.frame_number += 1
-
-                        if self.filming:
-                            if self.daxfile:
-                                if (self.acq_mode == "fixed_length"):
-                                    if (self.frame_number <= self.frames_to_take):
-                                        self.daxfile.saveFrame(aframe)
-                                else:
-                                    self.daxfile.saveFrame(aframe)
-            
-                            if (self.acq_mode == "fixed_length") and (self.frame_number == self.frames_to_take):
-                                self.reached_max_frames = True
-                                break
-                            
-                    # Emit new data signal.
-                    self.newData.emit(frame_data, self.key)
-
-                    # Emit max frames signal.
-                    #
-                    # The signal is emitted here because if it is emitted before
-                    # newData then you never see that last frame in the movie, which
-                    # is particularly problematic for single frame movies.
-                    #
-                    if self.reached_max_frames:
-                        self.max_frames_sig.emit()
-
-            else:
-                self.acquire.idle()
-
-            self.mutex.unlock()
-            self.msleep(5)
-
     ## setEMCCDGain
     #
     # Set the EMCCD gain of the camera.
@@ -401,6 +351,7 @@ class ACameraControl(cameraControl.CameraControl):
     # @param gain The desired EMCCD gain value.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def setEMCCDGain(self, gain):
         self.stopCamera()
         if self.got_camera:
@@ -415,32 +366,39 @@ class ACameraControl(cameraControl.CameraControl):
     #
     # @param key The ID to use for the frames from this acquisition series.
     #
-    @hdebug.debug        
+    @hdebug.debug
+    @cameraControl.threadCommand
     def startCamera(self, key):
-        #if self.have_paused:
-        self.mutex.lock()
         self.acquire.go()
         self.key = key
         self.frame_number = 0
         self.max_frames_sig.reset()
         if self.got_camera:
             self.camera.startAcquisition()
-        self.mutex.unlock()
 
     ## stopCamera
     #
     # Stop the current acquisition series.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def stopCamera(self):
         if self.acquire.amActive():
-            self.mutex.lock()
             if self.got_camera:
                 self.camera.stopAcquisition()
             self.acquire.stop()
-            self.mutex.unlock()
-            while not self.acquire.amIdle():
-                self.usleep(50)
+
+    ## waitForFrames
+    #
+    # Wait for new frames with the Andor WaitForAcquisition function.
+    #
+    # @param timeout The maximum time to wait in milliseconds.
+    #
+    # @return [frames, [frame x size, frame y size], driver image numbers, driver time stamps]
+    #
+    def waitForFrames(self, timeout):
+        [frames, frame_size, state] = self.camera.waitForImages16(timeout)
+        return [frames, frame_size, self.camera.frame_numbers, self.camera.frame_times]
         
 #
 # The MIT License
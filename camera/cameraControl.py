@@ -8,14 +8,121 @@
 # is a generic class and should be specialized for control
 # of particular camera types.
 #
+# Cameras whose drivers can block waiting for new frames should use
+# EventCameraControl. Its thread waits in the driver (with a finite
+# timeout) rather than polling, and the methods that change the state
+# of the camera are run by the camera thread as commands.
+#
 # Hazen 09/13
 #
 
+import collections
+import functools
+import sys
+import threading
+import traceback
+
 from PyQt4 import QtCore
 
+import camera.frame as frame
+
 # Debugging
 import sc_library.hdebug as hdebug
 
+
+## threadCommand
+#
+# Decorator for the methods of an EventCameraControl that change the
+# state of the camera. When the method is called from another thread
+# it is sent to the camera thread as a command, and the caller waits
+# for the command to finish.
+#
+# @param method The method to decorate.
+#
+# @return The decorated method.
+#
+def threadCommand(method):
+    @functools.wraps(method)
+    def __wrapper(self, *args, **kw):
+        return self.sendCommand(method, self, *args, **kw)
+    return __wrapper
+
+
+## CameraCommand
+#
+# A method call that is run by the camera thread.
+#
+class CameraCommand():
+
+    ## __init__
+    #
+    # @param function The function to call.
+    # @param args The arguments of the function.
+    # @param kw The keyword arguments of the function.
+    #
+    def __init__(self, function, args, kw):
+        self.args = args
+        self.done = False
+        self.error = None
+        self.function = function
+        self.kw = kw
+        self.mutex = QtCore.QMutex()
+        self.result = None
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## execute
+    #
+    # Call the function (in the camera thread) and wake the thread that is waiting for it.
+    #
+    def execute(self):
+        try:
+            self.result = self.function(*self.args, **self.kw)
+        except:
+            self.error = sys.exc_info()
+        self.mutex.lock()
+        self.done = True
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## getResult
+    #
+    # Errors in the command are raised again here.
+    #
+    # @return The return value of the function.
+    #
+    def getResult(self):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result
+
+    ## waitDone
+    #
+    # Wait for the command to finish.
+    #
+    # @param timeout (Optional) The maximum time to wait in milliseconds, default is to wait until the command is done.
+    #
+    # @return True/False the command is done.
+    #
+    def waitDone(self, timeout = None):
+        self.mutex.lock()
+        if timeout is None:
+            while not self.done:
+                self.wait_condition.wait(self.mutex)
+        elif not self.done:
+            self.wait_condition.wait(self.mutex, timeout)
+        done = self.done
+        self.mutex.unlock()
+        return done
+
+
+## CameraCommandTimeout
+#
+# Raised when the camera thread did not start a command in time.
+#
+class CameraCommandTimeout(Exception):
+    pass
+
+
 ## CameraControl
 #
 # Camera update thread. All camera control is done by this thread.
@@ -293,6 +400,234 @@ class CameraControl(QtCore.QThread):
             self.openShutter()
             return True
 
+## EventCameraControl
+#
+# Camera update thread for cameras whose drivers can block waiting
+# for new frames. Sub-classes should implement waitForFrames() and,
+# if the driver supports it, cancelWait(). The methods that change
+# the state of the camera (start, stop, new parameters, etc.) should
+# be decorated with threadCommand() so that they are run by the
+# camera thread between waits. This means that self.mutex is only
+# held while the commands are queued, never while waiting for the
+# camera, so starting and stopping the camera or changing parameters
+# takes at most the wait timeout (and less if the wait can be
+# cancelled).
+#
+class EventCameraControl(CameraControl):
+
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parent = None):
+        CameraControl.__init__(self, hardware, parent)
+
+        self.command_condition = QtCore.QWaitCondition()
+        self.command_timeout = 10000
+        self.commands = collections.deque()
+        self.thread_ident = None
+        self.wait_timeout = 100
+
+        if hardware and hasattr(hardware, "wait_timeout"):
+            self.wait_timeout = hardware.wait_timeout
+
+    ## cancelWait
+    #
+    # Cancel the current wait for new frames (if any). This is called from
+    # other threads, sub-classes should override this if the driver wait
+    # can be cancelled.
+    #
+    def cancelWait(self):
+        pass
+
+    ## processCommands
+    #
+    # Run the commands that are waiting (in the camera thread).
+    #
+    def processCommands(self):
+        self.mutex.lock()
+        commands = list(self.commands)
+        self.commands.clear()
+        self.mutex.unlock()
+        for command in commands:
+            command.execute()
+
+    ## processFrames
+    #
+    # Turns the frame data into frame objects, saves them if we are filming
+    # and sends them out using the newData signal. Also signals when max
+    # frames has been reached for a fixed length acquisition.
+    #
+    # @param frames A list of frame data (numpy arrays).
+    # @param frame_size [frame x size, frame y size].
+    # @param hw_numbers (Optional) A list of the camera driver frame numbers of the frames.
+    # @param hw_timestamps (Optional) A list of the camera driver time stamps of the frames (or None).
+    #
+    def processFrames(self, frames, frame_size, hw_numbers = None, hw_timestamps = None):
+        if not hw_numbers:
+            hw_numbers = [None] * len(frames)
+        if not hw_timestamps:
+            hw_timestamps = [None] * len(frames)
+        frame_data = []
+        for i, raw_frame in enumerate(frames):
+            aframe = frame.Frame(raw_frame,
+                                 self.frame_number,
+                                 frame_size[0],
+                                 frame_size[1],
+                                 "camera1",
+                                 True,
+                                 hw_number = hw_numbers[i],
+                                 hw_timestamp = hw_timestamps[i])
+            frame_data.append(aframe)
+            self.frame_number += 1
+
+            if self.filming:
+                if self.daxfile:
+                    if (self.acq_mode == "fixed_length"):
+                        if (self.frame_number <= self.frames_to_take):
+                            self.daxfile.saveFrame(aframe)
+                    else:
+                        self.daxfile.saveFrame(aframe)
+
+                if (self.acq_mode == "fixed_length") and (self.frame_number == self.frames_to_take):
+                    self.reached_max_frames = True
+                    break
+
+        # Emit new data signal.
+        self.newData.emit(frame_data, self.key)
+
+        # Emit max frames signal.
+        #
+        # The signal is emitted here because if it is emitted before
+        # newData then you never see that last frame in the movie, which
+        # is particularly problematic for single frame movies.
+        #
+        if self.reached_max_frames:
+            self.max_frames_sig.emit()
+
+    ## run
+    #
+    # The camera thread. This runs the commands and waits for new frames
+    # while the camera is acquiring, otherwise it waits for a command.
+    #
+    def run(self):
+        self.thread_ident = threading.current_thread().ident
+        while(self.running):
+            self.processCommands()
+            if self.acquire.amActive() and self.got_camera:
+                try:
+                    [frames, frame_size, hw_numbers, hw_timestamps] = self.waitForFrames(self.wait_timeout)
+                    if (len(frames) > 0):
+                        self.processFrames(frames, frame_size, hw_numbers, hw_timestamps)
+                except:
+                    hdebug.logText("cameraControl: acquisition failed " + traceback.format_exc())
+                    self.acquire.stop()
+            else:
+                self.acquire.idle()
+                self.waitForCommand()
+        self.processCommands()
+
+    ## sendCommand
+    #
+    # Run a function in the camera thread. The function is called directly
+    # if this is the camera thread or if the camera thread is not running.
+    #
+    # @param function The function to call.
+    # @param args The arguments of the function.
+    # @param kw The keyword arguments of the function.
+    #
+    # @return The return value of the function.
+    #
+    # @throws CameraCommandTimeout if the camera thread did not start the function in time.
+    #
+    def sendCommand(self, function, *args, **kw):
+        if (threading.current_thread().ident == self.thread_ident) or not (self.running and self.isRunning()):
+            return function(*args, **kw)
+        command = CameraCommand(function, args, kw)
+        self.mutex.lock()
+        self.commands.append(command)
+        self.command_condition.wakeAll()
+        self.mutex.unlock()
+        self.cancelWait()
+        if not command.waitDone(self.command_timeout):
+
+            # Remove the command if the camera thread has not taken it yet, otherwise
+            # the camera thread is running it so wait for it to finish.
+            self.mutex.lock()
+            queued = command in self.commands
+            if queued:
+                self.commands.remove(command)
+            self.mutex.unlock()
+            name = function.__name__
+            if queued:
+                hdebug.logText("cameraControl: timed out waiting for " + name)
+                raise CameraCommandTimeout("timed out waiting for " + name)
+            hdebug.logText("cameraControl: " + name + " is taking longer than " + str(self.command_timeout) + "ms")
+            command.waitDone()
+        return command.getResult()
+
+    ## startCamera
+    #
+    # Starts an acquisition.
+    #
+    # @param key The ID number to use for frames in the current acquisition.
+    #
+    @hdebug.debug
+    @threadCommand
+    def startCamera(self, key):
+        self.acquire.go()
+        self.frame_number = 0
+        self.key = key
+        self.max_frames_sig.reset()
+
+    ## stopCamera
+    #
+    # Stops the current acquisition. As this is run by the camera thread the
+    # thread is idle when this returns.
+    #
+    @hdebug.debug
+    @threadCommand
+    def stopCamera(self):
+        self.acquire.stop()
+
+    ## stopThread
+    #
+    # Signal the camera control thread to stop running.
+    #
+    @hdebug.debug
+    def stopThread(self):
+        self.mutex.lock()
+        self.running = False
+        self.command_condition.wakeAll()
+        self.mutex.unlock()
+        self.cancelWait()
+
+    ## waitForCommand
+    #
+    # Wait (in the camera thread) until there is a command to run.
+    #
+    def waitForCommand(self):
+        self.mutex.lock()
+        if self.running and (len(self.commands) == 0):
+            self.command_condition.wait(self.mutex)
+        self.mutex.unlock()
+
+    ## waitForFrames
+    #
+    # Wait for new frames. This should return as soon as there are new
+    # frames, or when the wait is cancelled.
+    #
+    # @param timeout The maximum time to wait in milliseconds.
+    #
+    # @return [frames (a list of numpy arrays), [frame x size, frame y size], driver frame numbers, driver time stamps], the last two are None if the driver does not provide them.
+    #
+    def waitForFrames(self, timeout):
+        self.msleep(timeout)
+        return [[], [0, 0], None, None]
+
+
 ## IdleActive
 #
 # A traffic light class.
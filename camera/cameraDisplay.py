@@ -18,6 +18,7 @@ import sc_library.hdebug as hdebug
 
 # Camera Helper Modules
 import qtWidgets.qtColorGradient as qtColorGradient
+import qtWidgets.qtFrameStatistics as qtFrameStatistics
 import qtWidgets.qtRangeSlider as qtRangeSlider
 
 # Misc
@@ -31,6 +32,7 @@ class CameraDisplay(QtGui.QFrame):
     cameraDisplayCaptured = QtCore.pyqtSignal(object)
     cameraDragStart = QtCore.pyqtSignal()
     cameraDragMove = QtCore.pyqtSignal(float, float)
+    cameraFrameStatistics = QtCore.pyqtSignal(object)
     cameraROISelection = QtCore.pyqtSignal(object, object)
 
     ## __init__
@@ -80,6 +82,7 @@ class CameraDisplay(QtGui.QFrame):
         for color_name in self.color_tables.getColorTableNames():
             self.ui.colorComboBox.addItem(color_name[:-5])
 
+        self.ui.clearROIsAct = QtGui.QAction(self.tr("Clear ROIs"), self)
         self.ui.gridAct = QtGui.QAction(self.tr("Show Grid"), self)
         self.ui.infoAct = QtGui.QAction(self.tr("Hide Info"), self)
         self.ui.targetAct = QtGui.QAction(self.tr("Show Target"), self)
@@ -103,6 +106,10 @@ class CameraDisplay(QtGui.QFrame):
         self.camera_widget = cameraWidget.ACameraWidget(parameters, parent = self.ui.cameraScrollArea)
         self.ui.cameraScrollArea.setWidget(self.camera_widget)
 
+        # Frame statistics thread.
+        self.statistics_thread = qtFrameStatistics.QFrameStatisticsThread(parameters)
+        self.statistics_thread.start(QtCore.QThread.NormalPriority)
+
         # Signals
         self.ui.rangeSlider.rangeChanged.connect(self.rangeChange)
         self.ui.rangeSlider.doubleClick.connect(self.autoScale)
@@ -114,6 +121,8 @@ class CameraDisplay(QtGui.QFrame):
         self.camera_widget.dragMove.connect(self.handleDragMove)
         self.camera_widget.intensityInfo.connect(self.handleIntensityInfo)
         self.camera_widget.roiSelection.connect(self.handleROISelection)
+        self.statistics_thread.statisticsReady.connect(self.handleStatistics)
+        self.ui.clearROIsAct.triggered.connect(self.handleClearROIs)
         self.ui.gridAct.triggered.connect(self.handleGrid)
         self.ui.infoAct.triggered.connect(self.handleInfo)
         self.ui.targetAct.triggered.connect(self.handleTarget)
@@ -156,6 +165,17 @@ class CameraDisplay(QtGui.QFrame):
         self.camera_widget.newColorTable(self.color_table)
         self.color_gradient.newColorTable(self.color_table)
 
+    ## connectNotify
+    #
+    # The camera widget only makes a copy of what it displays if
+    # something is connected to the cameraDisplayCaptured signal.
+    #
+    # @param signal The signal that was connected (or disconnected).
+    #
+    def connectNotify(self, signal):
+        if hasattr(self, "camera_widget"):
+            self.camera_widget.setCaptureDisplay(self.receivers(QtCore.SIGNAL("cameraDisplayCaptured(PyQt_PyObject)")) > 0)
+
     ## contextMenuEvent
     #
     # This is called to create the popup menu when the use right click on the camera window.
@@ -167,15 +187,26 @@ class CameraDisplay(QtGui.QFrame):
         menu.addAction(self.ui.infoAct)
         menu.addAction(self.ui.targetAct)
         menu.addAction(self.ui.gridAct)
+        menu.addAction(self.ui.clearROIsAct)
         menu.exec_(event.globalPos())
 
+    ## disconnectNotify
+    #
+    # @param signal The signal that was disconnected.
+    #
+    def disconnectNotify(self, signal):
+        self.connectNotify(signal)
+
     ## displayFrame
     #
     # This is called every 1/10th of a second to update the frame that is displayed.
+    # The frame is also passed to the statistics thread so that the statistics
+    # are updated at the same rate.
     #
     def displayFrame(self):
         if self.frame:
             self.camera_widget.updateImageWithFrame(self.frame)
+            self.statistics_thread.newImage(self.frame)
 
     ## getShutterButton
     #
@@ -195,6 +226,16 @@ class CameraDisplay(QtGui.QFrame):
     def getRecordButton(self):
         return self.ui.recordButton
 
+    ## handleClearROIs
+    #
+    # Removes all of the frame statistics ROIs.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleClearROIs(self, boolean):
+        self.statistics_thread.clearROIs()
+
     ## handleDisplayCaptured
     #
     # @param a_pixmap A QPixmap object containing the image currently visible on the screen.
@@ -277,13 +318,28 @@ class CameraDisplay(QtGui.QFrame):
     ## handleROISelection
     #
     # Handles roi selection from the xCameraWidget. Basically
-    # this is a pass through that add camera information.
+    # this is a pass through that add camera information. The
+    # selection is also added to the frame statistics ROIs.
     #
     # @param select_rect The selection rectangle (QRect).
     #
     def handleROISelection(self, select_rect):
+        self.statistics_thread.addROI([select_rect.x(),
+                                       select_rect.y(),
+                                       select_rect.width(),
+                                       select_rect.height()])
         self.cameraROISelection.emit(self.which_camera, select_rect)
 
+    ## handleStatistics
+    #
+    # Handles new frame statistics from the statistics thread.
+    #
+    # @param frame_stats A qtFrameStatistics.FrameStatistics object.
+    #
+    def handleStatistics(self, frame_stats):
+        self.camera_widget.newStatistics(frame_stats)
+        self.cameraFrameStatistics.emit(frame_stats)
+
     ## handleSync
     #
     # Handles setting the sync parameter. This parameter is used in
@@ -349,6 +405,7 @@ class CameraDisplay(QtGui.QFrame):
         self.color_table = self.color_tables.getTableByName(p.colortable)
         display_range = [p.scalemin, p.scalemax]
         self.camera_widget.newParameters(p, self.color_table, display_range)
+        self.statistics_thread.newParameters(p)
 
         # camera display
         self.updateRange()
@@ -371,6 +428,15 @@ class CameraDisplay(QtGui.QFrame):
         self.ui.rangeSlider.setValues([float(p.scalemin), float(p.scalemax)])
         self.ui.syncSpinBox.setValue(p.sync)
 
+    ## quit
+    #
+    # Stops the frame statistics thread.
+    #
+    @hdebug.debug
+    def quit(self):
+        self.statistics_thread.stopThread()
+        self.statistics_thread.wait()
+
     ## rangeChange
     #
     # Handles a change in the display range as specified using the range slider.
@@ -14,9 +14,31 @@
 # 2) The numpy data field (np_data) is expected to
 #    be of type numpy.uint16.
 #
+# 3) The hardware frame number and time stamp are the
+#    values reported by the camera driver (if any), they
+#    are None if the camera does not provide them. The
+#    receive time is the (host) monotonic time when the
+#    frame object was created.
+#
 # Hazen 10/13
 #
 
+import sys
+import time
+
+## monotonicTime
+#
+# time.clock() is a high resolution monotonic clock on windows (it
+# is the processor time on other platforms, so time.time() is used).
+#
+# @return The host monotonic time in seconds.
+#
+if (sys.platform == "win32"):
+    monotonicTime = time.clock
+else:
+    monotonicTime = time.time
+
+
 ## Frame
 #
 # Class for the storage of a single frame of camera data
@@ -35,13 +57,18 @@ class Frame():
     # @param image_y The size of the frame in pixels in y.
     # @param which_camera Which camera the frame came from ("camera1" or "camera2").
     # @param master True/False Is this frame from the "master" (as opposed to the "slave") camera.
+    # @param hw_number (Optional) The frame number reported by the camera driver.
+    # @param hw_timestamp (Optional) The time stamp (in seconds) reported by the camera driver.
     #
-    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, master):
+    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, master, hw_number = None, hw_timestamp = None):
+        self.hw_number = hw_number
+        self.hw_timestamp = hw_timestamp
         self.image_x = image_x
         self.image_y = image_y
         self.master = master
         self.np_data = np_data
         self.number = frame_number
+        self.receive_time = monotonicTime()
         self.which_camera = which_camera
 
     ## getData
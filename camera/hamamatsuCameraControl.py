@@ -15,7 +15,6 @@ import traceback
 # Debugging
 import sc_library.hdebug as hdebug
 
-import camera.frame as frame
 import camera.cameraControl as cameraControl
 import hamamatsu.hamamatsu_camera as hcam
 
@@ -23,7 +22,7 @@ import hamamatsu.hamamatsu_camera as hcam
 #
 # This class is used to control a Hamamatsu (sCMOS) camera.
 #
-class ACameraControl(cameraControl.CameraControl):
+class ACameraControl(cameraControl.EventCameraControl):
 
     ## __init__
     #
@@ -35,7 +34,7 @@ class ACameraControl(cameraControl.CameraControl):
     #
     @hdebug.debug
     def __init__(self, parameters, parent = None):
-        cameraControl.CameraControl.__init__(self, parameters, parent)
+        cameraControl.EventCameraControl.__init__(self, parameters, parent)
 
         self.stop_at_max = True
 
@@ -51,6 +50,7 @@ class ACameraControl(cameraControl.CameraControl):
     # Just stops the camera. The camera does not have a shutter.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def closeShutter(self):
         self.shutter = False
         self.stopCamera()
@@ -62,6 +62,7 @@ class ACameraControl(cameraControl.CameraControl):
     # @return A python array containing the inverse of the internal frame rate.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def getAcquisitionTimings(self):
         frame_rate = self.camera.getPropertyValue("internal_frame_rate")[0]
         temp = 1.0/frame_rate
@@ -86,9 +87,9 @@ class ACameraControl(cameraControl.CameraControl):
     # @param film_settings A film settings object or None.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def newFilmSettings(self, parameters, film_settings):
         self.stopCamera()
-        self.mutex.lock()
         p = parameters
         self.reached_max_frames = False
         if film_settings:
@@ -104,8 +105,6 @@ class ACameraControl(cameraControl.CameraControl):
             self.filming = False
             self.acq_mode = "run_till_abort"
 
-        self.mutex.unlock()
-
     ## newParameters
     #
     # Update the camera parameters based on a new parameters object.
@@ -113,6 +112,7 @@ class ACameraControl(cameraControl.CameraControl):
     # @param parameters A parameters object.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def newParameters(self, parameters):
         p = parameters
 
@@ -167,6 +167,7 @@ class ACameraControl(cameraControl.CameraControl):
     # Just stops the camera. The camera has no shutter.
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def openShutter(self):
         self.shutter = True
         self.stopCamera()
@@ -181,67 +182,6 @@ class ACameraControl(cameraControl.CameraControl):
         self.wait()
         self.camera.shutdown()
 
-    ## run
-    #
-    # The camera thread. This gets images from the camera, turns
-    # them into frames and sends them out using the newData signal.
-    # If the acquisition is being recorded it saves the frame
-    # to disc. It also signals when max frames has been reached 
-    # for a fixed length  acquisition.
-    #
-    def run(self):
-        while(self.running):
-            self.mutex.lock()
-            if self.acquire.amActive() and self.got_camera:
-
-                # Get data from camera and create frame objects.
-                [frames, frame_size] = self.camera.getFrames()
-
-                # Check if we got new frame data.
-                if (len(frames) > 0):
-
-                    # Create frame objects.
-                    frame_data = []
-                    for hc_data in frames:
-                        aframe = frame.Frame(hc_data.getData(),
-                                             self.frame_number,
-                                             frame_size[0],
-                                             frame_size[1],
-                                             "camera1",
-                                             True)
-                        frame_data.append(aframe)
-                        self.frame_number += 1
-
-                        if self.filming:
-                            if self.daxfile:
-                                if (self.acq_mode == "fixed_length"):
-                                    if (self.frame_number <= self.frames_to_take):
-                                        self.daxfile.saveFrame(aframe)
-                                else:
-                                    self.daxfile.saveFrame(aframe)
-            
-                            if (self.acq_mode == "fixed_length") and (self.frame_number == self.frames_to_take):
-                                self.reached_max_frames = True
-                                break
-                            
-                    # Emit new data signal.
-                    self.newData.emit(frame_data, self.key)
-
-                    # Emit max frames signal.
-                    #
-                    # The signal is emitted here because if it is emitted before
-                    # newData then you never see that last frame in the movie, which
-                    # is particularly problematic for single frame movies.
-                    #
-                    if self.reached_max_frames:
-                        self.max_frames_sig.emit()
-
-            else:
-                self.acquire.idle()
-
-            self.mutex.unlock()
-            self.msleep(5)
-
     ## startCamera
     #
     # Start the camera. The key parameter is for synchronizing the main
@@ -249,31 +189,41 @@ class ACameraControl(cameraControl.CameraControl):
     #
     # @param key The ID value to use for frames from the current acquisition.
     #
-    @hdebug.debug        
+    @hdebug.debug
+    @cameraControl.threadCommand
     def startCamera(self, key):
-        self.mutex.lock()
         self.acquire.go()
         self.key = key
         self.frame_number = 0
         self.max_frames_sig.reset()
         if self.got_camera:
             self.camera.startAcquisition()
-        self.mutex.unlock()
 
     ## stopCamera
     #
     # Stops the camera
     #
     @hdebug.debug
+    @cameraControl.threadCommand
     def stopCamera(self):
         if self.acquire.amActive():
-            self.mutex.lock()
             if self.got_camera:
                 self.camera.stopAcquisition()
             self.acquire.stop()
-            self.mutex.unlock()
-            while not self.acquire.amIdle():
-                self.usleep(50)
+
+    ## waitForFrames
+    #
+    # Wait for new frames with dcam_wait. The (old) DCAM API that is used
+    # here cannot cancel the wait from another thread, so the commands
+    # wait for at most the timeout.
+    #
+    # @param timeout The maximum time to wait in milliseconds.
+    #
+    # @return [frames, [frame x size, frame y size], camera frame numbers, None (no time stamps)]
+    #
+    def waitForFrames(self, timeout):
+        [frames, frame_size] = self.camera.getFrames(timeout)
+        return [map(lambda x: x.getData(), frames), frame_size, self.camera.frame_numbers, None]
 
 #
 # The MIT License
@@ -12,7 +12,12 @@ from PyQt4 import QtCore, QtGui
 
 import qtWidgets.qtCameraWidget as qtCameraWidget
 
-import hamamatsu.scmos_image_manipulation_c as scmos_im
+have_scmos_im = True
+try:
+    import hamamatsu.scmos_image_manipulation_c as scmos_im
+except:
+    print "failed to load hamamatsu.scmos_image_manipulation_c."
+    have_scmos_im = False
 
 ## ACameraWidget
 #
@@ -31,44 +36,25 @@ class ACameraWidget(qtCameraWidget.QCameraWidget):
     def __init__(self, parameters, parent = None):
         qtCameraWidget.QCameraWidget.__init__(self, parameters, parent)
 
-    ## updateImageWithFrame
+    ## rescaleImage
     #
-    # This updates the displayed image with a frame from the camera. This
-    # version uses a C helper library to try and make things faster and
-    # less memory intensive so that we can more easily keep up with the
-    # high data rate of a sCMOS camera.
+    # This version uses a C helper library (if it is available) to try and
+    # make things faster so that we can more easily keep up with the high
+    # data rate of a sCMOS camera. The C library does not handle
+    # re-orientation, so the lookup table of the base class is used if the
+    # image is flipped or transposed. The C library needs a C contiguous
+    # array, so if only part of the image is visible that part is copied.
     #
-    # FIXME: Ignores image orientation settings.
+    # @param image_data A numpy.uint16 array.
     #
-    # @param frame A frame object.
+    # @return A (C contiguous) numpy.uint8 array.
     #
-    def updateImageWithFrame(self, frame):
-        if frame:
-            w = frame.image_x
-            h = frame.image_y
-            image_data = frame.getData()
-            image_data = image_data.reshape((h,w))
-
-            # Use C library to scale image & also determine image min & max.
-            [temp, self.image_min, self.image_max] = scmos_im.rescaleImage(image_data,
-                                                                           self.display_range)
-
-            # Create QImage & draw at final magnification.
-            temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-            self.image = temp_image.scaled(self.x_final, self.y_final)
-            self.image.ndarray = temp
-
-            # Set the images color table.
-            self.setColorTable()
-            self.update()
-
-            if self.show_info:
-                x_loc = self.x_click
-                y_loc = self.y_click
-                value = 0
-                if ((x_loc >= 0) and (x_loc < w) and (y_loc >= 0) and (y_loc < h)):
-                    value = image_data[y_loc, x_loc]
-                    self.intensityInfo.emit(x_loc, y_loc, value)
+    def rescaleImage(self, image_data):
+        if have_scmos_im and not (self.flip_horizontal or self.flip_vertical or self.transpose):
+            image_data = numpy.ascontiguousarray(image_data)
+            return scmos_im.rescaleImage(image_data, self.display_range)[0]
+        else:
+            return qtCameraWidget.QCameraWidget.rescaleImage(self, image_data)
 
 #
 # The MIT License
@@ -1,21 +1,381 @@
 #!/usr/bin/python
 #
-# Softare camera emulator.
+## @file
+#
+# Software camera emulator.
+#
+# This generates STORM like movies of blinking emitters so that HAL
+# (display, spot counter, file writing, etc.) can be tested and
+# benchmarked without a real camera. To make sure that generating
+# the images is not the bottle-neck a bank of frames is created when
+# the camera parameters change and the frames are then played back
+# (in a loop) at the requested rate. Note that the frames in the bank
+# are re-used, as with the frame buffer of a real camera.
+#
+# The (optional) camera hardware parameters are:
+#
+#   simul_background   Background in photons per pixel, default 10.
+#   simul_bank_memory  The maximum size of the frame bank in MB, default 256.
+#   simul_bank_size    The number of frames in the bank, default 200.
+#   simul_baseline     The camera baseline, default 100.
+#   simul_drop_prob    The probability that a frame is dropped, default 0.
+#   simul_emitters     The number of emitters, default (pixels / 200).
+#   simul_off_prob     The probability that an emitter turns off, default 0.3.
+#   simul_on_prob      The probability that an emitter turns on, default 0.01.
+#   simul_photons      Average photons per emitter per frame, default 1000.
+#   simul_seed         The random number seed, default 1.
+#   simul_sigma        The PSF sigma in pixels, default 1.2.
+#   simul_stall_prob   The probability of a camera stall each time frames are checked, default 0.
+#   simul_stall_time   The length of a stall in seconds, default 0.1.
+#
+# The frame rate is 1/exposure_time, with a minimum exposure time of 0.1ms.
 #
 # Hazen 11/09
 #
 
+from PyQt4 import QtCore
+import numpy
+import time
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+import camera.frame as frame
 import camera.cameraControl as cameraControl
 
+## makeFrameBank
+#
+# Creates a bank of frames of blinking emitters with Poisson noise.
+#
+# @param x_size The frame size in x in pixels.
+# @param y_size The frame size in y in pixels.
+# @param n_frames The number of frames.
+# @param n_emitters The number of emitters.
+# @param photons The average number of photons per emitter per frame.
+# @param background The background in photons per pixel.
+# @param baseline The camera baseline.
+# @param sigma The PSF sigma in pixels.
+# @param on_prob The probability that an emitter that is off will turn on.
+# @param off_prob The probability that an emitter that is on will turn off.
+# @param seed The random number seed.
+#
+# @return A numpy.uint16 array of shape (n_frames, x_size * y_size).
+#
+def makeFrameBank(x_size, y_size, n_frames, n_emitters, photons, background, baseline, sigma, on_prob, off_prob, seed):
+    rand = numpy.random.RandomState(seed)
+    bank = numpy.zeros((n_frames, x_size * y_size), dtype = numpy.uint16)
+
+    # Emitter positions and initial state.
+    x = rand.uniform(0.0, x_size, n_emitters)
+    y = rand.uniform(0.0, y_size, n_emitters)
+    on = (rand.uniform(size = n_emitters) < (on_prob / (on_prob + off_prob)))
+
+    # The PSF is drawn in a (2r + 1) x (2r + 1) pixel box.
+    r = int(numpy.ceil(3.0 * sigma))
+    [dy, dx] = numpy.mgrid[-r:r+1,-r:r+1]
+    dx = dx.flatten()
+    dy = dy.flatten()
+    for i in range(n_frames):
+        image = numpy.zeros(x_size * y_size)
+        if (numpy.count_nonzero(on) > 0):
+            ex = x[on]
+            ey = y[on]
+            ix = ex.astype(int)[:,None] + dx[None,:]
+            iy = ey.astype(int)[:,None] + dy[None,:]
+            intensity = rand.exponential(photons, ex.size)[:,None]
+            weights = intensity * numpy.exp(-((ix + 0.5 - ex[:,None])**2 + (iy + 0.5 - ey[:,None])**2) / (2.0 * sigma * sigma))
+            weights = weights / (2.0 * numpy.pi * sigma * sigma)
+            mask = (ix >= 0) & (ix < x_size) & (iy >= 0) & (iy < y_size)
+            image += numpy.bincount((iy * x_size + ix)[mask],
+                                    weights = weights[mask],
+                                    minlength = x_size * y_size)
+        image = rand.poisson(image + background) + baseline
+        bank[i,:] = numpy.minimum(image, 65535)
+
+        # Blink.
+        u = rand.uniform(size = n_emitters)
+        on = numpy.where(on, u >= off_prob, u < on_prob)
+
+    return bank
+
+
+## ACameraControl
+#
+# Simulated camera control.
+#
 class ACameraControl(cameraControl.CameraControl):
-    def __init__(self, parameters, parent = None):
-        cameraControl.CameraControl.__init__(self, parameters, parent)
 
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parent = None):
+        cameraControl.CameraControl.__init__(self, hardware, parent)
+
+        self.bank = None
+        self.bank_index = 0
+        self.frame_time = 0.1
+        self.frames_dropped = 0
+        self.frames_emitted = 0
+        self.image_x = 0
+        self.image_y = 0
+        self.next_time = 0.0
+        self.stalls = 0
+
+        self.simul = {"background" : 10.0,
+                      "bank_memory" : 256,
+                      "bank_size" : 200,
+                      "baseline" : 100,
+                      "drop_prob" : 0.0,
+                      "emitters" : -1,
+                      "off_prob" : 0.3,
+                      "on_prob" : 0.01,
+                      "photons" : 1000.0,
+                      "seed" : 1,
+                      "sigma" : 1.2,
+                      "stall_prob" : 0.0,
+                      "stall_time" : 0.1}
+        for key in self.simul.keys():
+            if hasattr(hardware, "simul_" + key):
+                self.simul[key] = getattr(hardware, "simul_" + key)
+        self.rand = numpy.random.RandomState(self.simul["seed"])
+
+    ## getAcquisitionTimings
+    #
+    # @return A python array containing the time it takes to take a frame.
+    #
+    @hdebug.debug
+    def getAcquisitionTimings(self):
+        return [self.frame_time, self.frame_time, self.frame_time]
+
+    ## getStatistics
+    #
+    # @return A dictionary containing the number of frames emitted and dropped and the number of stalls.
+    #
+    def getStatistics(self):
+        self.mutex.lock()
+        stats = {"frames_dropped" : self.frames_dropped,
+                 "frames_emitted" : self.frames_emitted,
+                 "stalls" : self.stalls}
+        self.mutex.unlock()
+        return stats
+
+    ## initCamera
+    #
+    @hdebug.debug
     def initCamera(self):
         if not self.camera:
-            if self.debug:
-                print " Initializing Simulated Camera"
-        self.got_camera = 1
+            hdebug.logText(" Initializing Simulated Camera")
+            self.camera = True
+        self.got_camera = True
+
+    ## newFilmSettings
+    #
+    # Setup for new acquisition.
+    #
+    # @param parameters A parameters object.
+    # @param film_settings A film settings object or None.
+    #
+    @hdebug.debug
+    def newFilmSettings(self, parameters, film_settings):
+        self.stopCamera()
+        self.mutex.lock()
+        self.reached_max_frames = False
+        if film_settings:
+            self.filming = True
+            self.acq_mode = film_settings.acq_mode
+            self.frames_to_take = film_settings.frames_to_take
+        else:
+            self.filming = False
+            self.acq_mode = "run_till_abort"
+        self.mutex.unlock()
+
+    ## newParameters
+    #
+    # Creates a new bank of frames.
+    #
+    # @param parameters A parameters object.
+    #
+    @hdebug.debug
+    def newParameters(self, parameters):
+        self.initCamera()
+        self.stopCamera()
+        p = parameters
+        s = self.simul
+
+        n_frames = s["bank_size"]
+        max_frames = int(s["bank_memory"] * 1024 * 1024 / (2 * p.x_pixels * p.y_pixels))
+        n_frames = max(1, min(n_frames, max_frames))
+        n_emitters = s["emitters"]
+        if (n_emitters < 0):
+            n_emitters = (p.x_pixels * p.y_pixels)/200
+
+        start_time = time.time()
+        bank = makeFrameBank(p.x_pixels,
+                             p.y_pixels,
+                             n_frames,
+                             n_emitters,
+                             s["photons"],
+                             s["background"],
+                             s["baseline"],
+                             s["sigma"],
+                             s["on_prob"],
+                             s["off_prob"],
+                             s["seed"])
+        hdebug.logText(" Simulated camera, created " + str(n_frames) + " frames in " + str(time.time() - start_time) + " seconds")
+
+        self.mutex.lock()
+        self.bank = bank
+        self.bank_index = 0
+        self.frame_time = max(p.exposure_time, 0.0001)
+        self.image_x = p.x_pixels
+        self.image_y = p.y_pixels
+        self.mutex.unlock()
+
+        self.newFilmSettings(parameters, None)
+        self.parameters = parameters
+
+    ## run
+    #
+    # The camera thread. Frames are taken from the bank at the frame
+    # rate and sent out using the newData signal. If the acquisition
+    # is being recorded they are also saved. Stalls and dropped
+    # frames are simulated if requested.
+    #
+    def run(self):
+        while(self.running):
+            self.mutex.lock()
+            if self.acquire.amActive() and self.got_camera and (self.bank is not None):
+
+                # Simulate a stall, the frames are still acquired by the camera.
+                if (self.simul["stall_prob"] > 0.0) and (self.rand.uniform() < self.simul["stall_prob"]):
+                    self.stalls += 1
+                    self.mutex.unlock()
+                    time.sleep(self.simul["stall_time"])
+                    self.mutex.lock()
+
+                # Number of frames the camera would have acquired since the last time.
+                current_time = time.time()
+                if (current_time >= self.next_time):
+                    n_frames = int((current_time - self.next_time)/self.frame_time) + 1
+                    self.next_time += n_frames * self.frame_time
+
+                    frame_data = []
+                    for i in range(n_frames):
+                        np_data = self.bank[self.bank_index]
+                        self.bank_index = (self.bank_index + 1) % self.bank.shape[0]
+
+                        if (self.simul["drop_prob"] > 0.0) and (self.rand.uniform() < self.simul["drop_prob"]):
+                            self.frames_dropped += 1
+                            self.frame_number += 1
+                        else:
+                            aframe = frame.Frame(np_data,
+                                                 self.frame_number,
+                                                 self.image_x,
+                                                 self.image_y,
+                                                 "camera1",
+                                                 True)
+                            frame_data.append(aframe)
+                            self.frame_number += 1
+
+                            if self.filming and self.daxfile:
+                                if (self.acq_mode == "fixed_length"):
+                                    if (self.frame_number <= self.frames_to_take):
+                                        self.daxfile.saveFrame(aframe)
+                                else:
+                                    self.daxfile.saveFrame(aframe)
+
+                        # Dropped frames also count towards the length of the film.
+                        if self.filming and (self.acq_mode == "fixed_length") and (self.frame_number >= self.frames_to_take):
+                            self.reached_max_frames = True
+                            break
+
+                    self.frames_emitted += len(frame_data)
+                    if (len(frame_data) > 0):
+                        self.newData.emit(frame_data, self.key)
+
+                    if self.reached_max_frames:
+                        self.max_frames_sig.emit()
+
+                sleep_time = self.next_time - time.time()
+                self.mutex.unlock()
+                if (sleep_time > 0.0):
+                    time.sleep(min(sleep_time, 0.005))
+
+            else:
+                self.acquire.idle()
+                self.mutex.unlock()
+                self.msleep(5)
+
+    ## startCamera
+    #
+    # @param key The ID value to use for frames from the current acquisition.
+    #
+    @hdebug.debug
+    def startCamera(self, key):
+        self.mutex.lock()
+        self.acquire.go()
+        self.key = key
+        self.frame_number = 0
+        self.frames_dropped = 0
+        self.frames_emitted = 0
+        self.max_frames_sig.reset()
+        self.next_time = time.time() + self.frame_time
+        self.stalls = 0
+        self.mutex.unlock()
+
+    ## stopCamera
+    #
+    # Stops the camera.
+    #
+    @hdebug.debug
+    def stopCamera(self):
+        if self.acquire.amActive():
+            self.mutex.lock()
+            self.acquire.stop()
+            self.mutex.unlock()
+            while not self.acquire.amIdle():
+                self.usleep(50)
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    start = time.time()
+    bank = makeFrameBank(256, 256, 100, 300, 1000.0, 10.0, 100, 1.2, 0.01, 0.3, 1)
+    print "Time to create a frame: ", ((time.time() - start)/100.0), " seconds"
+    print "Mean, max: ", numpy.mean(bank), numpy.max(bank)
+
+    # A short fixed length film must end even if most of the frames are dropped.
+    import camera.filmSettings as filmSettings
+
+    class Hardware():
+        simul_drop_prob = 0.95
+
+    class Parameters():
+        exposure_time = 0.001
+        x_pixels = 64
+        y_pixels = 64
+
+    a_camera = ACameraControl(Hardware())
+    a_camera.newParameters(Parameters())
+    a_camera.startFilm(False, filmSettings.FilmSettings("fixed_length", 10))
+    a_camera.cameraInit()
+    a_camera.startCamera(0)
+    start = time.time()
+    while not a_camera.reached_max_frames and ((time.time() - start) < 5.0):
+        time.sleep(0.01)
+    a_camera.stopCamera()
+    a_camera.stopThread()
+    a_camera.wait()
+    print "Frames dropped: ", a_camera.getStatistics()["frames_dropped"], "of", a_camera.frame_number
+    assert a_camera.reached_max_frames and (a_camera.frame_number >= 10)
+
 
 #
 # The MIT License
@@ -40,4 +400,3 @@ class ACameraControl(cameraControl.CameraControl):
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 #
-
@@ -76,6 +76,7 @@ class SingleCamera(genericCamera.Camera):
     @hdebug.debug
     def closeEvent(self, event):
         self.camera_control.quit()
+        self.camera_display.quit()
 
     ## getCameraDisplay
     #
@@ -108,6 +109,7 @@ class SingleCamera(genericCamera.Camera):
     def getSignals(self):
         return [["camera", "cameraDisplayCaptured", self.camera_display.cameraDisplayCaptured],
                 ["camera", "cameraROISelection", self.camera_display.cameraROISelection],
+                ["camera", "frameStatistics", self.camera_display.cameraFrameStatistics],
                 ["camera", "dragStart", self.camera_display.cameraDragStart],
                 ["camera", "dragMove", self.camera_display.cameraDragMove]]
 
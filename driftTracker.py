@@ -0,0 +1,478 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Tracks (and optionally corrects) the lateral (x, y) drift of the
+# sample during a film.
+#
+# The central region (ROI) of the frames from the camera is summed in
+# blocks of frames. The sums of the single molecule frames look like
+# (noisy) wide field images of the sample. The sum of the first block
+# of the film is the reference, the shift of each of the following
+# blocks relative to the reference is measured with FFT phase
+# correlation (see halLib/phaseCorrelation.py) in a separate thread.
+# Only the sums are calculated when the frames arrive, so this takes
+# very little time even at high frame rates.
+#
+# The drift is saved with the other per-frame meta-data of the film
+# (see halLib/frameMetadata.py) at the last frame of each block, and is
+# also exported as the film_name.drift text file. The drift is in nm
+# in the orientation of the camera display.
+#
+# If correction is enabled a (fraction of the) drift is corrected by
+# moving the stage with the stepMove signal (this is handled by the
+# stage control, which moves the stage with goRelative()). This
+# assumes that the stage orientation parameters are set so that
+# dragging the camera display moves the sample with the mouse. The
+# correction is recorded separately, the drift in the .drift file is
+# the drift of the sample (i.e. without the correction).
+#
+# Hardware XML parameters (all optional):
+#
+#   block_frames - The number of frames in a block, default is 100.
+#   camera - The camera to use, default is "camera1".
+#   decimation - The binning of the ROI for the phase correlation, default is 2.
+#   gain - The fraction of the drift that is corrected after each block, default is 0.5.
+#   min_correction - The smallest correction in nm, default is 10.0.
+#   min_quality - The minimum quality of a drift estimate for correction, default is 10.0.
+#   roi_size - The size of the ROI in (binned) camera pixels, default is 256.
+#
+# The tracker is enabled by adding it to the modules of the hardware
+# XML file (see the drifttracker module in sequoia_hardware.xml). It
+# needs a stage control module to correct the drift.
+#
+# Hazen 10/14
+#
+
+import numpy
+
+from PyQt4 import QtCore, QtGui
+
+import halLib.frameMetadata as frameMetadata
+import halLib.halModule as halModule
+import halLib.phaseCorrelation as phaseCorrelation
+import qtWidgets.qtAppIcon as qtAppIcon
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+
+## DriftGraph
+#
+# Displays the drift in x and y during the film.
+#
+class DriftGraph(QtGui.QWidget):
+
+    ## __init__
+    #
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parent = None):
+        QtGui.QWidget.__init__(self, parent)
+        self.trace = []
+        self.setMinimumSize(300, 150)
+
+    ## addPoint
+    #
+    # @param x The drift in x in nm.
+    # @param y The drift in y in nm.
+    #
+    def addPoint(self, x, y):
+        self.trace.append([x, y])
+        self.update()
+
+    ## clear
+    #
+    def clear(self):
+        self.trace = []
+        self.update()
+
+    ## paintEvent
+    #
+    # @param event A PyQt paint event.
+    #
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor(255, 255, 255))
+
+        # The range is at least +- 50 nm.
+        y_range = 50.0
+        if (len(self.trace) > 0):
+            y_range = max(y_range, numpy.max(numpy.abs(numpy.array(self.trace))))
+        width = self.width()
+        height = self.height()
+        y_scale = 0.45 * height/y_range
+        x_scale = float(width)/max(len(self.trace) - 1, 1)
+
+        painter.setPen(QtGui.QColor(200, 200, 200))
+        painter.drawLine(0, height/2, width, height/2)
+        painter.setPen(QtGui.QColor(0, 0, 0))
+        painter.drawText(5, 15, "+/- {0:.0f} nm".format(y_range))
+
+        for [i, color] in [[0, QtGui.QColor(255, 0, 0)], [1, QtGui.QColor(0, 0, 255)]]:
+            painter.setPen(color)
+            points = map(lambda j: QtCore.QPointF(j * x_scale, 0.5 * height - self.trace[j][i] * y_scale), range(len(self.trace)))
+            if (len(points) > 1):
+                painter.drawPolyline(QtGui.QPolygonF(points))
+
+
+## DriftTrackerThread
+#
+# Measures the shift of the blocks relative to the reference. The blocks
+# are only added in the main thread, the thread does the phase correlation.
+# The blocks are tagged with the id of the film they belong to so that
+# estimates from a previous film that are still in flight when the next
+# film starts can be recognized (and ignored).
+#
+class DriftTrackerThread(QtCore.QThread):
+    driftEstimate = QtCore.pyqtSignal(int, int, float, float, float)
+
+    ## __init__
+    #
+    # @param decimation The binning of the blocks for the phase correlation.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, decimation, parent = None):
+        QtCore.QThread.__init__(self, parent)
+
+        self.blocks = []
+        self.correlator = None
+        self.correlator_film_id = None
+        self.decimation = decimation
+        self.mutex = QtCore.QMutex()
+        self.running = True
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## addBlock
+    #
+    # @param film_id The id of the film the block belongs to.
+    # @param frame_number The number of the last frame of the block.
+    # @param block The sum of the frames of the block.
+    # @param reference True/False this block is the (new) reference.
+    #
+    def addBlock(self, film_id, frame_number, block, reference):
+        self.mutex.lock()
+        self.blocks.append([film_id, frame_number, block, reference])
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## run
+    #
+    # The thread loop, emits a driftEstimate signal for every block
+    # of the film of the current reference.
+    #
+    def run(self):
+        while True:
+            self.mutex.lock()
+            if self.running and (len(self.blocks) == 0):
+                self.wait_condition.wait(self.mutex)
+            blocks = self.blocks
+            self.blocks = []
+            running = self.running
+            self.mutex.unlock()
+
+            if not running:
+                break
+
+            for [film_id, frame_number, block, reference] in blocks:
+                if reference:
+                    self.correlator = phaseCorrelation.PhaseCorrelator(block, self.decimation)
+                    self.correlator_film_id = film_id
+                    self.driftEstimate.emit(film_id, frame_number, 0.0, 0.0, 0.0)
+                elif (film_id != self.correlator_film_id):
+                    continue
+                else:
+                    [dx, dy, quality] = self.correlator.getShift(block)
+                    self.driftEstimate.emit(film_id, frame_number, dx, dy, quality)
+
+    ## reset
+    #
+    # Discards the blocks that have not been processed yet.
+    #
+    def reset(self):
+        self.mutex.lock()
+        self.blocks = []
+        self.mutex.unlock()
+
+    ## stopThread
+    #
+    # Tells the thread loop to stop running.
+    #
+    def stopThread(self):
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+
+## DriftTracker
+#
+# Drift tracker dialog box.
+#
+class DriftTracker(QtGui.QDialog, halModule.HalModule):
+    stepMove = QtCore.pyqtSignal(float, float)
+
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parameters A parameters object.
+    # @param parent The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parameters, parent):
+        QtGui.QDialog.__init__(self, parent)
+        halModule.HalModule.__init__(self)
+
+        self.block = None
+        self.block_count = 0
+        self.block_frames = 100
+        self.camera = "camera1"
+        self.camera_params = None
+        self.correction = [0.0, 0.0]
+        self.decimation = 2
+        self.film_id = 0
+        self.gain = 0.5
+        self.min_correction = 10.0
+        self.min_quality = 10.0
+        self.parameters = None
+        self.recorder = frameMetadata.getRecorder()
+        self.reference = True
+        self.roi_size = 256
+        self.tracking = False
+
+        if hardware:
+            if hasattr(hardware, "block_frames"):
+                self.block_frames = hardware.block_frames
+            if hasattr(hardware, "camera"):
+                self.camera = hardware.camera
+            if hasattr(hardware, "decimation"):
+                self.decimation = hardware.decimation
+            if hasattr(hardware, "gain"):
+                self.gain = hardware.gain
+            if hasattr(hardware, "min_correction"):
+                self.min_correction = hardware.min_correction
+            if hasattr(hardware, "min_quality"):
+                self.min_quality = hardware.min_quality
+            if hasattr(hardware, "roi_size"):
+                self.roi_size = hardware.roi_size
+
+        self.tracker_thread = DriftTrackerThread(self.decimation)
+        self.tracker_thread.driftEstimate.connect(self.handleDriftEstimate)
+        self.tracker_thread.start(QtCore.QThread.LowPriority)
+
+        # UI setup
+        self.setWindowTitle(parameters.setup_name + " Drift Tracker")
+        self.setWindowIcon(qtAppIcon.QAppIcon())
+
+        self.graph = DriftGraph(self)
+        self.status_label = QtGui.QLabel("x 0.0 nm, y 0.0 nm", self)
+        self.track_check_box = QtGui.QCheckBox("Track", self)
+        self.track_check_box.setChecked(True)
+        self.correct_check_box = QtGui.QCheckBox("Correct", self)
+        self.ok_button = QtGui.QPushButton("Close", self)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addWidget(self.track_check_box)
+        button_layout.addWidget(self.correct_check_box)
+        button_layout.addStretch(1)
+        button_layout.addWidget(self.ok_button)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self.graph, 1)
+        layout.addWidget(self.status_label)
+        layout.addLayout(button_layout)
+
+        self.ok_button.clicked.connect(self.handleOk)
+
+        self.setModal(False)
+
+    ## cleanup
+    #
+    @hdebug.debug
+    def cleanup(self):
+        self.tracker_thread.stopThread()
+        self.tracker_thread.wait()
+
+    ## getFramePixelSize
+    #
+    # @return The size of the (binned) camera pixels in nm.
+    #
+    def getFramePixelSize(self):
+        nm_per_pixel = 1000.0
+        if hasattr(self.parameters, "nm_per_pixel"):
+            nm_per_pixel = self.parameters.nm_per_pixel
+        x_bin = 1
+        if hasattr(self.camera_params, "x_bin"):
+            x_bin = self.camera_params.x_bin
+        return nm_per_pixel * x_bin
+
+    ## getSignals
+    #
+    # @return The signals this module provides.
+    #
+    @hdebug.debug
+    def getSignals(self):
+        return [[self.hal_type, "stepMove", self.stepMove]]
+
+    ## handleDriftEstimate
+    #
+    # Records the drift and corrects it (if requested). Estimates
+    # from a previous film are ignored.
+    #
+    # @param film_id The id of the film the estimate belongs to.
+    # @param frame_number The number of the last frame of the block.
+    # @param dx The shift of the block in x in camera pixels.
+    # @param dy The shift of the block in y in camera pixels.
+    # @param quality The quality of the estimate.
+    #
+    def handleDriftEstimate(self, film_id, frame_number, dx, dy, quality):
+        if (not self.tracking) or (film_id != self.film_id):
+            return
+
+        # The shift of the sample in the display (including the correction).
+        [sx, sy] = self.orientShift(dx, dy)
+        nm_per_pixel = self.getFramePixelSize()
+        sx *= nm_per_pixel
+        sy *= nm_per_pixel
+
+        drift = [sx - self.correction[0], sy - self.correction[1]]
+        self.recorder.setValue(frame_number, "drift", drift + self.correction + [quality])
+        self.graph.addPoint(drift[0], drift[1])
+        self.status_label.setText("x {0:.1f} nm, y {1:.1f} nm, quality {2:.1f}".format(drift[0], drift[1], quality))
+
+        if self.correct_check_box.isChecked() and (quality >= self.min_quality):
+            step = [-self.gain * sx, -self.gain * sy]
+            if (max(abs(step[0]), abs(step[1])) >= self.min_correction):
+                self.correction = [self.correction[0] + step[0], self.correction[1] + step[1]]
+                self.stepMove.emit(0.001 * step[0], 0.001 * step[1])
+
+    ## handleOk
+    #
+    # Hide the window.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleOk(self, boolean):
+        self.hide()
+
+    ## newFrame
+    #
+    # Adds the ROI of the frame to the current block, the block
+    # is passed to the thread when it has block_frames frames.
+    #
+    # @param frame A frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrame(self, frame, filming):
+        if self.tracking and filming and (frame.which_camera == self.camera):
+            size_x = min(self.roi_size, frame.image_x)
+            size_y = min(self.roi_size, frame.image_y)
+            x_start = (frame.image_x - size_x)/2
+            y_start = (frame.image_y - size_y)/2
+            roi = frame.getData().reshape((frame.image_y, frame.image_x))[y_start:y_start+size_y, x_start:x_start+size_x]
+
+            if self.block is None:
+                self.block = numpy.zeros(roi.shape, dtype = numpy.float32)
+            numpy.add(self.block, roi, self.block)
+            self.block_count += 1
+
+            if (self.block_count == self.block_frames):
+                self.tracker_thread.addBlock(self.film_id, frame.number, self.block, self.reference)
+                self.block = None
+                self.block_count = 0
+                self.reference = False
+
+    ## newParameters
+    #
+    # @param parameters A parameters object.
+    #
+    @hdebug.debug
+    def newParameters(self, parameters):
+        self.parameters = parameters
+        self.camera_params = parameters
+        if hasattr(parameters, self.camera):
+            self.camera_params = getattr(parameters, self.camera)
+
+    ## orientShift
+    #
+    # Converts a shift in the camera frame to the orientation of the
+    # camera display (the frames are flipped and then transposed).
+    #
+    # @param dx The shift in x.
+    # @param dy The shift in y.
+    #
+    # @return [dx, dy] in the orientation of the camera display.
+    #
+    def orientShift(self, dx, dy):
+        if self.camera_params.flip_horizontal:
+            dx = -dx
+        if self.camera_params.flip_vertical:
+            dy = -dy
+        if self.camera_params.transpose:
+            [dx, dy] = [dy, dx]
+        return [dx, dy]
+
+    ## startFilm
+    #
+    # The first block of the film is the reference. Any blocks of the
+    # previous film that the thread has not processed yet are discarded.
+    #
+    # @param film_name The name of the film without any extensions, or False if the film is not being saved.
+    # @param run_shutters True/False the shutters should be run or not.
+    #
+    @hdebug.debug
+    def startFilm(self, film_name, run_shutters):
+        self.block = None
+        self.block_count = 0
+        self.correction = [0.0, 0.0]
+        self.film_id += 1
+        self.reference = True
+        self.tracker_thread.reset()
+        self.tracking = self.track_check_box.isChecked()
+        if self.tracking:
+            self.graph.clear()
+            self.recorder.addField("drift", "float64", 5)
+            self.recorder.addTextExport(".drift",
+                                        "frame x y correction_x correction_y quality",
+                                        ["drift"],
+                                        ["%d", "%.2f", "%.2f", "%.2f", "%.2f", "%.2f"])
+
+    ## stopFilm
+    #
+    # The frames of the last (incomplete) block are not used.
+    #
+    # @param film_writer The film writer object, or False if the film was not saved.
+    #
+    @hdebug.debug
+    def stopFilm(self, film_writer):
+        self.tracking = False
+        self.block = None
+        self.block_count = 0
+        if (max(abs(self.correction[0]), abs(self.correction[1])) > 0.0):
+            hdebug.logText("drift tracker: total correction x {0:.1f} nm, y {1:.1f} nm".format(self.correction[0], self.correction[1]))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
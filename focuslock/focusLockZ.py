@@ -23,6 +23,7 @@ from PyQt4 import QtCore, QtGui
 
 import qtWidgets.qtAppIcon as qtAppIcon
 
+import halLib.frameMetadata as frameMetadata
 import halLib.halModule as halModule
 
 # Debugging
@@ -56,8 +57,9 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
             self.have_parent = False
 
         # general
-        self.offset_file = 0
+        self.offset_file = False
         self.parameters = parameters
+        self.recorder = frameMetadata.getRecorder()
         self.jumpsize = 0.0
 
     ## cleanup
@@ -83,13 +85,12 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
 
     ## closeOffsetFile
     #
-    # Closes the offset file. This is called at the end of filming.
+    # Stops recording the offset data. This is called at the end of filming,
+    # the offset file is written by the frame meta-data recorder.
     #
     @hdebug.debug
     def closeOffsetFile(self):
-        if self.offset_file:
-            self.offset_file.close()
-            self.offset_file = False
+        self.offset_file = False
 
     ## configureUI
     #
@@ -150,6 +151,9 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
             if (signal[1] == "lockJump"):
                 signal[2].connect(self.jump)
 
+            if (signal[1] == "stagePosition"):
+                signal[2].connect(self.handleStagePosition)
+
     ## getLockTarget
     #
     # @return The current lock target.
@@ -187,7 +191,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
             self.tcpHandleOptimizeSum()
 
         elif (m_type == "recenterPiezo"):
-            self.tcpHandleRecenterPiezo
+            self.tcpHandleRecenterPiezo()
 
         elif (m_type == "setLockTarget"):
             self.tcpHandleSetLockTarget(m_data[0])
@@ -285,6 +289,17 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
     def handleRecenteredPiezo(self):
         self.tcpComplete.emit("NA")
 
+    ## handleStagePosition
+    #
+    # Handles stage position updates from the stage control module.
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    # @param stage_z The stage position in z in microns.
+    #
+    def handleStagePosition(self, stage_x, stage_y, stage_z):
+        self.lock_display1.handleStagePosition(stage_x, stage_y, stage_z)
+
     ## handleQuit
     #
     # Handles the quit button.
@@ -306,7 +321,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
     ## newFrame
     #
     # Handles a new frame of data from the camera. If we are filming
-    # this writes the current offset information into the offset file.
+    # this adds the current offset information to the frame meta-data.
     #
     # @param frame A frame object.
     # @param filming True/False if we are currently filming.
@@ -314,8 +329,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
     def newFrame(self, frame, filming):
         if filming and frame.master:
             if self.offset_file:
-                [offset, power, stage_z] = self.lock_display1.getOffsetPowerStage()
-                self.offset_file.write("{0:d} {1:.6f} {2:.6f} {3:.6f}\n".format(frame.number, offset, power, stage_z))
+                self.recorder.setValue(frame.number, "focus_lock", self.lock_display1.getOffsetPowerStage())
             self.lock_display1.newFrame(frame)
 
     ## newParameters
@@ -331,14 +345,19 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
 
     ## openOffsetFile
     #
-    # Open a file to save the offset data in during filming.
+    # Record the offset data during filming. This is saved with the
+    # frame meta-data and in the .off file.
     #
-    # @param filename The name of the offset file.
+    # @param filename The name of the film.
     #
     @hdebug.debug
     def openOffsetFile(self, filename):
-        self.offset_file = open(filename + ".off", "w")
-        self.offset_file.write("frame offset power stage-z\n")
+        self.offset_file = True
+        self.recorder.addField("focus_lock", "float64", 3)
+        self.recorder.addTextExport(".off",
+                                    "frame offset power stage-z",
+                                    ["focus_lock"],
+                                    ["%d", "%.6f", "%.6f", "%.6f"])
 
     ## startFilm
     #
@@ -622,6 +641,18 @@ class FocusLockZDualCam(FocusLockZ):
                     self.toggleLockButtonText(self.lock_display1.amLocked())
                     self.toggleLockLabelDisplay(self.lock_display1.shouldDisplayLockLabel())
 
+    ## handleStagePosition
+    #
+    # Handles stage position updates from the stage control module.
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    # @param stage_z The stage position in z in microns.
+    #
+    def handleStagePosition(self, stage_x, stage_y, stage_z):
+        self.lock_display1.handleStagePosition(stage_x, stage_y, stage_z)
+        self.lock_display2.handleStagePosition(stage_x, stage_y, stage_z)
+
     ## jump
     #
     # This handles jump requests (usually from the joystick). It jumps both stages at
@@ -634,8 +665,8 @@ class FocusLockZDualCam(FocusLockZ):
 
     ## newFrame
     #
-    # Handles new frames from the camera. If we are filming it saves the current
-    # offset data from both cameras into a file.
+    # Handles new frames from the camera. If we are filming it adds the current
+    # offset data from both cameras to the frame meta-data.
     #
     # @param frame A frame object.
     # @param filming True/False if we are currently filming.
@@ -643,22 +674,26 @@ class FocusLockZDualCam(FocusLockZ):
     def newFrame(self, frame, filming):
         if frame.master:
             if self.offset_file:
-                [offset1, power1, stage_z1] = self.lock_display1.getOffsetPowerStage()
-                [offset2, power2, stage_z2] = self.lock_display2.getOffsetPowerStage()
-                self.offset_file.write("{0:d} {1:.6f} {2:.6f} {3:.6f} {4:.6f} {5:.6f} {6:.6f}\n".format(frame.number, offset1, power1, stage_z1, offset2, power2, stage_z2))
+                self.recorder.setValue(frame.number,
+                                       "focus_lock",
+                                       self.lock_display1.getOffsetPowerStage() + self.lock_display2.getOffsetPowerStage())
             self.lock_display1.newFrame(frame)
             self.lock_display2.newFrame(frame)
 
     ## openOffsetFile
     #
-    # Open a file to save the offset data in during filming.
+    # Record the offset data from both cameras during filming.
     #
-    # @param filename The name of the offset file.
+    # @param filename The name of the film.
     #
     @hdebug.debug
     def openOffsetFile(self, filename):
-        self.offset_file = open(filename + ".off", "w")
-        self.offset_file.write("frame offset1 power1 stage-z1 offset2 power2 stage-z2\n")
+        self.offset_file = True
+        self.recorder.addField("focus_lock", "float64", 6)
+        self.recorder.addTextExport(".off",
+                                    "frame offset1 power1 stage-z1 offset2 power2 stage-z2",
+                                    ["focus_lock"],
+                                    ["%d"] + 6 * ["%.6f"])
 
     ## startFilm
     #
@@ -671,7 +706,7 @@ class FocusLockZDualCam(FocusLockZ):
     #        
     @hdebug.debug
     def startFilm(self, filename, run_shutters):
-        FocusLockZ.startFilm(self, filename, tcp_requested)
+        FocusLockZ.startFilm(self, filename, run_shutters)
         self.lock_display2.startLock(False)
 
     ## stopFilm
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Adaptive search for the best focus, used by the optimal lock mode.
+#
+# Rather than scanning the whole bracket and then fitting the
+# result, the piezo offset is chosen using a golden section search.
+# The search stops as soon as the interval containing the maximum
+# is smaller than the tolerance (usually the scan step size). The
+# final lock target is then found by parabolic interpolation of
+# the focus quality as a function of the lock offset.
+#
+
+import math
+import numpy
+
+golden_ratio = 0.5 * (math.sqrt(5.0) - 1.0)
+
+## FocusOptimizer
+#
+# Golden section search for the z position (relative to the starting
+# position of the piezo) with the highest focus quality.
+#
+class FocusOptimizer(object):
+
+    ## __init__
+    #
+    # @param z_min The lower end of the search range in um.
+    # @param z_max The upper end of the search range in um.
+    # @param tolerance Stop when the search range is smaller than this (in um).
+    #
+    def __init__(self, z_min, z_max, tolerance):
+        self.a = z_min
+        self.b = z_max
+        self.f1 = None
+        self.f2 = None
+        self.measurements = []
+        self.tolerance = tolerance
+        self.x1 = self.b - golden_ratio * (self.b - self.a)
+        self.x2 = self.a + golden_ratio * (self.b - self.a)
+        self.z_max = z_max
+        self.z_min = z_min
+
+    ## addMeasurement
+    #
+    # Add the focus quality measured at the z position last returned
+    # by nextZ() and update the search interval.
+    #
+    # @param z The z position of the measurement.
+    # @param offset The (average) lock offset at this z position.
+    # @param quality The (average) focus quality at this z position.
+    #
+    def addMeasurement(self, z, offset, quality):
+        self.measurements.append([z, offset, quality])
+        if (self.f1 == None):
+            self.f1 = quality
+        else:
+            self.f2 = quality
+
+        if (self.f1 != None) and (self.f2 != None):
+            if (self.f1 > self.f2):
+                self.b = self.x2
+                self.x2 = self.x1
+                self.f2 = self.f1
+                self.x1 = self.b - golden_ratio * (self.b - self.a)
+                self.f1 = None
+            else:
+                self.a = self.x1
+                self.x1 = self.x2
+                self.f1 = self.f2
+                self.x2 = self.a + golden_ratio * (self.b - self.a)
+                self.f2 = None
+
+    ## atEdge
+    #
+    # @return True if the best measurement is at one of the ends of the
+    #    search range, i.e. the maximum is probably outside of the range.
+    #
+    def atEdge(self):
+        if (len(self.measurements) == 0):
+            return False
+        best_z = self.getBest()[0]
+        return ((best_z - self.z_min) < self.tolerance) or ((self.z_max - best_z) < self.tolerance)
+
+    ## getBest
+    #
+    # @return [z, offset, quality] of the best measurement so far.
+    #
+    def getBest(self):
+        best = self.measurements[0]
+        for measurement in self.measurements:
+            if (measurement[2] > best[2]):
+                best = measurement
+        return best
+
+    ## getOptimum
+    #
+    # Fits a parabola to the best measurement and its nearest neighbors
+    # (in z) to find the lock offset with the highest focus quality. If
+    # the fit does not have a maximum then the offset of the best
+    # measurement is returned.
+    #
+    # @return The optimal lock offset.
+    #
+    def getOptimum(self):
+        best = self.getBest()
+        if (len(self.measurements) < 3):
+            return best[1]
+
+        data = numpy.array(sorted(self.measurements, key = lambda m: abs(m[0] - best[0]))[:3])
+        offsets = data[:,1]
+        if ((numpy.max(offsets) - numpy.min(offsets)) <= 0.0):
+            return best[1]
+
+        [p2, p1, p0] = numpy.polyfit(offsets, data[:,2], 2)
+        if (p2 >= 0.0):
+            return best[1]
+        optimum = -p1/(2.0 * p2)
+        return min(max(optimum, numpy.min(offsets)), numpy.max(offsets))
+
+    ## isDone
+    #
+    # @return True if the search interval is smaller than the tolerance.
+    #
+    def isDone(self):
+        return ((self.b - self.a) < self.tolerance)
+
+    ## nextZ
+    #
+    # @return The next z position at which the focus quality should be measured.
+    #
+    def nextZ(self):
+        if (self.f1 == None):
+            return self.x1
+        else:
+            return self.x2
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    # Gaussian focus quality centered at z = 0.23, offset = 2 * z.
+    quality = lambda z: 1.0 + 5.0 * math.exp(-9.0 * (z - 0.23) * (z - 0.23))
+
+    optimizer = FocusOptimizer(-1.0, 1.0, 0.1)
+    while not optimizer.isDone():
+        z = optimizer.nextZ()
+        optimizer.addMeasurement(z, 2.0 * z, quality(z))
+    print "Measurements:", len(optimizer.measurements)
+    print "Optimal offset:", optimizer.getOptimum(), "(expected 0.46)"
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -8,10 +8,14 @@
 #
 
 from ctypes import *
+import numpy
 import os
 
 focus_quality = False
 
+## Decimation factor (in rows) used by the numpy fallback.
+decimation = 4
+
 ## loadFocusQuality
 #
 # Loads the focus quality DLL, if it has not already been loaded.
@@ -24,18 +28,52 @@ def loadFocusQualityDLL():
         else:
             focus_quality = cdll.LoadLibrary("focuslock/focus_quality")
 
-loadFocusQualityDLL()
-c_imageGradient = focus_quality.imageGradient
-c_imageGradient.restype = c_float
+c_imageGradient = False
+try:
+    loadFocusQualityDLL()
+    c_imageGradient = focus_quality.imageGradient
+    c_imageGradient.restype = c_float
+except:
+    print "failed to load focus_quality DLL, using numpy."
 
 ## imageGradient
 #
 # Returns the magnitude of the image gradient in the x direction.
 #
+# @param frame A frame object.
+#
+# @return The normalized gradient magnitude.
+#
 def imageGradient(frame):
-    return c_imageGradient(frame.getDataPtr(),
-                           c_int(frame.image_x),
-                           c_int(frame.image_y))
+    if c_imageGradient:
+        return c_imageGradient(frame.getDataPtr(),
+                               c_int(frame.image_x),
+                               c_int(frame.image_y))
+    else:
+        return numpyImageGradient(frame)
+
+## numpyImageGradient
+#
+# Same as the C imageGradient, but calculated with numpy on every
+# decimation'th row of the frame. The metric only uses differences
+# along the rows so skipping rows does not change what is measured,
+# it just makes the calculation proportionally faster.
+#
+# @param frame A frame object.
+# @param step (Optional) The row decimation factor, defaults to decimation.
+#
+# @return The normalized gradient magnitude.
+#
+def numpyImageGradient(frame, step = None):
+    if step is None:
+        step = decimation
+    image = frame.getData().reshape(frame.image_y, frame.image_x)
+    rows = image[::step,:].astype(numpy.int32)
+    total = numpy.sum(rows[:,:-1])
+    if (total == 0):
+        return 0.0
+    diff = numpy.sum(numpy.abs(numpy.diff(rows, axis = 1)))
+    return float(diff)/float(total)
 
 
 #
@@ -45,7 +83,6 @@ def imageGradient(frame):
 if __name__ == "__main__":
 
     import camera.frame as frame
-    import numpy
     import time
 
     image_x = 512
@@ -64,6 +101,12 @@ if __name__ == "__main__":
     end = time.time()
     print "Time to process an image: ", ((end - start)/repeats), " seconds"
 
+    start = time.time()
+    for i in range(repeats):
+        numpyImageGradient(aframe)
+    end = time.time()
+    print "Time to process an image (numpy): ", ((end - start)/repeats), " seconds"
+
 #
 # The MIT License
 #
@@ -249,6 +249,18 @@ class LockDisplay(QtGui.QWidget):
     def handleRecenteredPiezo(self):
         self.recenteredPiezo.emit()
 
+    ## handleStagePosition
+    #
+    # Passes the current (x,y) position of the sample stage to the lock modes.
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    # @param stage_z The stage position in z in microns.
+    #
+    def handleStagePosition(self, stage_x, stage_y, stage_z):
+        for lock_mode in self.lock_modes:
+            lock_mode.newStagePosition(stage_x, stage_y)
+
     ## jump
     #
     # Handles requests to jump the piezo stage.
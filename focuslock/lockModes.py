@@ -11,7 +11,7 @@ from PyQt4 import QtCore
 
 # Focus quality determination for the optimal lock.
 import numpy
-import scipy.optimize
+import focuslock.focusOptimizer as focusOptimizer
 import focuslock.focusQuality as focusQuality
 
 ## LockMode
@@ -81,6 +81,16 @@ class LockMode(QtCore.QObject):
     def newParameters(self, parameters):
         pass
 
+    ## newStagePosition
+    #
+    # Handles updates of the (x,y) position of the sample stage.
+    #
+    # @param stage_x The x position of the stage in um.
+    # @param stage_y The y position of the stage in um.
+    #
+    def newStagePosition(self, stage_x, stage_y):
+        pass
+
     ## reset
     #
     # ??
@@ -324,13 +334,19 @@ class AlwaysOnLockMode(JumpLockMode):
 
 ## OptimalLockMode
 #
-# At the start of filming the stage is moved
-# in a triangle wave. First it goes up to bracket_step, then down
-# to -bracket_step and then finally back to zero. At each point
-# along the way the focus quality & offset are recorded. When the
-# stage returns to zero, the data is fit with a gaussian and the
-# lock target is set to the offset corresponding to the center
-# of the gaussian.
+# At the start of filming the piezo stage is moved to find the
+# lock offset with the best focus quality. The search is a golden
+# section search (see focuslock.focusOptimizer) over -bracket_step to
+# bracket_step, holding for scan_hold frames at each point, and it
+# stops when the search interval is smaller than scan_step. The lock
+# target is then set to the offset at the peak of a parabola fit to
+# the focus quality near the best point.
+#
+# The optimal lock offset is remembered for each stage position.
+# If a film is started close to a position that has already been
+# optimized then the lock starts at the remembered offset and only
+# a small range around it is searched. If the best focus turns out
+# to be at the edge of this small range the full search is done.
 #
 class OptimalLockMode(JumpLockMode):
 
@@ -344,17 +360,39 @@ class OptimalLockMode(JumpLockMode):
         JumpLockMode.__init__(self, control_thread, parameters, parent)
         self.bracket_step = None
         self.button_locked = False
-        self.cur_z = None
+        self.cache_radius = 20.0
         self.counter = 0
-        self.fvalues = None
+        self.cur_z = None
+        self.fsum = 0.0
         self.lock_target = None
         self.mode = "None"
+        self.model_cache = []
         self.name = "Optimal"
+        self.optimizer = None
+        self.osum = 0.0
         self.quality_threshold = 0
         self.scan_hold = None
         self.scan_step = None
-        self.scan_state = 1
-        self.zvalues = None
+        self.stage_x = None
+        self.stage_y = None
+        self.using_cache = False
+
+    ## findCachedTarget
+    #
+    # @return The index of the cached lock target closest to the current
+    #    stage position (if it is within cache_radius), otherwise None.
+    #
+    def findCachedTarget(self):
+        if (self.stage_x == None):
+            return None
+        best_index = None
+        best_d = self.cache_radius
+        for i, [x, y, target] in enumerate(self.model_cache):
+            d = numpy.sqrt((x - self.stage_x) * (x - self.stage_x) + (y - self.stage_y) * (y - self.stage_y))
+            if (d <= best_d):
+                best_d = d
+                best_index = i
+        return best_index
 
     ## getName
     #
@@ -368,16 +406,17 @@ class OptimalLockMode(JumpLockMode):
     ## initScan
     #
     # Configures all the variables that will be used during the scan
-    # to find the optimal lock target.
+    # to find the optimal lock target and moves to the first point.
     #
-    def initScan(self):
-        self.cur_z = 0.0
-        self.mode = "Optimizing"
-        self.scan_state = 1
+    # @param z_range The search range (in um) will be -z_range to z_range.
+    #
+    def initScan(self, z_range):
         self.counter = 0
-        size_guess = round(self.scan_hold * (self.bracket_step / self.scan_step) * 6)
-        self.fvalues = numpy.zeros(size_guess)
-        self.zvalues = numpy.zeros(size_guess)
+        self.fsum = 0.0
+        self.mode = "Optimizing"
+        self.optimizer = focusOptimizer.FocusOptimizer(-z_range, z_range, self.scan_step)
+        self.osum = 0.0
+        self.moveTo(self.optimizer.nextZ())
 
     ## lockButtonToggle
     #
@@ -395,74 +434,66 @@ class OptimalLockMode(JumpLockMode):
             self.button_locked = True
             self.locked = True
 
+    ## moveTo
+    #
+    # Jump the piezo to the requested z position (relative to the
+    # position at the start of the scan).
+    #
+    # @param z The z position to move to.
+    #
+    def moveTo(self, z):
+        self.handleJump(z - self.cur_z)
+        self.cur_z = z
+
     ## newFrame
     #
     # Handles a new frame from the camera. If the mode is optimizing this calculates
-    # the focus quality of the frame and moves the piezo to its next position.
+    # the focus quality of the frame. Once scan_hold frames have been measured at the
+    # current position the piezo is moved to the next position requested by the
+    # optimizer, or if the optimizer is done the lock target is set to the optimum.
+    # Only the calls with a camera frame are counted while settling.
     #
-    # @param frame A frame object.
+    # @param frame A frame object (or None).
     # @param offset The offset signal from the focus lock.
     # @param power The sum signal from the focus lock.
     # @param stage_z The z position of the piezo stage.
     #
     def newFrame(self, frame, offset, power, stage_z):
-        if (self.mode == "Optimizing"):
-            if frame:
-                quality = focusQuality.imageGradient(frame)
-                if (quality > self.quality_threshold):
-                    self.zvalues[self.counter] = offset
-                    self.fvalues[self.counter] = quality
-                    self.counter += 1
-
-                    if ((self.counter % self.scan_hold) == 0):
-                        if (self.scan_state == 1): # Scan up
-                            if (self.cur_z >= self.bracket_step):
-                                self.scan_state = 2
-                            else:
-                                self.cur_z += self.scan_step
-                                self.handleJump(self.scan_step)
-                        elif (self.scan_state == 2): # Scan back down
-                            if (self.cur_z <= -self.bracket_step):
-                                self.scan_state = 3
-                            else:
-                                self.cur_z -= self.scan_step
-                                self.handleJump(-self.scan_step)
-                        else: # Scan back to zero
-                            if (self.cur_z >= 0.0):
-                                self.mode = "Locked"
-                                n = self.counter - 1
-
-                                # Fit offset data to a*x*x + b*x + c.
-                                #m0 = numpy.concatenate((numpy.ones(n),
-                                #                        self.zvalues[0:n],
-                                #                        self.zvalues[0:n] * self.zvalues[0:n]))
-                                #m0 = numpy.reshape(m0, (3, n))
-                                #m1 = numpy.dot(numpy.linalg.inv(numpy.dot(m0, numpy.transpose(m0))), m0)
-                                #v0 = numpy.dot(m1, self.fvalues[0:n])
-                                #optimum = -v0[1]/(2.0 * v0[2])
-
-                                # Fit offset data to a 1D gaussian (lorentzian would be better?)
-                                zvalues = self.zvalues[0:n]
-                                fvalues = self.fvalues[0:n]
-                                fitfunc = lambda p, x: p[0] + p[1] * numpy.exp(- (x - p[2]) * (x - p[2]) * p[3])
-                                errfunc = lambda p: fitfunc(p, zvalues) - fvalues
-                                p0 = [numpy.min(fvalues),
-                                      numpy.max(fvalues) - numpy.min(fvalues),
-                                      zvalues[numpy.argmax(fvalues)],
-                                      9.0] # empirically determined width parameter
-                                p1, success = scipy.optimize.leastsq(errfunc, p0[:])
-                                if success == 1:
-                                    optimum = p1[2]
-                                else:
-                                    print "Fit for optimal lock failed."
-                                    # hope that this is close enough
-                                    optimum = zvalues[numpy.argmax(fvalues)]
-
-                                print "Optimal Target:", optimum
-                                self.control_thread.setTarget(optimum)
-                            else:
-                                self.cur_z += self.scan_step
-                                self.handleJump(self.scan_step)
+        if (self.mode == "Settling") and frame:
+            self.counter += 1
+            if (self.counter >= self.scan_hold):
+                self.initScan(self.bracket_step)
+
+        elif (self.mode == "Optimizing") and frame:
+            quality = focusQuality.imageGradient(frame)
+            if (quality > self.quality_threshold):
+                self.fsum += quality
+                self.osum += offset
+                self.counter += 1
+
+                if (self.counter == self.scan_hold):
+                    self.optimizer.addMeasurement(self.cur_z,
+                                                  self.osum/float(self.counter),
+                                                  self.fsum/float(self.counter))
+                    self.counter = 0
+                    self.fsum = 0.0
+                    self.osum = 0.0
+
+                    if not self.optimizer.isDone():
+                        self.moveTo(self.optimizer.nextZ())
+
+                    # The cached target was not good enough, do the full search.
+                    elif self.using_cache and self.optimizer.atEdge():
+                        print "Cached optimal target is out of date, searching."
+                        self.using_cache = False
+                        self.initScan(self.bracket_step)
+
+                    else:
+                        self.mode = "Locked"
+                        optimum = self.optimizer.getOptimum()
+                        print "Optimal Target:", optimum, "(" + str(len(self.optimizer.measurements)) + " points)"
+                        self.control_thread.setTarget(optimum)
+                        self.updateCache(optimum)
 
     ## newParameters
     #
@@ -476,6 +507,17 @@ class OptimalLockMode(JumpLockMode):
         self.bracket_step = 0.001 * parameters.olock_bracket_step
         self.scan_step = 0.001 * parameters.olock_scan_step
         self.scan_hold = parameters.olock_scan_hold
+        if hasattr(parameters, "olock_cache_radius"):
+            self.cache_radius = parameters.olock_cache_radius
+
+    ## newStagePosition
+    #
+    # @param stage_x The x position of the stage in um.
+    # @param stage_y The y position of the stage in um.
+    #
+    def newStagePosition(self, stage_x, stage_y):
+        self.stage_x = stage_x
+        self.stage_y = stage_y
 
     ## reset
     #
@@ -494,14 +536,29 @@ class OptimalLockMode(JumpLockMode):
 
     ## startLock
     #
-    # Call initScan and starts the focus lock.
+    # Starts the focus lock, at the cached optimal target for this stage
+    # position if there is one. With a cached target the (short) scan
+    # around it starts immediately, otherwise the full scan starts once
+    # the lock has had scan_hold frames to settle.
     #
     def startLock(self):
-        self.initScan()
-        self.control_thread.setTarget(self.lock_target)
+        index = self.findCachedTarget()
+        if (index != None) and (not self.button_locked):
+            self.using_cache = True
+            self.control_thread.setTarget(self.model_cache[index][2])
+        else:
+            self.using_cache = False
+            self.control_thread.setTarget(self.lock_target)
         self.control_thread.startLock()
         self.locked = True
 
+        self.counter = 0
+        self.cur_z = 0.0
+        if self.using_cache:
+            self.initScan(2.0 * self.scan_step)
+        else:
+            self.mode = "Settling"
+
     ## stopLock
     #
     # Stops the focus lock.
@@ -514,6 +571,21 @@ class OptimalLockMode(JumpLockMode):
                 self.control_thread.stopLock()
                 self.control_thread.recenter()
 
+    ## updateCache
+    #
+    # Remember the optimal lock target for the current stage position.
+    #
+    # @param target The optimal lock target.
+    #
+    def updateCache(self, target):
+        if (self.stage_x == None):
+            return
+        index = self.findCachedTarget()
+        if (index != None):
+            self.model_cache[index] = [self.stage_x, self.stage_y, target]
+        else:
+            self.model_cache.append([self.stage_x, self.stage_y, target])
+
 
 ## CalibrationLockMode
 #
@@ -27,23 +27,32 @@ import focuslock.stageOffsetControl as stageOffsetControl
 # focus lock dialog.
 import focuslock.focusLockZ as focusLockZ
 
+#
+# Opens the camera and the z stage. This is called by HAL (in a separate
+# thread) before the focus lock dialog is created.
+#
+def initHardware(hardware, parameters):
+    print "Initializing focus lock..."
+    cam = flyCam.CameraQPD(camera_id = 1)
+    if hardware.zstage == "PI":
+        stage = piController.PIControl(piController.pi_path)
+    elif hardware.zstage == "MCL":
+        stage = mclController.MCLStage("c:/Program Files/Mad City Labs/NanoDrive/")
+    else:
+        print "No valid stage for focus lock specified."
+        stage = None
+    return [cam, stage]
+
 #
 # Focus Lock Dialog Box specialized for STORM3
 # with Phresh QPD and MCL objective Z positioner.
 #
 class AFocusLockZ(focusLockZ.FocusLockZCam):
     def __init__(self, hardware, parameters, parent = None):
-        print "Initializing focus lock..."
-        #print "Focus lock hardware: ", hardware
-        #numpy.save("focuslockhardware.npy", hardware)
-        cam = flyCam.CameraQPD(camera_id = 1)
-        if hardware.zstage == "PI":
-            stage = piController.PIControl(piController.pi_path)
-        elif hardware.zstage == "MCL":
-            stage = mclController.MCLStage("c:/Program Files/Mad City Labs/NanoDrive/")
+        if hasattr(hardware, "device"):
+            [cam, stage] = hardware.device
         else:
-            print "No valid stage for focus lock specified."
-            stage = None
+            [cam, stage] = initHardware(hardware, parameters)
         lock_fn = lambda (x): 10.0 * x
         ir_laser = None
         if stage is not None:
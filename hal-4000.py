@@ -36,7 +36,6 @@ import os
 import sys
 import datetime, time
 import traceback
-import numpy #added 4/15/2014 by rjm for debugging
 
 from PyQt4 import QtCore, QtGui
 
@@ -45,6 +44,8 @@ import sc_library.hdebug as hdebug
 
 # Misc.
 import camera.filmSettings as filmSettings
+import halLib.frameMetadata as frameMetadata
+import halLib.halStartup as halStartup
 import halLib.imagewriters as writers
 import qtWidgets.qtAppIcon as qtAppIcon
 import qtWidgets.qtParametersBox as qtParametersBox
@@ -119,6 +120,7 @@ class Window(QtGui.QMainWindow):
         self.directory = False
         self.filename = ""
         self.filming = False
+        self.lazy_modules = []
         self.logfile_fp = open(parameters.logfile, "a")
         self.modules = []
         self.old_shutters_file = ""
@@ -222,24 +224,36 @@ class Window(QtGui.QMainWindow):
         # Hardware control modules
         #
 
-        # Load the requested modules.
+        # Load the requested modules. The hardware of the modules is initialized
+        # in parallel, a module that fails to start does not stop the others.
+        self.startups = map(halStartup.ModuleStartup, hardware.modules)
+        halStartup.importModules(self.startups, halImport)
+        halStartup.initHardware(self.startups, parameters)
+
         add_separator = False
-        for module in hardware.modules:
-            hdebug.logText("Loading: " + module.hal_type)
-            print "About to load... ", module.module_name
-            a_module = halImport(module.module_name.replace('\n',''))
-            a_class = getattr(a_module, module.class_name)
-            numpy.save("moduleParameters.npy", module.parameters)
-            numpy.save("paramters.npy", parameters)
-            instance = a_class(module.parameters, parameters, self)
-            instance.hal_type = module.hal_type
-            instance.hal_gui = module.hal_gui
-            if module.hal_gui:
+        for startup in self.startups:
+            if not startup.isOk():
+                continue
+
+            # Lazy modules are not created until they are shown, unless
+            # they were visible when HAL was last closed.
+            if startup.lazy and not self.settings.value(startup.hal_type + "_visible", False).toBool():
+                instance = None
+                self.lazy_modules.append(startup)
+            else:
+                instance = halStartup.createModule(startup, parameters, self)
+                if instance is None:
+                    continue
+                self.modules.append(instance)
+
+            if startup.module.hal_gui:
                 add_separator = True
-                a_action = QtGui.QAction(self.tr(module.menu_item), self)
+                a_action = QtGui.QAction(self.tr(startup.module.menu_item), self)
                 self.ui.menuFile.insertAction(self.ui.actionQuit, a_action)
-                a_action.triggered.connect(instance.show)
-            self.modules.append(instance)
+                if instance is None:
+                    a_action.triggered.connect(lambda checked, s = startup: self.handleLazyModule(s))
+                else:
+                    a_action.triggered.connect(instance.show)
 
         # Insert a separator into the file menu if necessary.
         if add_separator:
@@ -257,6 +271,8 @@ class Window(QtGui.QMainWindow):
         for module in self.modules:
             module.moduleInit()
 
+        halStartup.printReport(self.startups)
+
         #
         # More ui stuff
         #
@@ -492,8 +508,18 @@ class Window(QtGui.QMainWindow):
             if self.filming:
                 self.stopFilm()
 
+        # This is either the index of the parameters or the name of a
+        # parameters file. Files that have not been loaded yet are added
+        # to the parameters box.
         elif (m_type == "parameters"):
-            self.parameters_box.setCurrentParameters(m_data[0])
+            if isinstance(m_data[0], str):
+                index = self.parameters_box.findParameters(m_data[0])
+                if (index < 0):
+                    self.newSettings(m_data[0])
+                    index = self.parameters_box.findParameters(m_data[0])
+                self.parameters_box.setCurrentParameters(index)
+            else:
+                self.parameters_box.setCurrentParameters(m_data[0])
 
         elif (m_type == "movie"):
             # set to new comm specific values
@@ -537,6 +563,44 @@ class Window(QtGui.QMainWindow):
     def handleToggleFilm(self):
         self.toggleFilm(False)
 
+    ## handleLazyModule
+    #
+    # Creates a lazy module the first time that it is shown. Modules that
+    # fail to start are reported in the log, with their startup times.
+    #
+    # @param startup The halStartup.ModuleStartup object for the module.
+    #
+    @hdebug.debug
+    def handleLazyModule(self, startup):
+        if startup.instance is None:
+            if not startup.isOk():
+                hdebug.logText(startup.hal_type + " could not be started, see the log above.")
+                return
+            instance = halStartup.createModule(startup, self.parameters, self)
+            halStartup.printReport([startup])
+            if instance is None:
+                return
+
+            # Connect signals between the new module and everything else.
+            everything = self.modules + [self] + [self.camera]
+            signals = instance.getSignals()
+            for module in everything:
+                module.connectSignals(signals)
+                instance.connectSignals(module.getSignals())
+            instance.connectSignals(signals)
+
+            # The new module is initialized and the other modules send
+            # it the information that they provide at start up.
+            self.lazy_modules.remove(startup)
+            instance.moduleInit()
+            for module in self.modules:
+                module.lazyModuleInit(instance)
+            self.modules.append(instance)
+            instance.newParameters(self.parameters)
+            instance.loadGUISettings(self.settings)
+
+        startup.instance.show()
+
     ## handleModeComboBox
     #
     # This is called when the acquistion mode combo box is
@@ -811,7 +875,8 @@ class Window(QtGui.QMainWindow):
         self.stopCamera() #So that camera won't be triggering shutter sequence before start of data (RJM:4/17/2014)
         time.sleep(0.2)
 
-        # Modules.
+        # Modules, these add the fields they want to record to the frame meta-data.
+        frameMetadata.getRecorder().startFilm(self.film_name)
         for module in self.modules:
             module.startFilm(self.film_name, self.ui.autoShuttersCheckBox.isChecked())
 
@@ -858,6 +923,7 @@ class Window(QtGui.QMainWindow):
             for module in self.modules:
                 module.stopFilm(self.writer)
 
+            frameMetadata.getRecorder().stopFilm()
             self.writer.closeFile()
 
             self.updateNotes() # Get any changes to the notes made during filming.
@@ -988,9 +1054,14 @@ class Window(QtGui.QMainWindow):
             if self.writer: # The flag for whether or not we are actually saving anything.
                 size = self.camera.getFilmSize()
                 if size < 1000.0:
-                    self.ui.sizeText.setText("%.1f MB" % size)
+                    size_text = "%.1f MB" % size
                 else:
-                    self.ui.sizeText.setText("%.1f GB" % (size * 0.00097656))
+                    size_text = "%.1f GB" % (size * 0.00097656)
+                if hasattr(self.writer, "getCompressionStatistics"):
+                    compression = self.writer.getCompressionStatistics()
+                    if compression is not None:
+                        size_text += " (%.1fx, %.0f MB/s)" % (compression[0], compression[1])
+                self.ui.sizeText.setText(size_text)
 
     ## updateLength
     #
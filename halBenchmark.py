@@ -0,0 +1,521 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Headless acquisition benchmark.
+#
+# This creates the HAL main window (without showing it) for a hardware
+# and settings XML file pair, with the camera replaced by the simulated
+# camera (camera/simulCameraControl.py), and then records films with the
+# simulated camera. Hardware modules that cannot be started on this
+# computer are skipped, they are listed in the report. The results are
+# saved as a JSON file, which can be compared with the results of an
+# earlier run to catch performance regressions.
+#
+# The films that are recorded are:
+#
+# 1. At the frame rate of the settings file. This measures whether
+#    this rate is sustainable, i.e. if HAL processes the frames as
+#    fast as the camera takes them without dropping any, and how long
+#    each of the stages (display, modules, file writing) takes per
+#    frame. For each stage both the wall-clock time and the CPU time
+#    of the (GUI) thread that runs the stage are measured. The
+#    wall-clock time also includes any time that the thread is
+#    waiting, for example for the CPU. The CPU time of the whole
+#    process (all threads) is reported for each film.
+#
+# 2. At the maximum frame rate of the simulated camera. The rate that
+#    HAL achieves is the upper limit for the search.
+#
+# 3. A binary search over the exposure time (frame rate) for the
+#    highest rate that is sustainable, this is the maximum sustainable
+#    frame rate that is compared with earlier runs.
+#
+# Usage:
+#
+#   python halBenchmark.py hardware.xml settings.xml [options]
+#
+# Options:
+#
+#   --baseline file.json  Compare with the results of an earlier run.
+#   --defaults file.xml   The default settings, default is setup_default.xml where setup is the start of the
+#                         name of the hardware file (up to the first "_"), e.g. storm3_default.xml.
+#   --frames N            The number of frames in each film, default 2000.
+#   --modules a,b,..      Only load these modules (the hal types in the hardware XML file).
+#   --output file.json    The results file, default is benchmark.json.
+#   --steps N             The number of steps of the search for the maximum sustainable frame rate, default 6.
+#   --tolerance x         The allowed fractional decrease in the maximum frame rate, default 0.1.
+#
+# Qt needs a display, on a computer without one use xvfb-run.
+#
+# Hazen 10/14
+#
+
+import ctypes
+import ctypes.util
+import imp
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from PyQt4 import QtGui
+
+import camera.filmSettings as filmSettings
+import sc_library.parameters as params
+
+## The maximum lag (in seconds) for a frame rate to be considered sustainable.
+max_sustainable_lag = 0.5
+
+## The clock_gettime() clock id of the CPU time of the calling thread.
+if (sys.platform == "darwin"):
+    clock_thread_cputime_id = 16
+else:
+    clock_thread_cputime_id = 3
+
+libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+
+
+## Timespec
+#
+# The C timespec structure.
+#
+class Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long),
+                ("tv_nsec", ctypes.c_long)]
+
+
+## BenchmarkStatistics
+#
+# Per-frame statistics that are collected during the film.
+#
+class BenchmarkStatistics(object):
+
+    ## __init__
+    #
+    def __init__(self):
+        self.reset()
+
+    ## getStageReport
+    #
+    # @return A dictionary with the number of calls and the wall-clock and (thread) CPU time of each stage.
+    #
+    def getStageReport(self):
+        report = {}
+        frames = float(max(self.frames, 1))
+        for name in sorted(self.stages.keys()):
+            [calls, wall_time, cpu_time] = self.stages[name]
+            report[name] = {"calls" : calls,
+                            "cpu_time" : cpu_time,
+                            "cpu_time_per_frame" : cpu_time/frames,
+                            "wall_time" : wall_time,
+                            "wall_time_per_frame" : wall_time/frames}
+        return report
+
+    ## newFrames
+    #
+    # Called with each batch of frames that HAL processes.
+    #
+    # @param frames A list of frame objects.
+    # @param frame_time The time between frames in seconds.
+    # @param start_time The time when the first frame was taken.
+    #
+    def newFrames(self, frames, frame_time, start_time):
+        now = time.time()
+        if (self.first_time is None):
+            self.first_time = now
+        self.last_time = now
+        for frame in frames:
+            if not frame.master:
+                continue
+            if (frame.number > (self.last_number + 1)):
+                self.dropped += frame.number - self.last_number - 1
+            self.last_number = frame.number
+            self.frames += 1
+        lag = now - (start_time + (self.last_number + 1) * frame_time)
+        if (lag > self.max_lag):
+            self.max_lag = lag
+        self.final_lag = lag
+
+    ## reset
+    #
+    # Reset for a new film.
+    #
+    def reset(self):
+        self.dropped = 0
+        self.final_lag = 0.0
+        self.first_time = None
+        self.frames = 0
+        self.last_number = -1
+        self.last_time = None
+        self.max_lag = 0.0
+        self.stages = {}
+
+    ## timed
+    #
+    # Wraps a function so that the number of calls and the wall-clock and
+    # CPU time spent in it are recorded.
+    #
+    # @param name The name of the stage.
+    # @param fn The function.
+    #
+    # @return The wrapped function.
+    #
+    def timed(self, name, fn):
+        self.stages[name] = [0, 0.0, 0.0]
+        def wrapper(*args):
+            start_cpu = threadCPUTime()
+            start = time.time()
+            result = fn(*args)
+            stage = self.stages[name]
+            stage[0] += 1
+            stage[1] += time.time() - start
+            stage[2] += threadCPUTime() - start_cpu
+            return result
+        return wrapper
+
+
+## Benchmark
+#
+# Runs the benchmark films.
+#
+class Benchmark(object):
+
+    ## __init__
+    #
+    # @param hardware_file The hardware XML file.
+    # @param settings_file The settings XML file.
+    # @param defaults_file The default settings XML file.
+    # @param module_types A list of the modules to load, or None for all of them.
+    #
+    def __init__(self, hardware_file, settings_file, defaults_file, module_types):
+        self.hardware_file = hardware_file
+        self.settings_file = settings_file
+        self.stats = BenchmarkStatistics()
+        self.temp_directory = tempfile.mkdtemp(prefix = "hal_benchmark_")
+
+        # The hardware, with the camera replaced by the simulated camera.
+        hardware = params.Hardware(hardware_file)
+        hardware.camera.parameters.control = "simulCameraControl"
+        if module_types is not None:
+            hardware.modules = filter(lambda x: (x.hal_type in module_types), hardware.modules)
+
+        # The parameters, the default settings are loaded first as the settings
+        # file might not have all the parameters.
+        if os.path.exists(defaults_file):
+            params.Parameters(defaults_file, is_HAL = True)
+        parameters = params.Parameters(settings_file, is_HAL = True)
+        params.setSetupName(parameters, os.path.basename(hardware_file).split("_")[0])
+        parameters.directory = self.temp_directory + os.sep
+        parameters.logfile = os.path.join(self.temp_directory, "image_log.txt")
+
+        hal = imp.load_source("hal4000", "hal-4000.py")
+        self.window = hal.Window(hardware, parameters)
+        self.window.directory = parameters.directory
+
+        # Instrument the stages.
+        self.camera_control = self.window.camera.camera_control
+        self.film_start = time.time()
+        camera_display = self.window.camera.camera_display
+        camera_display.camera_widget.updateImageWithFrame = self.stats.timed("display", camera_display.camera_widget.updateImageWithFrame)
+        self.window.camera.newFrames.connect(self.handleNewFrames)
+        for module in self.window.modules:
+            module.newFrame = self.stats.timed("module." + module.hal_type, module.newFrame)
+
+        create_file_writer = hal.writers.createFileWriter
+        def createFileWriter(*args):
+            writer = create_file_writer(*args)
+            writer.saveFrame = self.stats.timed("writer", writer.saveFrame)
+            return writer
+        hal.writers.createFileWriter = createFileWriter
+
+    ## cleanup
+    #
+    # Stops the camera and the modules. This does not call the cleanUp()
+    # method of the main window as that would save the (hidden) window
+    # layout as the users HAL settings.
+    #
+    def cleanup(self):
+        self.window.stopCamera()
+        self.window.camera.close()
+        for module in self.window.modules:
+            module.cleanup()
+        self.window.logfile_fp.close()
+        shutil.rmtree(self.temp_directory, ignore_errors = True)
+
+    ## getModuleStatus
+    #
+    # @return A dictionary with the startup status of each module.
+    #
+    def getModuleStatus(self):
+        status = {}
+        for startup in self.window.startups:
+            status[startup.hal_type] = startup.status
+        return status
+
+    ## handleNewFrames
+    #
+    # @param frames A list of frame objects.
+    #
+    def handleNewFrames(self, frames):
+        self.stats.newFrames(frames, self.camera_control.frame_time, self.film_start)
+
+    ## runFilm
+    #
+    # Records a film with the simulated camera.
+    #
+    # @param frames The length of the film.
+    # @param exposure_time (Optional) The time between frames, None for the time in the settings file.
+    #
+    # @return A dictionary with the results.
+    #
+    def runFilm(self, frames, exposure_time = None):
+        window = self.window
+        if exposure_time is not None:
+            window.parameters.exposure_time = exposure_time
+        window.toggleSettings()
+        window.ui.filenameEdit.setText("benchmark")
+        window.ui.autoIncCheckBox.setChecked(False)
+        window.ui.filetypeComboBox.setCurrentIndex(window.ui.filetypeComboBox.findText(".dax"))
+        frame_time = self.camera_control.frame_time
+
+        self.stats.reset()
+        for stage in ["display", "writer"] + map(lambda x: "module." + x.hal_type, window.modules):
+            self.stats.stages[stage] = [0, 0.0, 0.0]
+
+        start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        start_time = time.time()
+        window.startFilm(filmSettings.FilmSettings("fixed_length", frames))
+        self.film_start = self.camera_control.next_time - frame_time
+
+        # Wait until the camera reaches the end of the film, with a
+        # timeout in case it takes much longer than expected.
+        timeout = start_time + 30.0 + 10.0 * frames * frame_time
+        while window.filming and (time.time() < timeout):
+            QtGui.QApplication.processEvents()
+            time.sleep(0.001)
+        timed_out = window.filming
+        if window.filming:
+            window.stopFilm()
+        end_time = time.time()
+        end_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+        stats = self.stats
+        achieved_fps = 0.0
+        if (stats.frames > 1) and (stats.last_time > stats.first_time):
+            achieved_fps = (stats.frames - 1)/(stats.last_time - stats.first_time)
+        camera_stats = self.camera_control.getStatistics()
+        dropped = max(stats.dropped, frames - stats.frames)
+        return {"achieved_fps" : achieved_fps,
+                "process_cpu_system" : end_usage.ru_stime - start_usage.ru_stime,
+                "process_cpu_user" : end_usage.ru_utime - start_usage.ru_utime,
+                "dropped_frames" : dropped,
+                "dropped_frames_camera" : camera_stats["frames_dropped"],
+                "elapsed_time" : end_time - start_time,
+                "final_lag" : stats.final_lag,
+                "frames" : stats.frames,
+                "max_lag" : stats.max_lag,
+                "requested_fps" : 1.0/frame_time,
+                "stages" : stats.getStageReport(),
+                "sustainable" : ((not timed_out) and (stats.final_lag < max_sustainable_lag) and (dropped == 0)),
+                "timed_out" : timed_out}
+
+    ## run
+    #
+    # @param frames The length of each film.
+    # @param steps The number of steps of the search for the maximum sustainable frame rate.
+    #
+    # @return A dictionary with the results.
+    #
+    def run(self, frames, steps):
+        p = self.window.parameters
+        settings_film = self.runFilm(frames)
+        max_film = self.runFilm(frames, exposure_time = 0.0)
+        [max_sustainable_fps, search_films] = self.searchMaxRate(frames, steps, settings_film, max_film)
+        return {"commit" : getCommit(),
+                "frame_size" : [p.x_pixels, p.y_pixels],
+                "hardware" : os.path.basename(self.hardware_file),
+                "max_achieved_fps" : max_film["achieved_fps"],
+                "max_rate_film" : max_film,
+                "max_sustainable_fps" : max_sustainable_fps,
+                "search_films" : search_films,
+                "memory_hwm_mb" : getMemoryHWM(),
+                "modules" : self.getModuleStatus(),
+                "settings" : os.path.basename(self.settings_file),
+                "settings_film" : settings_film,
+                "time" : time.strftime("%Y-%m-%d %H:%M:%S")}
+
+    ## searchMaxRate
+    #
+    # Binary search for the highest frame rate at which HAL does not drop
+    # frames or fall behind the camera. HAL cannot sustain a higher rate
+    # than the rate it achieved at the maximum rate of the camera, and
+    # the rate of the settings file is a lower limit if it is sustainable.
+    #
+    # @param frames The length of each film.
+    # @param steps The number of steps of the search.
+    # @param settings_film The results of the film at the rate of the settings file.
+    # @param max_film The results of the film at the maximum rate of the camera.
+    #
+    # @return [maximum sustainable frame rate, [[frame rate, sustainable, dropped frames], ..] for each film of the search].
+    #
+    def searchMaxRate(self, frames, steps, settings_film, max_film):
+        if max_film["sustainable"]:
+            return [max_film["achieved_fps"], []]
+
+        low = 0.0
+        if settings_film["sustainable"]:
+            low = settings_film["requested_fps"]
+        high = max(max_film["achieved_fps"], low)
+        search_films = []
+        for i in range(steps):
+            fps = 0.5 * (low + high)
+            if (fps <= 0.0):
+                break
+            film = self.runFilm(frames, exposure_time = 1.0/fps)
+            search_films.append([film["requested_fps"], film["sustainable"], film["dropped_frames"]])
+            if film["sustainable"]:
+                low = fps
+            else:
+                high = fps
+        return [low, search_films]
+
+
+## compareResults
+#
+# Compares results with the results of an earlier run.
+#
+# @param results The current results.
+# @param baseline The earlier results.
+# @param tolerance The allowed fractional decrease in the maximum frame rate.
+#
+# @return True if there is no performance regression.
+#
+def compareResults(results, baseline, tolerance):
+    ok = True
+    print "Comparison with", baseline.get("commit", "?"), ":"
+    for key in ["max_sustainable_fps", "memory_hwm_mb"]:
+        old = baseline.get(key, 0.0)
+        new = results[key]
+        change = 0.0
+        if (old > 0.0):
+            change = (new - old)/old
+        print "  {0:20s} {1:10.1f} {2:10.1f} {3:+7.1%}".format(key, old, new, change)
+    if (baseline.get("max_sustainable_fps", 0.0) > 0.0):
+        if (results["max_sustainable_fps"] < (1.0 - tolerance) * baseline["max_sustainable_fps"]):
+            print "  Maximum frame rate decreased by more than {0:.0%}".format(tolerance)
+            ok = False
+    for name, stage in results["settings_film"]["stages"].items():
+        old = baseline.get("settings_film", {}).get("stages", {}).get(name, {})
+        for key in ["cpu_time_per_frame", "wall_time_per_frame"]:
+            print "  {0:20s} {1:10.6f} {2:10.6f} ({3:s} seconds)".format(name, old.get(key, 0.0), stage[key], key)
+    return ok
+
+## getCommit
+#
+# @return The current git commit, or "unknown".
+#
+def getCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"]).strip()
+    except:
+        return "unknown"
+
+## getMemoryHWM
+#
+# @return The memory high water mark of this process in MB.
+#
+def getMemoryHWM():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"):
+        return max_rss/(1024.0 * 1024.0)
+    else:
+        return max_rss/1024.0
+
+## threadCPUTime
+#
+# @return The CPU time used by the calling thread in seconds, or by the whole process if this is not available.
+#
+def threadCPUTime():
+    ts = Timespec()
+    if (libc.clock_gettime(clock_thread_cputime_id, ctypes.byref(ts)) == 0):
+        return ts.tv_sec + 1.0e-9 * ts.tv_nsec
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    if (len(args) < 2):
+        print "usage: halBenchmark.py hardware.xml settings.xml [--frames N] [--modules a,b] [--output file.json] [--baseline file.json] [--defaults file.xml] [--tolerance x] [--steps N]"
+        exit()
+
+    hardware_file = args[0]
+    settings_file = args[1]
+    options = {"--baseline" : None,
+               "--defaults" : os.path.basename(hardware_file).split("_")[0] + "_default.xml",
+               "--frames" : "2000",
+               "--modules" : None,
+               "--output" : "benchmark.json",
+               "--steps" : "6",
+               "--tolerance" : "0.1"}
+    for i in range(2, len(args) - 1, 2):
+        options[args[i]] = args[i+1]
+
+    module_types = None
+    if options["--modules"] is not None:
+        module_types = options["--modules"].split(",")
+
+    app = QtGui.QApplication(sys.argv)
+    benchmark = Benchmark(hardware_file, settings_file, options["--defaults"], module_types)
+    results = benchmark.run(int(options["--frames"]), int(options["--steps"]))
+    benchmark.cleanup()
+
+    fp = open(options["--output"], "w")
+    json.dump(results, fp, indent = 2, sort_keys = True)
+    fp.close()
+
+    film = results["settings_film"]
+    print "Settings frame rate: {0:.1f} fps, achieved {1:.1f} fps, sustainable {2:s}".format(film["requested_fps"],
+                                                                                           film["achieved_fps"],
+                                                                                           str(film["sustainable"]))
+    print "Maximum frame rate: {0:.1f} fps achieved, {1:.1f} fps sustainable".format(results["max_achieved_fps"],
+                                                                                    results["max_sustainable_fps"])
+    print "Dropped frames: {0:d}, memory high water mark: {1:.1f} MB".format(film["dropped_frames"], results["memory_hwm_mb"])
+
+    if options["--baseline"] is not None:
+        fp = open(options["--baseline"])
+        baseline = json.load(fp)
+        fp.close()
+        if not compareResults(results, baseline, float(options["--tolerance"])):
+            sys.exit(1)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Lossless compression of film chunks in a pool of worker threads.
+#
+# The chunks are byte shuffled (all the low bytes of the pixels
+# followed by all the high bytes, which makes the mostly background
+# frames much more compressible) and then compressed with zlib. This
+# is the same as the HDF5 shuffle and deflate filters so the chunks
+# can be written directly into a HDF5 dataset that was created with
+# these filters (see imagewriters.HDF5File) and read with any HDF5
+# reader.
+#
+# Threads are used rather than processes as zlib releases the GIL
+# while compressing, so the chunks do not need to be copied to
+# another process. If the pool falls behind the film writer is
+# expected to write the chunk without compression.
+#
+# Hazen 10/14
+#
+
+import collections
+import multiprocessing
+import multiprocessing.pool
+import numpy
+import time
+import zlib
+
+
+## shuffleCompress
+#
+# Byte shuffle and compress an array.
+#
+# @param data A numpy array.
+# @param level The zlib compression level.
+#
+# @return The compressed data as a string.
+#
+def shuffleCompress(data, level):
+    shuffled = numpy.ascontiguousarray(data.view(numpy.uint8).reshape((-1, data.dtype.itemsize)).transpose())
+    return zlib.compress(shuffled, level)
+
+
+## ChunkCompressor
+#
+# Compresses chunks in a thread pool. This is not thread safe, it
+# should only be used by the thread that writes the film.
+#
+class ChunkCompressor():
+
+    ## __init__
+    #
+    # @param threads (Optional) The number of worker threads, default is the number of CPUs.
+    # @param level (Optional) The zlib compression level, default is 1 (fastest).
+    # @param max_pending (Optional) The maximum number of chunks waiting to be compressed, default is twice the number of threads.
+    #
+    def __init__(self, threads = None, level = 1, max_pending = None):
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = 2 * threads
+        self.level = level
+        self.max_pending = max_pending
+        self.pending = collections.deque()
+        self.pool = multiprocessing.pool.ThreadPool(threads)
+
+        self.compressed_bytes = 0
+        self.compressed_chunks = 0
+        self.compressed_raw_bytes = 0
+        self.raw_bytes = 0
+        self.raw_chunks = 0
+        self.start_time = None
+
+    ## addRaw
+    #
+    # Record a chunk that was written without compression.
+    #
+    # @param size The size of the chunk in bytes.
+    #
+    def addRaw(self, size):
+        self.startTimer()
+        self.raw_bytes += size
+        self.raw_chunks += 1
+
+    ## close
+    #
+    # Stop the worker threads.
+    #
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    ## compress
+    #
+    # Queue a chunk for compression. The chunk must not be modified until
+    # it has been returned by getResults().
+    #
+    # @param key The key of the chunk (e.g. its position in the film).
+    # @param data The chunk as a numpy array.
+    #
+    # @return True if the chunk was queued, False if there are too many chunks waiting.
+    #
+    def compress(self, key, data):
+        if (len(self.pending) >= self.max_pending):
+            return False
+        self.startTimer()
+        self.pending.append([key, data, self.pool.apply_async(shuffleCompress, (data, self.level))])
+        return True
+
+    ## getResults
+    #
+    # Returns the compressed chunks, in the order in which they were queued.
+    #
+    # @param wait (Optional) Wait for all the chunks to be compressed, default is False.
+    #
+    # @return A list of [key, data, compressed data] lists.
+    #
+    def getResults(self, wait = False):
+        results = []
+        while (len(self.pending) > 0) and (wait or self.pending[0][2].ready()):
+            [key, data, result] = self.pending.popleft()
+            compressed = result.get()
+            self.compressed_bytes += len(compressed)
+            self.compressed_chunks += 1
+            self.compressed_raw_bytes += data.nbytes
+            results.append([key, data, compressed])
+        return results
+
+    ## getStatistics
+    #
+    # @return [compression ratio, throughput (MB/s), fraction of the chunks that were not compressed].
+    #
+    def getStatistics(self):
+        ratio = 1.0
+        throughput = 0.0
+        uncompressed = 0.0
+        total_chunks = self.compressed_chunks + self.raw_chunks
+        if (total_chunks > 0):
+            total_bytes = self.compressed_raw_bytes + self.raw_bytes
+            ratio = float(total_bytes)/float(self.getSize())
+            uncompressed = float(self.raw_chunks)/float(total_chunks)
+            elapsed = time.time() - self.start_time
+            if (elapsed > 0.0):
+                throughput = total_bytes/(elapsed * 1024.0 * 1024.0)
+        return [ratio, throughput, uncompressed]
+
+    ## getSize
+    #
+    # @return The size (in bytes) of the chunks that have been returned or written without compression.
+    #
+    def getSize(self):
+        return self.compressed_bytes + self.raw_bytes
+
+    ## startTimer
+    #
+    # Start the throughput timer with the first chunk.
+    #
+    def startTimer(self):
+        if self.start_time is None:
+            self.start_time = time.time()
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    # 16 frames every 10ms is ~800 MB/s with 512 x 512 frames.
+    compressor = ChunkCompressor()
+    chunk = numpy.random.poisson(10.0, (16, 512, 512)).astype(numpy.uint16) + 100
+    for i in range(100):
+        if not compressor.compress(i, chunk):
+            compressor.addRaw(chunk.nbytes)
+        compressor.getResults()
+        time.sleep(0.01)
+    compressor.getResults(wait = True)
+    compressor.close()
+    print "Compression ratio {0:.2f}, {1:.1f} MB/s, {2:.0%} not compressed".format(*compressor.getStatistics())
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Groups the frames from two (or more) cameras into synchronized
+# sets, i.e. the frames that were taken at the same time.
+#
+# Frames are matched either by frame number (the default, this is
+# appropriate when the cameras are triggered by the same hardware
+# signal) or by time stamp. In the latter case the time stamp that
+# was reported by the camera driver (hw_timestamp) is used if there
+# is one, otherwise the time when the frame was received (receive_time),
+# and frames whose time stamps differ by less than the tolerance
+# (in seconds) are matched.
+#
+# The frames from each camera are expected to arrive in order, but
+# the cameras can be out of step with each other. If a camera misses
+# a frame, or one of the cameras stops sending frames, the frames
+# of the other cameras are returned as an incomplete set (with None
+# for the missing frames) and the mismatch is recorded.
+#
+# The data of a frame can be a view of the memory of the camera
+# driver, which is re-used for newer frames (e.g. the Andor ring buffer
+# is as small as 64 frames). Frames that are held for longer than
+# max_views frames of the same camera are therefore copied.
+#
+# Hazen 10/14
+#
+
+import collections
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+
+## FrameAggregator
+#
+# Matches the frames from several cameras into synchronized sets.
+#
+class FrameAggregator():
+
+    ## __init__
+    #
+    # @param cameras A list of the camera names, e.g. ["camera1", "camera2"].
+    # @param match_by (Optional) "number" or "timestamp", default is "number".
+    # @param tolerance (Optional) The maximum difference in the frame number / time stamp of matched frames.
+    # @param max_pending (Optional) The maximum number of frames to hold while waiting for the other cameras.
+    # @param max_views (Optional) The number of frames of a camera that can be held before their data is copied.
+    #
+    def __init__(self, cameras, match_by = "number", tolerance = 0, max_pending = 100, max_views = 32):
+        self.cameras = cameras
+        self.match_by = match_by
+        self.max_pending = max_pending
+        self.max_views = max_views
+        self.tolerance = tolerance
+        self.reset()
+
+    ## addFrame
+    #
+    # @param frame A frame object.
+    #
+    # @return A (possibly empty) list of the frame sets that were completed by this frame.
+    #
+    def addFrame(self, frame):
+        pending = self.pending[self.cameras.index(frame.which_camera)]
+        pending.append(frame)
+        sets = self.getSets(False)
+
+        # The frames of a camera arrive in order, so at most one held frame
+        # is now max_views frames older than the newest frame of the camera.
+        if (len(pending) > self.max_views):
+            old_frame = pending[-(self.max_views + 1)]
+            old_frame.np_data = old_frame.np_data.copy()
+            self.copied += 1
+        return sets
+
+    ## flush
+    #
+    # Called at the end of the film to get the frames that are still waiting to be matched.
+    #
+    # @return A list of (possibly incomplete) frame sets.
+    #
+    def flush(self):
+        return self.getSets(True)
+
+    ## getKey
+    #
+    # @param frame A frame object.
+    #
+    # @return The value that is used to match the frame.
+    #
+    def getKey(self, frame):
+        if (self.match_by == "timestamp"):
+            if frame.hw_timestamp is not None:
+                return frame.hw_timestamp
+            return frame.receive_time
+        else:
+            return frame.number
+
+    ## getSets
+    #
+    # Removes the frame sets that can be completed from the pending frames.
+    #
+    # @param flush If True then incomplete sets are returned even if the other cameras might still send the missing frames.
+    #
+    # @return A list of frame sets.
+    #
+    def getSets(self, flush):
+        sets = []
+        while True:
+            heads = map(lambda x: x[0] if (len(x) > 0) else None, self.pending)
+            waiting = filter(lambda x: x is not None, heads)
+            if (len(waiting) == 0):
+                break
+
+            # Give up on the cameras that we are waiting for if we have
+            # too many frames from another camera (or it is the end of the film).
+            if (len(waiting) < len(heads)):
+                if not flush and (max(map(len, self.pending)) <= self.max_pending):
+                    break
+
+            # Take the frames that match the oldest frame.
+            oldest = min(map(self.getKey, waiting))
+            frame_set = []
+            for i, frame in enumerate(heads):
+                if (frame is not None) and ((self.getKey(frame) - oldest) <= self.tolerance):
+                    frame_set.append(self.pending[i].popleft())
+                else:
+                    frame_set.append(None)
+
+            self.recordSet(frame_set, oldest)
+            sets.append(frame_set)
+        return sets
+
+    ## getStatistics
+    #
+    # @return A dictionary with the number of complete sets, incomplete sets, the number of frames that could not be matched for each camera, the largest difference between matched frames and the number of frames that were copied.
+    #
+    def getStatistics(self):
+        return {"complete" : self.complete,
+                "copied" : self.copied,
+                "incomplete" : self.incomplete,
+                "max_skew" : self.max_skew,
+                "unmatched" : dict(zip(self.cameras, self.unmatched))}
+
+    ## recordSet
+    #
+    # Updates the statistics with a frame set.
+    #
+    # @param frame_set A list of frames (or None).
+    # @param oldest The key of the oldest frame in the set.
+    #
+    def recordSet(self, frame_set, oldest):
+        if None in frame_set:
+            if (self.incomplete == 0):
+                hdebug.logText("frameAggregator: frame set " + str(oldest) + " is incomplete.")
+            self.incomplete += 1
+            for i, frame in enumerate(frame_set):
+                if frame is not None:
+                    self.unmatched[i] += 1
+        else:
+            self.complete += 1
+            skew = max(map(self.getKey, frame_set)) - oldest
+            if (skew > self.max_skew):
+                self.max_skew = skew
+
+    ## reset
+    #
+    # Discards any pending frames and resets the statistics, this should be called at the start of a film.
+    #
+    def reset(self):
+        self.complete = 0
+        self.copied = 0
+        self.incomplete = 0
+        self.max_skew = 0
+        self.pending = map(lambda x: collections.deque(), self.cameras)
+        self.unmatched = map(lambda x: 0, self.cameras)
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    import numpy
+
+    import camera.frame as frame
+
+    def makeFrame(number, which_camera, hw_timestamp = None):
+        return frame.Frame(numpy.zeros(4, dtype = numpy.uint16), number, 2, 2, which_camera, (which_camera == "camera1"), hw_timestamp = hw_timestamp)
+
+    aggregator = FrameAggregator(["camera1", "camera2"], max_pending = 3, max_views = 2)
+    for i in range(10):
+        for frame_set in aggregator.addFrame(makeFrame(i, "camera1")):
+            print map(lambda x: x.number if x else None, frame_set)
+        if (i != 4):
+            for frame_set in aggregator.addFrame(makeFrame(i, "camera2")):
+                print map(lambda x: x.number if x else None, frame_set)
+    for frame_set in aggregator.flush():
+        print map(lambda x: x.number if x else None, frame_set)
+    print aggregator.getStatistics()
+
+    # Match by the camera time stamps, the frame numbers of camera2 are offset by
+    # 2 and its frames arrive 3 frames late, so the oldest frames of camera1 are copied.
+    aggregator = FrameAggregator(["camera1", "camera2"], match_by = "timestamp", tolerance = 0.001, max_views = 2)
+    for i in range(13):
+        if (i < 10):
+            aggregator.addFrame(makeFrame(i, "camera1", hw_timestamp = 0.01 * i))
+        if (i >= 3):
+            aggregator.addFrame(makeFrame(i - 1, "camera2", hw_timestamp = 0.01 * (i - 3)))
+    aggregator.flush()
+    stats = aggregator.getStatistics()
+    print stats
+    assert (stats["complete"] == 10) and (stats["copied"] > 0)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
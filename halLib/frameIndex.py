@@ -0,0 +1,210 @@
+#!/usr/bin/python
+#
+## @file
+#
+# A compact binary index of the frames of a film, this is saved with
+# every film (as film_name.fidx, or film_name_camN.fidx if there is
+# more than one camera) so that dropped frames are visible and can be
+# correlated with the disk or CPU load.
+#
+# The file starts with a 32 byte header (little endian):
+#
+#   magic "HALFIDX1" (8 bytes)
+#   wall clock time when the film was started (float64)
+#   host monotonic time when the film was started (float64)
+#   record size in bytes (uint32)
+#   reserved (uint32)
+#
+# followed by a 36 byte record (see record_dtype) for each frame:
+#
+#   number - The frame number in the film (uint32).
+#   hw_number - The frame number reported by the camera driver, -1 if not available (int64).
+#   gap - The number of frames that were dropped before this frame, based on hw_number (uint32).
+#   hw_timestamp - The time stamp reported by the camera driver in seconds, NaN if not available (float64).
+#   receive_time - The host monotonic time when the frame was received in seconds (float64).
+#   interval - The time since the previous frame in seconds (float32), based on
+#              hw_timestamp if available, otherwise on receive_time.
+#
+# Add the difference between the two header times to the receive
+# times to get wall clock times.
+#
+# Hazen 10/14
+#
+
+import numpy
+import struct
+import time
+
+import camera.frame as frame
+
+## The header format.
+header_format = struct.Struct("<8sddII")
+
+## The header magic string.
+header_magic = "HALFIDX1"
+
+## The record format.
+record_dtype = numpy.dtype([("number", "<u4"),
+                            ("hw_number", "<i8"),
+                            ("gap", "<u4"),
+                            ("hw_timestamp", "<f8"),
+                            ("receive_time", "<f8"),
+                            ("interval", "<f4")])
+
+
+## readFrameIndex
+#
+# @param filename The name of the frame index file.
+#
+# @return [wall clock start time, monotonic start time, records (a numpy array of record_dtype)]
+#
+def readFrameIndex(filename):
+    fp = open(filename, "rb")
+    [magic, wall_time, monotonic_time, record_size, reserved] = header_format.unpack(fp.read(header_format.size))
+    assert (magic == header_magic), "not a frame index file " + filename
+    assert (record_size == record_dtype.itemsize), "unknown record size " + str(record_size)
+    records = numpy.fromfile(fp, dtype = record_dtype)
+    fp.close()
+    return [wall_time, monotonic_time, records]
+
+
+## FrameIndex
+#
+# Writes the frame index of one camera.
+#
+class FrameIndex():
+
+    ## __init__
+    #
+    # @param filename The name of the frame index file.
+    # @param buffer_size (Optional) The number of records to buffer before writing, default is 256.
+    #
+    def __init__(self, filename, buffer_size = 256):
+        self.buffer = numpy.zeros(buffer_size, dtype = record_dtype)
+        self.buffered = 0
+        self.dropped = 0
+        self.filename = filename
+        self.fp = open(filename, "wb")
+        self.frames = 0
+        self.gaps = 0
+        self.last_hw_number = None
+        self.last_time = None
+        self.max_interval = 0.0
+
+        self.fp.write(header_format.pack(header_magic, time.time(), frame.monotonicTime(), record_dtype.itemsize, 0))
+
+    ## addFrame
+    #
+    # @param a_frame A frame object.
+    #
+    def addFrame(self, a_frame):
+        record = self.buffer[self.buffered]
+        record["number"] = a_frame.number
+        receive_time = getattr(a_frame, "receive_time", None)
+        if receive_time is None:
+            receive_time = frame.monotonicTime()
+        record["receive_time"] = receive_time
+
+        # Dropped frames.
+        hw_number = getattr(a_frame, "hw_number", None)
+        gap = 0
+        if hw_number is None:
+            record["hw_number"] = -1
+        else:
+            record["hw_number"] = hw_number
+            if (self.last_hw_number is not None) and (hw_number > (self.last_hw_number + 1)):
+                gap = hw_number - self.last_hw_number - 1
+                self.dropped += gap
+                self.gaps += 1
+            self.last_hw_number = hw_number
+        record["gap"] = gap
+
+        # Time since the previous frame.
+        hw_timestamp = getattr(a_frame, "hw_timestamp", None)
+        if hw_timestamp is None:
+            record["hw_timestamp"] = numpy.nan
+            current_time = receive_time
+        else:
+            record["hw_timestamp"] = hw_timestamp
+            current_time = hw_timestamp
+        interval = 0.0
+        if self.last_time is not None:
+            interval = current_time - self.last_time
+            self.max_interval = max(self.max_interval, interval)
+        record["interval"] = interval
+        self.last_time = current_time
+
+        self.buffered += 1
+        self.frames += 1
+        if (self.buffered == self.buffer.size):
+            self.flush()
+
+    ## close
+    #
+    # Writes the remaining records and closes the file.
+    #
+    def close(self):
+        self.flush()
+        self.fp.close()
+
+    ## flush
+    #
+    # Writes the buffered records to the file.
+    #
+    def flush(self):
+        if (self.buffered > 0):
+            self.buffer[:self.buffered].tofile(self.fp)
+            self.buffered = 0
+
+    ## getStatistics
+    #
+    # @return [number of frames, number of dropped frames, number of gaps, maximum interval between frames (seconds)].
+    #
+    def getStatistics(self):
+        return [self.frames, self.dropped, self.gaps, self.max_interval]
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    filename = os.path.join(tempfile.gettempdir(), "test.fidx")
+    index = FrameIndex(filename, buffer_size = 7)
+    for i, hw_number in enumerate([0, 1, 2, 5, 6, 7, 10, 11]):
+        index.addFrame(frame.Frame(None, i, 0, 0, "camera1", True, hw_number = hw_number, hw_timestamp = 0.01 * hw_number))
+    index.close()
+    print index.getStatistics()
+
+    [wall_time, monotonic_time, records] = readFrameIndex(filename)
+    print time.ctime(wall_time), records.size, "records of", record_dtype.itemsize, "bytes"
+    print records["gap"], records["interval"]
+    os.remove(filename)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
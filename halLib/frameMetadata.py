@@ -0,0 +1,379 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Records per-frame meta-data (illumination powers, focus lock
+# offsets, stage positions, etc.) during filming.
+#
+# The modules add the fields that they want to record at the start
+# of the film and then set the values of these fields for each
+# (master) frame. The values are stored in pre-allocated numpy
+# structured arrays (chunks) that are written to disk by a separate
+# thread, so no file I/O happens when the frames are processed.
+#
+# The meta-data is saved in the film_name.meta file, which is in the
+# numpy .npy format and can be loaded with numpy.load(). Frames for
+# which a value was not set have NaN (floating point fields) or 0.
+# Modules can also ask for some of the fields to be exported as
+# a text file at the end of the film, e.g. the .power file.
+#
+# Usage:
+#
+#   recorder = frameMetadata.getRecorder()
+#
+#   (startFilm)
+#   recorder.addField("power", "float32", 4)
+#   recorder.addTextExport(".power", "frame 0 1 2 3", ["power"], ["%d"] + 4 * ["%.4f"])
+#
+#   (newFrame)
+#   recorder.setValue(frame.number, "power", powers)
+#
+# Hazen 10/14
+#
+
+import numpy
+import traceback
+
+from PyQt4 import QtCore
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+## The number of characters to reserve for the number of records in the .npy header.
+length_digits = 20
+
+## writeHeader
+#
+# Writes a numpy .npy (version 1.0) format header. The size of the
+# header only depends on the fields (it has room for any number of
+# records) so that it can be updated at the end of the film. It is
+# rounded up to a multiple of 64 bytes so that the data is aligned.
+#
+# @param fp The file pointer.
+# @param dtype The numpy dtype of the records.
+# @param length The number of records.
+#
+def writeHeader(fp, dtype, length):
+    header = "{'descr': " + repr(numpy.lib.format.dtype_to_descr(dtype))
+    header += ", 'fortran_order': False, 'shape': (" + str(length) + ",), }"
+    header_size = 64 * ((len(header) - len(str(length)) + length_digits + 11 + 63)/64)
+    assert (header_size < 65536), "too many meta-data fields."
+    header = header.ljust(header_size - 11) + "\n"
+    fp.write("\x93NUMPY\x01\x00")
+    fp.write(chr((header_size - 10) % 256) + chr((header_size - 10) / 256))
+    fp.write(header)
+
+
+## FrameMetadataRecorder
+#
+# The frame meta-data recorder. The fields, chunks and exports are only
+# changed in the main thread, the thread only writes the full chunks to
+# the disk and creates the text exports at the end of the film.
+#
+class FrameMetadataRecorder(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param chunk_size (Optional) The number of frames in a chunk.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, chunk_size = 1000, parent = None):
+        QtCore.QThread.__init__(self, parent)
+
+        self.chunk = None
+        self.chunk_size = chunk_size
+        self.chunk_start = 0
+        self.dtype = None
+        self.exports = []
+        self.fields = []
+        self.film_name = False
+        self.free_chunks = []
+        self.full_chunks = []
+        self.last_row = -1
+        self.mutex = QtCore.QMutex()
+        self.running = False
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## addField
+    #
+    # Add a field to record. This must be done before the first value
+    # is set, i.e. at the start of the film.
+    #
+    # @param name The name of the field.
+    # @param dtype The numpy type of the field.
+    # @param size (Optional) The number of elements of the field, default is a scalar.
+    #
+    def addField(self, name, dtype, size = None):
+        if not self.film_name:
+            return
+        if self.dtype is not None:
+            hdebug.logText("frameMetadata: " + name + " was added after recording started, ignored.")
+            return
+        if size is None:
+            self.fields.append((name, dtype))
+        else:
+            self.fields.append((name, dtype, (size,)))
+
+    ## addTextExport
+    #
+    # Export some of the fields as a (space delimited) text file at the end of the
+    # film. The first column is always the frame number. Frames for which any of
+    # the (floating point) values were not set are not included.
+    #
+    # @param extension The extension of the text file, e.g. ".power".
+    # @param header The first line of the text file.
+    # @param fields A list of the names of the fields to export.
+    # @param formats A list of the formats of each column, e.g. ["%d", "%.4f", "%.4f"].
+    #
+    def addTextExport(self, extension, header, fields, formats):
+        if self.film_name:
+            self.exports.append([extension, header, fields, formats])
+
+    ## exportText
+    #
+    # Create the text exports.
+    #
+    # @param data The recorded meta-data.
+    #
+    def exportText(self, data):
+        for [extension, header, fields, formats] in self.exports:
+            fp = open(self.film_name + extension, "w")
+            fp.write(header + "\n")
+            if (data.size > 0):
+                columns = [data["frame"]]
+                for field in fields:
+                    columns.append(data[field].reshape((data.size, -1)))
+                values = numpy.column_stack(columns)
+                valid = numpy.all(numpy.isfinite(values), axis = 1)
+                numpy.savetxt(fp, values[valid], fmt = formats, delimiter = " ")
+            fp.close()
+
+    ## getChunk
+    #
+    # @return A chunk with all the values reset.
+    #
+    def getChunk(self):
+        self.mutex.lock()
+        if (len(self.free_chunks) > 0):
+            chunk = self.free_chunks.pop()
+        else:
+            chunk = numpy.zeros(self.chunk_size, dtype = self.dtype)
+        self.mutex.unlock()
+
+        for field in self.fields:
+            if (numpy.dtype(field[1]).kind == "f"):
+                chunk[field[0]] = numpy.nan
+            else:
+                chunk[field[0]] = 0
+        chunk["frame"] = numpy.arange(self.chunk_start, self.chunk_start + self.chunk_size)
+        return chunk
+
+    ## isRecording
+    #
+    # @return True/False if meta-data is being recorded.
+    #
+    def isRecording(self):
+        return bool(self.film_name)
+
+    ## queueChunk
+    #
+    # Give the current chunk to the thread to save.
+    #
+    # @param rows The number of rows of the chunk to save.
+    #
+    def queueChunk(self, rows):
+        self.mutex.lock()
+        self.full_chunks.append([self.chunk, rows])
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## run
+    #
+    # The thread loop, saves the chunks as they are filled. At the end of
+    # the film the header is updated with the final length and the text
+    # exports are created.
+    #
+    def run(self):
+        fp = open(self.film_name + ".meta", "wb")
+        writeHeader(fp, self.dtype, 0)
+        length = 0
+
+        while True:
+            self.mutex.lock()
+            if self.running and (len(self.full_chunks) == 0):
+                self.wait_condition.wait(self.mutex)
+            full_chunks = self.full_chunks
+            self.full_chunks = []
+            running = self.running
+            self.mutex.unlock()
+
+            for [chunk, rows] in full_chunks:
+                chunk[:rows].tofile(fp)
+                length += rows
+                self.mutex.lock()
+                self.free_chunks.append(chunk)
+                self.mutex.unlock()
+
+            if not running and (len(full_chunks) == 0):
+                break
+
+        fp.seek(0)
+        writeHeader(fp, self.dtype, length)
+        fp.close()
+
+        try:
+            self.exportText(numpy.load(self.film_name + ".meta", mmap_mode = "r"))
+        except:
+            hdebug.logText("frameMetadata: text export failed " + traceback.format_exc())
+
+    ## setValue
+    #
+    # Set the value of a field for a frame. Frames are expected to arrive in
+    # order. Values for frames in chunks that have already been saved are ignored.
+    #
+    # @param frame_number The frame number.
+    # @param name The name of the field.
+    # @param value The value of the field.
+    #
+    def setValue(self, frame_number, name, value):
+        if not self.film_name:
+            return
+        if self.dtype is None:
+            self.startRecording()
+        row = frame_number - self.chunk_start
+        if (row < 0):
+            return
+        while (row >= self.chunk_size):
+            self.queueChunk(self.chunk_size)
+            self.chunk_start += self.chunk_size
+            self.chunk = self.getChunk()
+            self.last_row = -1
+            row -= self.chunk_size
+        self.chunk[name][row] = value
+        if (row > self.last_row):
+            self.last_row = row
+
+    ## startFilm
+    #
+    # Called by HAL at the start of a film, before the modules startFilm().
+    #
+    # @param film_name The name of the film without any extensions, or False if the film is not being saved.
+    #
+    def startFilm(self, film_name):
+        self.chunk = None
+        self.chunk_start = 0
+        self.dtype = None
+        self.exports = []
+        self.fields = []
+        self.film_name = film_name
+        self.free_chunks = []
+        self.full_chunks = []
+        self.last_row = -1
+
+    ## startRecording
+    #
+    # Creates the dtype of the records from the fields and starts the thread.
+    #
+    def startRecording(self):
+        self.dtype = numpy.dtype([("frame", numpy.int64)] + self.fields)
+        self.chunk = self.getChunk()
+        self.running = True
+        self.start(QtCore.QThread.LowPriority)
+
+    ## stopFilm
+    #
+    # Called by HAL at the end of a film, after the modules stopFilm(). This
+    # waits for the thread to save the remaining meta-data.
+    #
+    def stopFilm(self):
+        if not self.film_name:
+            return
+        if self.dtype is None:
+            self.startRecording()
+        self.queueChunk(self.last_row + 1)
+
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+        self.chunk = None
+        self.film_name = False
+        self.free_chunks = []
+
+
+## The recorder that is shared by all the modules.
+recorder = None
+
+## getRecorder
+#
+# @return The frame meta-data recorder (which is created if necessary).
+#
+def getRecorder():
+    global recorder
+    if recorder is None:
+        recorder = FrameMetadataRecorder()
+    return recorder
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import time
+
+    a_recorder = FrameMetadataRecorder()
+    a_recorder.startFilm("test")
+    a_recorder.addField("power", "float32", 4)
+    a_recorder.addField("offset", "float32")
+    a_recorder.addTextExport(".power", "frame 0 1 2 3", ["power"], ["%d"] + 4 * ["%.4f"])
+
+    frames = 100000
+    powers = [0.1, 0.2, 0.3, 0.4]
+    start = time.time()
+    for i in range(frames):
+        a_recorder.setValue(i, "power", powers)
+        a_recorder.setValue(i, "offset", 0.01 * i)
+    end = time.time()
+    print "Time to record a frame: ", ((end - start)/frames), " seconds"
+
+    a_recorder.stopFilm()
+    data = numpy.load("test.meta")
+    print data.size, data[-1]
+
+    # Lots of fields.
+    a_recorder.startFilm("test")
+    for i in range(50):
+        a_recorder.addField("field" + str(i), "float64", 3)
+    for i in range(10):
+        a_recorder.setValue(i, "field49", [i, i, i])
+    a_recorder.stopFilm()
+    data = numpy.load("test.meta")
+    assert (data.size == 10) and (data["field49"][-1] == 9).all()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
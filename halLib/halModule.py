@@ -11,6 +11,51 @@ from PyQt4 import QtCore
 
 import sc_library.hdebug as hdebug
 
+
+## sendToModule
+#
+# Sends information to a single module as if it had been emitted by one
+# of the signals of a module of type hal_type. This is used by modules
+# in lazyModuleInit() so that the other modules are not disturbed.
+#
+# @param module The module to send the information to.
+# @param hal_type The module type of the sender.
+# @param name The name of the signal.
+# @param *args The arguments of the signal.
+#
+def sendToModule(module, hal_type, name, *args):
+    relay = SignalRelay()
+    module.connectSignals([[hal_type, name, relay]])
+    relay.emit(*args)
+
+
+## SignalRelay
+#
+# A stand-in for a PyQt signal that calls the connected slots directly.
+#
+class SignalRelay(object):
+
+    ## __init__
+    #
+    def __init__(self):
+        self.slots = []
+
+    ## connect
+    #
+    # @param slot The function to call when the signal is emitted.
+    #
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    ## emit
+    #
+    # @param *args The arguments of the signal.
+    #
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
 ## HalModule class.
 #
 # Provides the default functionality for a HAL module
@@ -50,6 +95,19 @@ class HalModule(object):
     def getSignals(self):
         return []
 
+    ## lazyModuleInit
+    #
+    # Called when a (lazy) module is created after start up, once the
+    # signals have been connected. This is the moduleInit() for the new
+    # module, modules should only send the new module the information
+    # that it might need to configure itself (see sendToModule()).
+    #
+    # @param module The new module.
+    #
+    @hdebug.debug
+    def lazyModuleInit(self, module):
+        pass
+
     ## loadGUISettings
     #
     # Called after initialization so that module can
@@ -67,10 +125,11 @@ class HalModule(object):
 
     ## moduleInit
     #
-    # Called only once after all the modules are instantiated and 
+    # Called once after all the modules are instantiated and 
     # have had a chance to connect signals. This exists so that 
     # modules can exchange information that other modules might need
-    # to configure themselves properly.
+    # to configure themselves properly. A (lazy) module that is
+    # created later gets this information from lazyModuleInit().
     #
     @hdebug.debug
     def moduleInit(self):
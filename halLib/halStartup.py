@@ -0,0 +1,269 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Handles starting the HAL modules.
+#
+# Creating the modules is done in (roughly) three steps:
+#
+# 1. The python modules are imported (in the GUI thread).
+#
+# 2. If a python module has a initHardware() function this is called
+#    in a worker thread. This is where a module should open any (slow)
+#    hardware such as serial ports, DLLs or cameras. The hardware of
+#    the different modules is initialized concurrently, each with
+#    its own timeout. initHardware() must not create any Qt widgets.
+#
+#    def initHardware(hardware, parameters):
+#       ...
+#       return device
+#
+#    The device (if any) is stored as hardware.device and the module
+#    is responsible for using it when it is created. If initHardware()
+#    fails or times out the module is not created.
+#
+# 3. The module objects are created (in the GUI thread). Modules that
+#    are marked as lazy in the hardware XML file, i.e.
+#
+#    <lazy type="boolean">True</lazy>
+#
+#    are not created until they are shown for the first time. This is
+#    only possible for pure display modules, i.e. modules that have a
+#    menu item and that do not need to be running when they are not
+#    visible. A module that has to receive signals or settings before
+#    it is shown (the progressions for example) must not be lazy.
+#
+# The time that each step took is recorded for each module and can
+# be printed with printReport().
+#
+# Hazen 10/14
+#
+
+import threading
+import time
+import traceback
+
+from PyQt4 import QtGui
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+import sc_library.parameters as params
+
+## The default time (in seconds) to wait for the hardware of a module to initialize.
+default_timeout = 30.0
+
+
+## HardwareThread
+#
+# Calls the initHardware() function of a python module.
+#
+class HardwareThread(threading.Thread):
+
+    ## __init__
+    #
+    # @param startup A ModuleStartup object.
+    # @param parameters The initial HAL parameters.
+    #
+    def __init__(self, startup, parameters):
+        threading.Thread.__init__(self, name = startup.hal_type)
+
+        # Don't keep HAL from quitting if the hardware never responds.
+        self.daemon = True
+
+        self.device = None
+        self.error = False
+        self.parameters = parameters
+        self.startup = startup
+
+    ## run
+    #
+    def run(self):
+        try:
+            self.device = self.startup.python_module.initHardware(self.startup.module.parameters,
+                                                                  self.parameters)
+        except:
+            self.error = traceback.format_exc()
+
+
+## ModuleStartup
+#
+# Startup information for a single module.
+#
+class ModuleStartup(object):
+
+    ## __init__
+    #
+    # @param module A module object from the hardware XML file.
+    #
+    def __init__(self, module):
+        self.create_time = 0.0
+        self.error = False
+        self.hal_type = module.hal_type
+        self.hardware_time = 0.0
+        self.import_time = 0.0
+        self.instance = None
+        self.module = module
+        self.python_module = None
+        self.status = "waiting"
+
+        self.lazy = False
+        if hasattr(module, "lazy") and module.hal_gui:
+            self.lazy = module.lazy
+
+        self.timeout = default_timeout
+        if hasattr(module, "startup_timeout"):
+            self.timeout = module.startup_timeout
+
+    ## failed
+    #
+    # @param error A string describing what went wrong.
+    #
+    def failed(self, error):
+        self.error = error
+        self.status = "failed"
+        hdebug.logText("Failed to start " + self.hal_type + ":")
+        hdebug.logText(error)
+
+    ## getTotalTime
+    #
+    # @return The total startup time of the module in seconds.
+    #
+    def getTotalTime(self):
+        return self.import_time + self.hardware_time + self.create_time
+
+    ## isOk
+    #
+    # @return True if nothing has gone wrong (yet).
+    #
+    def isOk(self):
+        return (self.error == False)
+
+
+## createModule
+#
+# Creates the module object. This must be called in the GUI thread.
+#
+# @param startup A ModuleStartup object.
+# @param parameters The initial HAL parameters.
+# @param parent The PyQt parent of the module.
+#
+# @return The module object, or None if the module could not be created.
+#
+def createModule(startup, parameters, parent):
+    if not startup.isOk():
+        return None
+    hdebug.logText("Creating: " + startup.hal_type)
+    start_time = time.time()
+    try:
+        a_class = getattr(startup.python_module, startup.module.class_name)
+        instance = a_class(startup.module.parameters, parameters, parent)
+        instance.hal_type = startup.module.hal_type
+        instance.hal_gui = startup.module.hal_gui
+        startup.instance = instance
+        startup.status = "ok"
+    except:
+        startup.failed(traceback.format_exc())
+    startup.create_time = time.time() - start_time
+    return startup.instance
+
+## importModules
+#
+# Imports the python module of each HAL module.
+#
+# @param startups A list of ModuleStartup objects.
+# @param import_fn The function to use to import a module.
+#
+def importModules(startups, import_fn):
+    for startup in startups:
+        hdebug.logText("Loading: " + startup.hal_type)
+        start_time = time.time()
+        try:
+            startup.python_module = import_fn(startup.module.module_name.strip())
+        except:
+            startup.failed(traceback.format_exc())
+        startup.import_time = time.time() - start_time
+
+## initHardware
+#
+# Calls initHardware() (if it exists) for each of the python modules,
+# all at the same time, then waits for them to finish or time out.
+# The GUI (i.e. the splash screen) is kept alive while waiting.
+#
+# @param startups A list of ModuleStartup objects.
+# @param parameters The initial HAL parameters.
+#
+def initHardware(startups, parameters):
+    threads = []
+    for startup in startups:
+        if startup.isOk() and hasattr(startup.python_module, "initHardware"):
+            hdebug.logText("Initializing hardware: " + startup.hal_type)
+            if startup.module.parameters is None:
+                startup.module.parameters = params.StormXMLObject([])
+            thread = HardwareThread(startup, parameters)
+            thread.start()
+            threads.append(thread)
+
+    start_time = time.time()
+    while (len(threads) > 0):
+        QtGui.QApplication.processEvents()
+        elapsed = time.time() - start_time
+        for thread in threads[:]:
+            startup = thread.startup
+            if not thread.isAlive():
+                threads.remove(thread)
+                startup.hardware_time = elapsed
+                if thread.error:
+                    startup.failed(thread.error)
+                else:
+                    startup.module.parameters.device = thread.device
+            elif (elapsed > startup.timeout):
+                threads.remove(thread)
+                startup.hardware_time = elapsed
+                startup.failed("hardware initialization timed out after " + str(startup.timeout) + " seconds.")
+        time.sleep(0.01)
+
+## printReport
+#
+# Prints (and logs) how long each module took to start.
+#
+# @param startups A list of ModuleStartup objects.
+#
+def printReport(startups):
+    hdebug.logText("Module startup times (seconds):")
+    hdebug.logText("  {0:20s} {1:>8s} {2:>8s} {3:>8s} {4:>8s}  {5:s}".format("module", "import", "hardware", "create", "total", "status"))
+    for startup in startups:
+        status = startup.status
+        if startup.lazy and (startup.status == "waiting"):
+            status = "deferred"
+        hdebug.logText("  {0:20s} {1:8.3f} {2:8.3f} {3:8.3f} {4:8.3f}  {5:s}".format(startup.hal_type,
+                                                                                     startup.import_time,
+                                                                                     startup.hardware_time,
+                                                                                     startup.create_time,
+                                                                                     startup.getTotalTime(),
+                                                                                     status))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -8,9 +8,19 @@
 #
 
 import copy
+import numpy
+import os
 import struct
+import threading
 import tiffwriter
 
+# Debugging
+import sc_library.hdebug as hdebug
+
+import halLib.chunkCompressor as chunkCompressor
+import halLib.frameAggregator as frameAggregator
+import halLib.frameIndex as frameIndex
+
 
 # Figure out the version of the software, if possible.
 have_git = True
@@ -20,6 +30,20 @@ except:
     print "GitPython is not installed, software version information will not be recorded."
     have_git = False
 
+# HDF5 files are only available if h5py is installed.
+have_h5py = True
+try:
+    import h5py
+except:
+    print "h5py is not installed, .hdf5 files are not available."
+    have_h5py = False
+
+## The default number of frames in a HDF5 chunk.
+default_chunk_frames = 16
+
+## The HDF5 filter mask of chunks that are written without compression (shuffle and deflate not applied).
+raw_filter_mask = 0x3
+
 software_version = "NA"
 if have_git:
     try:
@@ -52,9 +76,12 @@ def attrToString(obj, attr):
 #
 def availableFileFormats(ui_mode):
     if (ui_mode == "dual"):
-        return [".dax", ".dcf", ".spe", ".tif"]
+        formats = [".dax", ".dcf", ".spe", ".tif"]
     else:
-        return [".dax", ".spe", ".tif"]
+        formats = [".dax", ".spe", ".tif"]
+    if have_h5py:
+        formats.insert(formats.index(".spe"), ".hdf5")
+    return formats
 
 ## createFileWriter
 #
@@ -73,6 +100,8 @@ def createFileWriter(filetype, filename, parameters, cameras):
         return DaxFile(filename, parameters, cameras)
     elif (filetype == ".dcf"):
         return DualCameraFormatFile(filename, parameters, cameras)
+    elif (filetype == ".hdf5") and have_h5py:
+        return HDF5File(filename, parameters, cameras)
     elif (filetype == ".spe"):
         return SPEFile(filename, parameters, cameras)
     elif (filetype == ".tif"):
@@ -172,7 +201,9 @@ def writeInfFile(filename, filetype, number_frames, parameters, camera, stage_po
 
 ## GenericFile
 #
-# Generic file writing class
+# Generic file writing class. A frame index (see halLib/frameIndex.py)
+# is also written for each camera, the sub-classes call indexFrame()
+# for each frame that they save.
 #
 class GenericFile:
 
@@ -210,9 +241,13 @@ class GenericFile:
                 self.file_ptrs.append(open(fname, "wb"))
             self.number_frames.append(0)
 
+        self.frame_indexes = []
+        for fname in self.filenames:
+            self.frame_indexes.append(frameIndex.FrameIndex(os.path.splitext(fname)[0] + ".fidx"))
+
     ## closeFile
     #
-    # Close the file pointers (if any) and write the .inf file.
+    # Close the file pointers (if any) and the frame indexes and write the .inf file.
     #
     def closeFile(self):
         
@@ -221,6 +256,13 @@ class GenericFile:
             for fp in self.file_ptrs:
                 fp.close()
 
+        # Close the frame indexes.
+        for i, index in enumerate(self.frame_indexes):
+            index.close()
+            [frames, dropped, gaps, max_interval] = index.getStatistics()
+            if (dropped > 0):
+                hdebug.logText(self.cameras[i] + ": " + str(dropped) + " frames dropped in " + str(gaps) + " gaps, maximum interval {0:.3f}s".format(max_interval))
+
         # Write the inf files.
         for i in range(len(self.filenames)):
             if (hasattr(self.parameters, self.cameras[i])):
@@ -251,6 +293,16 @@ class GenericFile:
     def getSpotCounts(self):
         return self.spot_counts
 
+    ## indexFrame
+    #
+    # Adds a frame to the frame index of a camera.
+    #
+    # @param i The camera index.
+    # @param frame A frame object.
+    #
+    def indexFrame(self, i, frame):
+        self.frame_indexes[i].addFrame(frame)
+
     ## setLockTarget()
     #
     # @param lock_target The film's lock target.
@@ -326,15 +378,32 @@ class DaxFile(GenericFile):
                 else:
                     np_data.tofile(self.file_ptrs[i])
 
+                self.indexFrame(i, frame)
                 self.number_frames[i] += 1
 
 ## DualCameraFormatFile
 #
 # Dual camera format writing class.
 #
-# This is just the dax format with the camera number encoded into the
-# first pixel of the image. It is useful because writing two files
-# at once at a high data rate can overwhelm a hard-drive.
+# The frames from both cameras are saved in a single file, which is
+# useful because writing two files at once at a high data rate can
+# overwhelm a hard-drive. The frames are matched into synchronized
+# sets (see halLib/frameAggregator.py) and the frames of each set are
+# saved one after the other. By default the frames are matched by
+# frame number, this can be changed with the (optional) parameters:
+#
+#   dcf_match_by   "number" or "timestamp".
+#   dcf_tolerance  The maximum difference in frame number / time stamp (seconds).
+#
+# Each frame is preceded by an 8 byte header:
+#
+#   camera index (uint16, 0 = camera1, 1 = camera2)
+#   reserved (uint16, always 0)
+#   frame number (uint32)
+#
+# The header and the frame data have the same endian-ness. Frames
+# without a match in the other camera are also saved, the number
+# of these is recorded in the log.
 # 
 class DualCameraFormatFile(GenericFile):
 
@@ -345,27 +414,273 @@ class DualCameraFormatFile(GenericFile):
     # @param cameras A python array of camera names, e.g. ["camera1"].
     #
     def __init__(self, filename, parameters, cameras):
-        GenericFile.__init__(self, filename, parameters, cameras, "dax")
+        GenericFile.__init__(self, filename, parameters, cameras, "dcf", want_fp = False)
+        match_by = "number"
+        if hasattr(parameters, "dcf_match_by"):
+            match_by = parameters.dcf_match_by
+        tolerance = 0
+        if hasattr(parameters, "dcf_tolerance"):
+            tolerance = parameters.dcf_tolerance
+        self.aggregator = frameAggregator.FrameAggregator(cameras, match_by = match_by, tolerance = tolerance)
+        self.file_ptrs.append(open(filename + ".dcf", "wb"))
+        self.lock = threading.Lock()
+        if parameters.want_big_endian:
+            self.header = struct.Struct(">HHI")
+        else:
+            self.header = struct.Struct("<HHI")
+
+    ## closeFile
+    #
+    # Saves the frames that are still waiting to be matched, then closes the file.
+    #
+    def closeFile(self):
+        self.lock.acquire()
+        for frame_set in self.aggregator.flush():
+            self.saveFrameSet(frame_set)
+        stats = self.aggregator.getStatistics()
+        if (stats["incomplete"] > 0):
+            hdebug.logText("dcf: " + str(stats["incomplete"]) + " unmatched frames " + str(stats["unmatched"]))
+        self.lock.release()
+        GenericFile.closeFile(self)
+
+    ## saveFrame
+    #
+    # Saves a frame. The frame is held until the matching frame from
+    # the other camera arrives. This can be called from the control
+    # threads of both cameras.
+    #
+    # @param frame A frame object.
+    #
+    def saveFrame(self, frame):
+        self.lock.acquire()
+        for frame_set in self.aggregator.addFrame(frame):
+            self.saveFrameSet(frame_set)
+        self.lock.release()
+
+    ## saveFrameSet
+    #
+    # Saves the frames in a frame set, i.e. the frames from both cameras that were taken at the same time.
+    #
+    # @param frame_set A list of frame objects (or None for a missing frame).
+    #
+    def saveFrameSet(self, frame_set):
+        fp = self.file_ptrs[0]
+        for i, frame in enumerate(frame_set):
+            if frame is not None:
+                fp.write(self.header.pack(i, 0, frame.number))
+                np_data = frame.getData()
+                if self.parameters.want_big_endian:
+                    np_data.byteswap().tofile(fp)
+                else:
+                    np_data.tofile(fp)
+                self.indexFrame(i, frame)
+                self.number_frames[i] += 1
+
+## HDF5File
+#
+# HDF5 file writing class.
+#
+# The frames of each camera are saved in the dataset "cameraN/frames",
+# which has the shape (frames, y pixels, x pixels). The dataset is
+# chunked with chunks of (by default) 16 whole frames, this can be
+# changed with the hdf5_chunk_frames parameter. Frames are collected
+# in a buffer and written a chunk at a time.
+#
+# Each camera group also has the per-frame datasets "number" (the
+# camera frame number) and "timestamp" in seconds. The time stamp is
+# the camera (hardware) time stamp if the camera provides one,
+# otherwise it is the time at which HAL received the frame from the
+# camera on the host monotonic clock (frame.receive_time, see
+# camera/frame.py, time.clock() on windows and time.time() on other
+# platforms). When the file is closed the per-frame meta-data that was
+# recorded by the modules (illumination powers, focus lock offsets,
+# stage position, etc., see halLib/frameMetadata.py) is added to the
+# "metadata" group, one dataset per field, indexed by frame number.
+# The film information (stage position, lock target, spot counts,
+# etc.) is saved as attributes of the file.
+#
+# If the hdf5_compression parameter is True the frames are compressed
+# with the HDF5 shuffle and deflate filters. The chunks are compressed
+# in parallel by a pool of threads (see halLib/chunkCompressor.py) and
+# written to the file as they are finished. If the threads fall behind
+# the chunks are written without compression, so compression never
+# slows the film down. The file can be read with any HDF5 reader.
+#
+# An .inf file and a frame index are also written as for the other formats.
+#
+class HDF5File(GenericFile):
+
+    ## __init__
+    #
+    # @param filename The name of the movie file (without an extension).
+    # @param parameters A parameters object.
+    # @param cameras A python array of camera names, e.g. ["camera1"].
+    #
+    def __init__(self, filename, parameters, cameras):
+        GenericFile.__init__(self, filename, parameters, cameras, "hdf5", want_fp = False)
+        self.filename = filename
+        self.h5_file = h5py.File(filename + ".hdf5", "w")
+
+        self.chunk_frames = default_chunk_frames
+        if hasattr(parameters, "hdf5_chunk_frames"):
+            self.chunk_frames = parameters.hdf5_chunk_frames
+
+        self.compressor = None
+        compression = {}
+        if hasattr(parameters, "hdf5_compression") and parameters.hdf5_compression:
+            self.compressor = chunkCompressor.ChunkCompressor()
+            compression = {"shuffle" : True,
+                           "compression" : "gzip",
+                           "compression_opts" : self.compressor.level}
+
+        self.buffers = []
+        self.buffer_frames = []
+        self.datasets = []
+        self.free_buffers = []
+        self.numbers = []
+        self.timestamps = []
+        for camera in cameras:
+            [x_pixels, y_pixels] = getCameraSize(parameters, camera)
+            group = self.h5_file.create_group(camera)
+            self.datasets.append(group.create_dataset("frames",
+                                                      shape = (0, y_pixels, x_pixels),
+                                                      maxshape = (None, y_pixels, x_pixels),
+                                                      chunks = (self.chunk_frames, y_pixels, x_pixels),
+                                                      dtype = numpy.uint16,
+                                                      **compression))
+            self.numbers.append(group.create_dataset("number", shape = (0,), maxshape = (None,), dtype = numpy.int64))
+            self.timestamps.append(group.create_dataset("timestamp", shape = (0,), maxshape = (None,), dtype = numpy.float64))
+            self.buffers.append([numpy.empty((self.chunk_frames, y_pixels * x_pixels), dtype = numpy.uint16),
+                                 numpy.zeros(self.chunk_frames, dtype = numpy.int64),
+                                 numpy.zeros(self.chunk_frames, dtype = numpy.float64)])
+            self.buffer_frames.append(0)
+            self.free_buffers.append([])
+
+    ## closeFile
+    #
+    # Writes the remaining frames and the meta-data, then closes the file.
+    #
+    def closeFile(self):
+        for i in range(len(self.cameras)):
+            self.writeBuffer(i)
+        if self.compressor is not None:
+            self.writeCompressed(True)
+            self.compressor.close()
+            [ratio, throughput, uncompressed] = self.compressor.getStatistics()
+            hdebug.logText("hdf5: compression ratio {0:.2f}, {1:.1f} MB/s, {2:.1%} of the chunks not compressed".format(ratio, throughput, uncompressed))
+            self.h5_file.attrs["compression_ratio"] = ratio
+
+        # Film information.
+        attrs = self.h5_file.attrs
+        attrs["software_version"] = software_version
+        attrs["parameters_file"] = str(self.parameters.parameters_file)
+        attrs["shutters_file"] = str(self.parameters.shutters)
+        attrs["stage_position"] = numpy.array(self.stage_position, dtype = numpy.float64)
+
+        # The lock target is "NA" if the focus lock is not locked, or "failed"
+        # if it could not be read, these are saved as NaN.
+        try:
+            attrs["lock_target"] = float(self.lock_target)
+        except (TypeError, ValueError):
+            attrs["lock_target"] = float("nan")
+        attrs["spot_counts"] = str(self.spot_counts)
+        attrs["notes"] = str(self.parameters.notes)
+
+        # Per-frame meta-data.
+        if os.path.exists(self.filename + ".meta"):
+            try:
+                data = numpy.load(self.filename + ".meta", mmap_mode = "r")
+                group = self.h5_file.create_group("metadata")
+                for name in data.dtype.names:
+                    group.create_dataset(name, data = data[name])
+            except:
+                hdebug.logText("hdf5: could not add the meta-data.")
+
+        self.h5_file.close()
+        GenericFile.closeFile(self)
+
+    ## getCompressionStatistics
+    #
+    # @return [compression ratio, throughput (MB/s), fraction of the chunks that were not compressed], or None if the film is not compressed.
+    #
+    def getCompressionStatistics(self):
+        if self.compressor is not None:
+            return self.compressor.getStatistics()
+        return None
 
     ## saveFrame
     #
-    # Saves a frame. In this format the camera information (i.e. which
-    # camera the frame is from) is encoded into the first pixel of the picture.
+    # Adds the frame to the buffer of the camera, the buffer is written
+    # to the file when it contains a whole chunk.
     #
     # @param frame A frame object.
     #
     def saveFrame(self, frame):
-        #camera_int = int(frame.which_camera[6:])-1
-        np_data = frame.getData().copy()
-        np_data[0] = int(frame.which_camera[6:])-1
-        #temp = chr(camera_int) + chr(camera_int) + copy.copy(frame.data[2:])
-        if self.parameters.want_big_endian:
-            np_data.tofile(self.file_ptrs[0]).byteswap()
-            #self.file_ptrs[0].write(fconv.LEtoBE(temp))
+        i = self.cameras.index(frame.which_camera)
+        [images, numbers, timestamps] = self.buffers[i]
+        j = self.buffer_frames[i]
+        images[j] = frame.getData()
+        numbers[j] = frame.number
+        if frame.hw_timestamp is not None:
+            timestamps[j] = frame.hw_timestamp
         else:
-            np_data.tofile(self.file_ptrs[0])
-            #self.file_ptrs[0].write(temp)
-        self.number_frames[0] += 1
+            timestamps[j] = frame.receive_time
+        self.indexFrame(i, frame)
+        self.buffer_frames[i] += 1
+        self.number_frames[i] += 1
+        if (self.buffer_frames[i] == self.chunk_frames):
+            self.writeBuffer(i)
+
+    ## totalFilmSize
+    #
+    # @return The total size of the film saved so far in mega-bytes.
+    #
+    def totalFilmSize(self):
+        if self.compressor is not None:
+            return self.compressor.getSize() * 0.000000953674
+        return GenericFile.totalFilmSize(self)
+
+    ## writeBuffer
+    #
+    # Writes the frames in the buffer of a camera to the file.
+    #
+    # @param i The camera index.
+    #
+    def writeBuffer(self, i):
+        n = self.buffer_frames[i]
+        if (n == 0):
+            return
+        [images, numbers, timestamps] = self.buffers[i]
+        dataset = self.datasets[i]
+        start = dataset.shape[0]
+        dataset.resize(start + n, axis = 0)
+        if (self.compressor is not None) and (n == self.chunk_frames):
+            self.writeCompressed(False)
+            if self.compressor.compress([i, start], images):
+                if (len(self.free_buffers[i]) > 0):
+                    self.buffers[i][0] = self.free_buffers[i].pop()
+                else:
+                    self.buffers[i][0] = numpy.empty_like(images)
+            else:
+                dataset.id.write_direct_chunk((start, 0, 0), images.tostring(), raw_filter_mask)
+                self.compressor.addRaw(images.nbytes)
+        else:
+            dataset[start:start+n] = images[:n].reshape((n, dataset.shape[1], dataset.shape[2]))
+        for [buffer, dset] in [[numbers, self.numbers[i]], [timestamps, self.timestamps[i]]]:
+            dset.resize(start + n, axis = 0)
+            dset[start:start+n] = buffer[:n]
+        self.buffer_frames[i] = 0
+
+    ## writeCompressed
+    #
+    # Writes the chunks that have been compressed to the file.
+    #
+    # @param wait Wait for all the chunks to be compressed.
+    #
+    def writeCompressed(self, wait):
+        for [[i, start], images, compressed] in self.compressor.getResults(wait):
+            self.datasets[i].id.write_direct_chunk((start, 0, 0), compressed)
+            self.free_buffers[i].append(images)
 
 ## SPEFile
 #
@@ -407,6 +722,7 @@ class SPEFile(GenericFile):
                 np_data.tofile(self.file_ptrs[i])
                 #self.file_ptrs[i].write(frame.data)
                 
+                self.indexFrame(i, frame)
                 self.number_frames[i] += 1
 
     ## closeFile
@@ -457,6 +773,7 @@ class TIFFile(GenericFile):
                 [x_pixels, y_pixels] = getCameraSize(self.parameters, self.cameras[i])
                 self.tif_writers[i].addFrame(frame.getData(), x_pixels, y_pixels)
 
+                self.indexFrame(i, frame)
                 self.number_frames[i] += 1
 
     ## closeFile
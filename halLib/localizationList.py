@@ -0,0 +1,291 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Saves the localizations that are found by the spot counter during a
+# film (as film_name.locs), so that a quick-look reconstruction and the
+# number of localizations per frame are available as soon as the film
+# is finished, without analyzing the film again.
+#
+# The localizations are collected in pre-allocated numpy arrays
+# (chunks) that are written to disk by a separate thread, so no file
+# I/O happens when the localizations are added.
+#
+# The file starts with a 32 byte header (little endian):
+#
+#   magic "HALLOCS1" (8 bytes)
+#   number of localizations (uint64)
+#   offset of the frame index in bytes (uint64)
+#   number of frames in the frame index (uint32)
+#   reserved (uint32)
+#
+# followed by the localizations (see record_dtype) in the order in
+# which the frames were analyzed and then by the frame index (see
+# index_dtype), which has an entry for every frame that was analyzed.
+# Frames that the spot counter did not have time to analyze are not in
+# the index. The x and y positions are in camera pixels and the color
+# is the index of the color of the frame in the shutter sequence, the
+# colors are numbered in the order in which they first appear in the
+# sequence (frames without a color in the sequence also have an index).
+#
+# Hazen 10/14
+#
+
+import numpy
+import struct
+
+from PyQt4 import QtCore
+
+## The header format.
+header_format = struct.Struct("<8sQQII")
+
+## The header magic string.
+header_magic = "HALLOCS1"
+
+## The frame index format.
+index_dtype = numpy.dtype([("frame", "<u4"),
+                           ("camera", "<u1"),
+                           ("color", "<u2"),
+                           ("first", "<u8"),
+                           ("count", "<u4")])
+
+## The localization format.
+record_dtype = numpy.dtype([("frame", "<u4"),
+                            ("x", "<f4"),
+                            ("y", "<f4"),
+                            ("camera", "<u1"),
+                            ("color", "<u2")])
+
+
+## densityCurve
+#
+# @param index The frame index.
+# @param camera (Optional) The camera index, default is 0.
+#
+# @return [frame numbers, number of localizations in each frame] of the frames of the camera that were analyzed, sorted by frame number.
+#
+def densityCurve(index, camera = 0):
+    index = index[index["camera"] == camera]
+    order = numpy.argsort(index["frame"], kind = "mergesort")
+    return [index["frame"][order], index["count"][order]]
+
+## readLocalizations
+#
+# @param filename The name of the localizations file.
+#
+# @return [localizations (a numpy array of record_dtype), frame index (a numpy array of index_dtype)].
+#
+def readLocalizations(filename):
+    fp = open(filename, "rb")
+    [magic, number, index_offset, index_length, reserved] = header_format.unpack(fp.read(header_format.size))
+    assert (magic == header_magic), "not a localizations file " + filename
+    records = numpy.fromfile(fp, dtype = record_dtype, count = number)
+    fp.seek(index_offset)
+    index = numpy.fromfile(fp, dtype = index_dtype, count = index_length)
+    fp.close()
+    return [records, index]
+
+## reconstruct
+#
+# @param records The localizations.
+# @param x_size The x size of the camera in pixels.
+# @param y_size The y size of the camera in pixels.
+# @param scale (Optional) The number of reconstruction pixels per camera pixel, default is 4.
+# @param camera (Optional) The camera index, default is 0.
+#
+# @return The reconstruction (a 2D numpy array of localization counts).
+#
+def reconstruct(records, x_size, y_size, scale = 4, camera = 0):
+    records = records[records["camera"] == camera]
+    [image, y_edges, x_edges] = numpy.histogram2d(records["y"],
+                                                  records["x"],
+                                                  bins = [y_size * scale, x_size * scale],
+                                                  range = [[0, y_size], [0, x_size]])
+    return image
+
+
+## LocalizationWriter
+#
+# Writes the localizations of a film. The chunks and the frame index
+# are only changed in the main thread, the thread only writes the full
+# chunks to the disk and adds the frame index at the end of the film.
+#
+class LocalizationWriter(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param filename The name of the localizations file.
+    # @param chunk_size (Optional) The number of localizations in a chunk, default is 65536.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, filename, chunk_size = 65536, parent = None):
+        QtCore.QThread.__init__(self, parent)
+
+        self.chunk = numpy.zeros(chunk_size, dtype = record_dtype)
+        self.chunk_size = chunk_size
+        self.filename = filename
+        self.free_chunks = []
+        self.full_chunks = []
+        self.index = []
+        self.mutex = QtCore.QMutex()
+        self.number = 0
+        self.row = 0
+        self.running = True
+        self.wait_condition = QtCore.QWaitCondition()
+
+        self.start(QtCore.QThread.LowPriority)
+
+    ## addLocalizations
+    #
+    # @param frame_number The frame number.
+    # @param camera The camera index (0 = camera1, 1 = camera2).
+    # @param color The index of the color of the frame.
+    # @param x_locs The x positions of the localizations.
+    # @param y_locs The y positions of the localizations.
+    # @param spots The number of localizations.
+    #
+    def addLocalizations(self, frame_number, camera, color, x_locs, y_locs, spots):
+        self.index.append((frame_number, camera, color, self.number, spots))
+        self.number += spots
+        x_locs = numpy.array(x_locs[:spots], dtype = numpy.float32)
+        y_locs = numpy.array(y_locs[:spots], dtype = numpy.float32)
+        start = 0
+        while (start < spots):
+            n = min(spots - start, self.chunk_size - self.row)
+            rows = self.chunk[self.row:self.row+n]
+            rows["frame"] = frame_number
+            rows["x"] = x_locs[start:start+n]
+            rows["y"] = y_locs[start:start+n]
+            rows["camera"] = camera
+            rows["color"] = color
+            self.row += n
+            start += n
+            if (self.row == self.chunk_size):
+                self.queueChunk(self.row)
+
+    ## close
+    #
+    # Waits for the thread to save the remaining localizations and the frame index.
+    #
+    def close(self):
+        if (self.row > 0):
+            self.queueChunk(self.row)
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+    ## getNumber
+    #
+    # @return The number of localizations.
+    #
+    def getNumber(self):
+        return self.number
+
+    ## queueChunk
+    #
+    # Give the current chunk to the thread to save.
+    #
+    # @param rows The number of rows of the chunk to save.
+    #
+    def queueChunk(self, rows):
+        self.mutex.lock()
+        self.full_chunks.append([self.chunk, rows])
+        if (len(self.free_chunks) > 0):
+            self.chunk = self.free_chunks.pop()
+        else:
+            self.chunk = numpy.zeros(self.chunk_size, dtype = record_dtype)
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+        self.row = 0
+
+    ## run
+    #
+    # The thread loop, saves the chunks as they are filled. At the end of
+    # the film the frame index is added and the header is updated.
+    #
+    def run(self):
+        fp = open(self.filename, "wb")
+        fp.write(header_format.pack(header_magic, 0, header_format.size, 0, 0))
+        number = 0
+
+        while True:
+            self.mutex.lock()
+            if self.running and (len(self.full_chunks) == 0):
+                self.wait_condition.wait(self.mutex)
+            full_chunks = self.full_chunks
+            self.full_chunks = []
+            running = self.running
+            self.mutex.unlock()
+
+            for [chunk, rows] in full_chunks:
+                chunk[:rows].tofile(fp)
+                number += rows
+                self.mutex.lock()
+                self.free_chunks.append(chunk)
+                self.mutex.unlock()
+
+            if not running and (len(full_chunks) == 0):
+                break
+
+        index_offset = fp.tell()
+        numpy.array(self.index, dtype = index_dtype).tofile(fp)
+        fp.seek(0)
+        fp.write(header_format.pack(header_magic, number, index_offset, len(self.index), 0))
+        fp.close()
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    filename = os.path.join(tempfile.gettempdir(), "test.locs")
+    writer = LocalizationWriter(filename, chunk_size = 100)
+    for i in range(50):
+        spots = i % 7
+        x_locs = numpy.random.uniform(0, 256, 1000)
+        y_locs = numpy.random.uniform(0, 256, 1000)
+        writer.addLocalizations(i, i % 2, i * 37, x_locs, y_locs, spots)
+    writer.close()
+
+    [records, index] = readLocalizations(filename)
+    print records.size, "localizations,", index.size, "frames"
+    assert (records.size == writer.getNumber())
+    for entry in index:
+        frames = records["frame"][entry["first"]:entry["first"]+entry["count"]]
+        assert (frames == entry["frame"]).all()
+        assert (entry["color"] == entry["frame"] * 37)
+        assert (records["color"][entry["first"]:entry["first"]+entry["count"]] == entry["color"]).all()
+    print densityCurve(index, camera = 1)
+    print reconstruct(records, 256, 256).sum()
+    os.remove(filename)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Measures the (x, y) shift of an image relative to a reference image
+# with FFT phase correlation.
+#
+# The images are decimated (binned), the mean is subtracted and a Hann
+# window is applied before the FFT to reduce the edge effects. The
+# normalized cross power spectrum is transformed back and the position
+# of the peak is the shift. The position of the peak is refined to
+# sub-pixel accuracy by calculating the correlation on a finer grid
+# around the peak with a matrix multiply DFT of the cross power
+# spectrum (Guizar-Sicairos et al., Optics Letters 33, 156, 2008). The
+# quality of the estimate is the height of the peak
+# in units of the standard deviation of the correlation.
+#
+# Hazen 10/14
+#
+
+import numpy
+
+
+## decimate
+#
+# @param image A 2D numpy array.
+# @param factor The binning factor.
+#
+# @return The image binned by factor x factor as a numpy.float32 array (the edges are cropped if necessary).
+#
+def decimate(image, factor):
+    image = image.astype(numpy.float32)
+    if (factor == 1):
+        return image
+    h = image.shape[0]/factor
+    w = image.shape[1]/factor
+    return image[:h*factor, :w*factor].reshape((h, factor, w, factor)).sum(axis = 3).sum(axis = 1)
+
+## upsampledCorrelation
+#
+# Calculates the correlation on a grid of points around a point with
+# a matrix multiply DFT of the cross power spectrum. The columns that
+# are not in the (rfft2) spectrum are the complex conjugates of the
+# columns that are, so they are included by doubling the weight of
+# these columns and taking the real part.
+#
+# @param spectrum The cross power spectrum (as returned by numpy.fft.rfft2).
+# @param shape The shape of the correlation.
+# @param y The y position of the center of the grid.
+# @param x The x position of the center of the grid.
+# @param offsets The offsets of the grid points from the center in pixels.
+#
+# @return The correlation at the grid points, a 2D numpy array of size offsets x offsets.
+#
+def upsampledCorrelation(spectrum, shape, y, x, offsets):
+    [h, w] = shape
+    weights = 2.0 * numpy.ones(spectrum.shape[1])
+    weights[0] = 1.0
+    if ((w % 2) == 0):
+        weights[-1] = 1.0
+    ky = numpy.fft.fftfreq(h)
+    kx = numpy.arange(spectrum.shape[1])/float(w)
+    ey = numpy.exp(2.0j * numpy.pi * numpy.outer(y + offsets, ky))
+    ex = numpy.exp(2.0j * numpy.pi * numpy.outer(kx, x + offsets)) * weights[:,None]
+    return numpy.real(numpy.dot(numpy.dot(ey, spectrum), ex))
+
+
+## PhaseCorrelator
+#
+# Holds the (transformed) reference image.
+#
+class PhaseCorrelator():
+
+    ## __init__
+    #
+    # @param reference The reference image, a 2D numpy array.
+    # @param decimation (Optional) The binning factor, default is 1.
+    # @param upsampling (Optional) The number of steps per (decimated) pixel of the sub-pixel search, default is 20.
+    #
+    def __init__(self, reference, decimation = 1, upsampling = 20):
+        self.decimation = decimation
+        self.offsets = numpy.arange(-upsampling, upsampling + 1)/float(upsampling)
+        shape = decimate(reference, decimation).shape
+        self.window = numpy.outer(numpy.hanning(shape[0]), numpy.hanning(shape[1])).astype(numpy.float32)
+        self.reference_fft = numpy.conj(self.transform(reference))
+
+    ## getShift
+    #
+    # @param image The image, a 2D numpy array the same size as the reference.
+    #
+    # @return [dx, dy, quality], the shift of the image relative to the reference in (undecimated) pixels.
+    #
+    def getShift(self, image):
+        cross_power = self.transform(image) * self.reference_fft
+        cross_power /= numpy.abs(cross_power) + 1.0e-9
+        correlation = numpy.fft.irfft2(cross_power, self.window.shape)
+
+        [h, w] = correlation.shape
+        [py, px] = numpy.unravel_index(numpy.argmax(correlation), correlation.shape)
+        peak = correlation[py, px]
+        fine = upsampledCorrelation(cross_power, [h, w], py, px, self.offsets)
+        [fy, fx] = numpy.unravel_index(numpy.argmax(fine), fine.shape)
+        dx = px + self.offsets[fx]
+        dy = py + self.offsets[fy]
+
+        # Shifts of more than half the image size are negative shifts.
+        if (dx > 0.5 * w):
+            dx -= w
+        if (dy > 0.5 * h):
+            dy -= h
+
+        std = numpy.std(correlation)
+        quality = 0.0
+        if (std > 0.0):
+            quality = (peak - numpy.mean(correlation))/std
+
+        return [dx * self.decimation, dy * self.decimation, quality]
+
+    ## transform
+    #
+    # @param image A 2D numpy array.
+    #
+    # @return The FFT of the decimated and windowed image.
+    #
+    def transform(self, image):
+        image = decimate(image, self.decimation)
+        image -= numpy.mean(image)
+        return numpy.fft.rfft2(image * self.window)
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import time
+
+    # A sum of 100 frames of sparse blinking spots.
+    def sumFrames(positions, dx, dy, size = 256):
+        image = numpy.zeros((size, size), dtype = numpy.float32)
+        for i in range(100):
+            on = positions[numpy.random.uniform(size = positions.shape[0]) < 0.05]
+            xi = numpy.round(on[:,0] + dx).astype(numpy.int) % size
+            yi = numpy.round(on[:,1] + dy).astype(numpy.int) % size
+            numpy.add.at(image, (yi, xi), 500.0)
+        return image + numpy.random.poisson(100.0 * 100, (size, size))
+
+    # Gaussian spots at sub-pixel positions.
+    def spotImage(positions, dx, dy, size = 256, sigma = 1.5):
+        pixels = numpy.arange(size)
+        gx = numpy.exp(-(pixels[None,:] - (positions[:,0,None] + dx))**2/(2.0 * sigma * sigma))
+        gy = numpy.exp(-(pixels[None,:] - (positions[:,1,None] + dy))**2/(2.0 * sigma * sigma))
+        return 1000.0 * numpy.dot(gy.T, gx) + numpy.random.poisson(100.0, (size, size))
+
+    positions = numpy.random.uniform(0, 256, (400, 2))
+    correlator = PhaseCorrelator(sumFrames(positions, 0, 0), decimation = 2)
+    for [dx, dy] in [[0, 0], [3, -2], [-7, 12], [20, 5]]:
+        print [dx, dy], ["{0:.2f}".format(x) for x in correlator.getShift(sumFrames(positions, dx, dy))]
+
+    # Sub-pixel accuracy.
+    for decimation in [1, 2]:
+        correlator = PhaseCorrelator(spotImage(positions, 0, 0), decimation = decimation)
+        for [dx, dy] in [[0.5, -0.5], [0.25, 0.75], [-3.3, 1.6]]:
+            [mx, my, quality] = correlator.getShift(spotImage(positions, dx, dy))
+            print decimation, [dx, dy], ["{0:.2f}".format(x) for x in [mx, my]]
+            assert (abs(mx - dx) < 0.15) and (abs(my - dy) < 0.15)
+
+    start_time = time.time()
+    image = sumFrames(positions, 1, 1)
+    for i in range(100):
+        correlator.getShift(image)
+    print "{0:.2f} ms / estimate".format(10.0 * (time.time() - start_time))
+    print "noise quality {0:.2f}".format(correlator.getShift(numpy.random.poisson(100.0, (256, 256)))[2])
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Plans the order in which to visit a list of stage positions so
+# that the stage travels as little as possible.
+#
+# The order is found with the nearest neighbour heuristic and then
+# improved with 2-opt (reversing sections of the path while this
+# makes it shorter). The path starts at the current stage position
+# and does not return to it.
+#
+# Hazen 10/14
+#
+
+import numpy
+
+
+## nearestNeighbour
+#
+# @param positions A numpy array of [x, y] positions.
+# @param start The [x, y] starting position.
+#
+# @return A list of the indices of the positions, in the order in which to visit them.
+#
+def nearestNeighbour(positions, start):
+    order = []
+    current = numpy.array(start, dtype = numpy.float64)
+    visited = numpy.zeros(positions.shape[0], dtype = numpy.bool)
+    for i in range(positions.shape[0]):
+        distances = numpy.sqrt(numpy.sum((positions - current) * (positions - current), axis = 1))
+        distances[visited] = numpy.inf
+        index = int(numpy.argmin(distances))
+        order.append(index)
+        visited[index] = True
+        current = positions[index]
+    return order
+
+## pathLength
+#
+# @param positions A numpy array of [x, y] positions.
+# @param order A list of the indices of the positions.
+# @param start The [x, y] starting position.
+#
+# @return The distance travelled visiting the positions in this order.
+#
+def pathLength(positions, order, start):
+    if (len(order) == 0):
+        return 0.0
+    path = numpy.concatenate((numpy.array([start], dtype = numpy.float64), positions[order]))
+    steps = path[1:] - path[:-1]
+    return float(numpy.sum(numpy.sqrt(numpy.sum(steps * steps, axis = 1))))
+
+## planOrder
+#
+# @param positions A numpy array of [x, y] positions.
+# @param start The [x, y] starting position.
+# @param method (Optional) "file" (the order of the positions), "nearest" (nearest neighbour) or "tsp" (nearest neighbour improved with 2-opt), default is "tsp".
+#
+# @return A list of the indices of the positions, in the order in which to visit them.
+#
+def planOrder(positions, start, method = "tsp"):
+    if (method == "file"):
+        return range(positions.shape[0])
+    order = nearestNeighbour(positions, start)
+    if (method == "tsp"):
+        order = twoOpt(positions, order, start)
+    return order
+
+## twoOpt
+#
+# Improves a path by reversing sections of it while this makes it shorter.
+#
+# @param positions A numpy array of [x, y] positions.
+# @param order A list of the indices of the positions.
+# @param start The [x, y] starting position.
+# @param max_passes (Optional) The maximum number of passes through the path.
+#
+# @return The improved order.
+#
+def twoOpt(positions, order, start, max_passes = 100):
+    path = numpy.concatenate((numpy.array([start], dtype = numpy.float64), positions[order]))
+    order = numpy.array(order)
+    n = path.shape[0]
+    improved = True
+    passes = 0
+    while improved and (passes < max_passes):
+        improved = False
+        passes += 1
+
+        # Reverse path[i:j+1], this replaces the edges (i-1, i) and (j, j+1)
+        # with (i-1, j) and (i, j+1). The last position has no next edge.
+        for i in range(1, n - 1):
+            a = path[i-1]
+            b = path[i]
+            c = path[i+1:]
+            d = path[i+2:]
+            ab = numpy.sqrt(numpy.sum((a - b) * (a - b)))
+            ac = numpy.sqrt(numpy.sum((c - a) * (c - a), axis = 1))
+            delta = ac - ab
+            if (d.shape[0] > 0):
+                cd = numpy.sqrt(numpy.sum((d - c[:-1]) * (d - c[:-1]), axis = 1))
+                bd = numpy.sqrt(numpy.sum((d - b) * (d - b), axis = 1))
+                delta[:-1] += bd - cd
+            best = int(numpy.argmin(delta))
+            if (delta[best] < -1.0e-9):
+                j = i + 1 + best
+                path[i:j+1] = path[i:j+1][::-1].copy()
+                order[i-1:j] = order[i-1:j][::-1].copy()
+                improved = True
+    return order.tolist()
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    positions = numpy.random.uniform(0.0, 10000.0, (96, 2))
+    start = [0.0, 0.0]
+    for method in ["file", "nearest", "tsp"]:
+        order = planOrder(positions, start, method)
+        assert (sorted(order) == range(positions.shape[0]))
+        print method, "{0:.1f}".format(pathLength(positions, order, start))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
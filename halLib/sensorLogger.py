@@ -0,0 +1,169 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Samples slow auxiliary sensors (temperature, humidity, etc.) in
+# a separate thread. The readings are kept in a (time stamped) ring
+# buffer so that the modules can get the latest values without doing
+# any I/O when processing frames, and the readings taken during a
+# film can be saved when the film is finished.
+#
+# A sensor is any object with these two methods:
+#
+#   getFields() - Returns a list of the names of the values.
+#   read() - Returns a list of the (floating point) values.
+#
+# Hazen 10/14
+#
+
+import numpy
+import time
+import traceback
+
+from PyQt4 import QtCore
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+
+## SensorLogger
+#
+# Reads a sensor at a fixed interval.
+#
+class SensorLogger(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param sensor The sensor object.
+    # @param interval The time between readings in seconds.
+    # @param buffer_size (Optional) The number of readings to keep.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, sensor, interval, buffer_size = 10000, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.fields = sensor.getFields()
+        self.interval = interval
+        self.mutex = QtCore.QMutex()
+        self.readings = numpy.zeros((buffer_size, len(self.fields) + 1))
+        self.readings_taken = 0
+        self.running = True
+        self.sensor = sensor
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## getFields
+    #
+    # @return A list of the names of the sensor values.
+    #
+    def getFields(self):
+        return self.fields
+
+    ## getLatest
+    #
+    # @return The latest values (all NaN if the sensor has not been read yet).
+    #
+    def getLatest(self):
+        self.mutex.lock()
+        if (self.readings_taken > 0):
+            latest = self.readings[(self.readings_taken - 1) % self.readings.shape[0], 1:].copy()
+        else:
+            latest = numpy.nan * numpy.ones(len(self.fields))
+        self.mutex.unlock()
+        return latest
+
+    ## getReadings
+    #
+    # @param start_time (Optional) Only return the readings taken after this time.
+    #
+    # @return A numpy array of the readings in the buffer, in time order. The first column is the time (in seconds).
+    #
+    def getReadings(self, start_time = None):
+        self.mutex.lock()
+        size = self.readings.shape[0]
+        if (self.readings_taken > size):
+            start = self.readings_taken % size
+            readings = numpy.concatenate((self.readings[start:], self.readings[:start]))
+        else:
+            readings = self.readings[:self.readings_taken].copy()
+        self.mutex.unlock()
+        if start_time is not None:
+            readings = readings[(readings[:,0] >= start_time)]
+        return readings
+
+    ## run
+    #
+    # The thread loop.
+    #
+    def run(self):
+        while self.running:
+            try:
+                values = numpy.array(self.sensor.read(), dtype = numpy.float64)
+                assert (values.size == len(self.fields)), "expected " + str(len(self.fields)) + " values, got " + str(values.size)
+                self.mutex.lock()
+                row = self.readings[self.readings_taken % self.readings.shape[0]]
+                row[0] = time.time()
+                row[1:] = values
+                self.readings_taken += 1
+                self.mutex.unlock()
+            except:
+                hdebug.logText("sensorLogger: reading failed " + traceback.format_exc())
+
+            self.mutex.lock()
+            if self.running:
+                self.wait_condition.wait(self.mutex, int(1000.0 * self.interval))
+            self.mutex.unlock()
+
+    ## stopLogging
+    #
+    # Stops the thread.
+    #
+    def stopLogging(self):
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+
+    class TestSensor():
+        def getFields(self):
+            return ["temperature", "humidity"]
+        def read(self):
+            return [20.0 + numpy.random.normal(), 40.0]
+
+    logger = SensorLogger(TestSensor(), 0.1, buffer_size = 5)
+    logger.start()
+    time.sleep(1.0)
+    logger.stopLogging()
+    print logger.getLatest()
+    print logger.getReadings()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -0,0 +1,326 @@
+#!/usr/bin/python
+#
+## @file
+#
+# A sparse, multi-resolution image (a tile pyramid) stored on disk.
+#
+# Level 0 is the full resolution image, each following level is
+# downsampled by 2 (2 x 2 binning). Every level is divided into
+# square tiles and a tile is only created when part of an image is
+# written into it, so the image can cover a very large (and mostly
+# empty) area. Each tile is a .npy file that is memory-mapped when it
+# is used. Only the most recently used tiles are kept open, the least
+# recently used tile is closed (and flushed to disk) when there are
+# too many open tiles.
+#
+# Empty pixels are zero.
+#
+# Hazen 10/14
+#
+
+import collections
+import glob
+import json
+import numpy
+import os
+
+
+## downsample
+#
+# 2 x 2 bins an image that is at (x, y) in one level of the pyramid
+# so that it is aligned with the pixels of the next level.
+#
+# @param image A 2D numpy array.
+# @param x The x position of the image (in pixels).
+# @param y The y position of the image (in pixels).
+#
+# @return [image, x, y] in the next level, image is None if it is too small.
+#
+def downsample(image, x, y):
+    ox = x % 2
+    oy = y % 2
+    w = (image.shape[1] - ox)/2
+    h = (image.shape[0] - oy)/2
+    if (w < 1) or (h < 1):
+        return [None, 0, 0]
+    binned = image[oy:oy+2*h, ox:ox+2*w].reshape((h, 2, w, 2)).mean(axis = 3).mean(axis = 1)
+    return [binned.astype(image.dtype), (x + ox)/2, (y + oy)/2]
+
+
+## TilePyramid
+#
+# The tile pyramid, this is not thread safe.
+#
+class TilePyramid():
+
+    ## __init__
+    #
+    # If the directory already contains a pyramid then its tile size,
+    # number of levels, data type and properties are used.
+    #
+    # @param directory The directory to store the tiles in.
+    # @param tile_size (Optional) The width and height of the tiles in pixels, default is 256.
+    # @param levels (Optional) The number of levels, default is 8.
+    # @param dtype (Optional) The data type of the pixels, default is numpy.uint16.
+    # @param max_open (Optional) The maximum number of tiles to keep open, default is 256.
+    #
+    def __init__(self, directory, tile_size = 256, levels = 8, dtype = numpy.uint16, max_open = 256):
+        self.directory = directory
+        self.dtype = numpy.dtype(dtype)
+        self.levels = levels
+        self.max_open = max_open
+        self.open_tiles = collections.OrderedDict()
+        self.properties = {}
+        self.tile_size = tile_size
+        self.tiles = set()
+        self.version = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        info_file = os.path.join(directory, "pyramid.json")
+        if os.path.exists(info_file):
+            fp = open(info_file)
+            info = json.load(fp)
+            fp.close()
+            self.dtype = numpy.dtype(str(info["dtype"]))
+            self.levels = info["levels"]
+            self.properties = info["properties"]
+            self.tile_size = info["tile_size"]
+
+        for name in glob.glob(os.path.join(directory, "*.npy")):
+            try:
+                self.tiles.add(tuple(map(int, os.path.splitext(os.path.basename(name))[0].split("_"))))
+            except ValueError:
+                pass
+
+        self.saveInfo()
+
+    ## addImage
+    #
+    # Writes an image into every level of the pyramid.
+    #
+    # @param image A 2D numpy array.
+    # @param x The x position of the upper left corner of the image in level 0 pixels.
+    # @param y The y position of the upper left corner of the image in level 0 pixels.
+    #
+    def addImage(self, image, x, y):
+        x = int(round(x))
+        y = int(round(y))
+        for level in range(self.levels):
+            self.writeImage(level, image, x, y)
+            [image, x, y] = downsample(image, x, y)
+            if image is None:
+                break
+        self.version += 1
+
+    ## clear
+    #
+    # Deletes all the tiles and the properties.
+    #
+    def clear(self):
+        self.open_tiles.clear()
+        for key in self.tiles:
+            os.remove(self.getTileName(key))
+        self.properties = {}
+        self.tiles = set()
+        self.version += 1
+        self.saveInfo()
+
+    ## close
+    #
+    # Closes all the tiles (this flushes them to disk).
+    #
+    def close(self):
+        self.open_tiles.clear()
+        self.saveInfo()
+
+    ## getBounds
+    #
+    # @param level The level.
+    #
+    # @return [x, y, width, height] of the part of the level that has tiles (in the pixels of the level), or None if there are no tiles.
+    #
+    def getBounds(self, level):
+        keys = filter(lambda x: (x[0] == level), self.tiles)
+        if (len(keys) == 0):
+            return None
+        tx = map(lambda x: x[1], keys)
+        ty = map(lambda x: x[2], keys)
+        return [min(tx) * self.tile_size,
+                min(ty) * self.tile_size,
+                (max(tx) - min(tx) + 1) * self.tile_size,
+                (max(ty) - min(ty) + 1) * self.tile_size]
+
+    ## getProperty
+    #
+    # @param name The name of the property.
+    # @param default (Optional) The value to return if the property is not set.
+    #
+    # @return The value of the property.
+    #
+    def getProperty(self, name, default = None):
+        return self.properties.get(name, default)
+
+    ## getRegion
+    #
+    # @param level The level.
+    # @param x The x position of the upper left corner of the region (in the pixels of the level).
+    # @param y The y position of the upper left corner of the region (in the pixels of the level).
+    # @param width The width of the region.
+    # @param height The height of the region.
+    #
+    # @return The region as a 2D numpy array.
+    #
+    def getRegion(self, level, x, y, width, height):
+        region = numpy.zeros((height, width), dtype = self.dtype)
+        ts = self.tile_size
+        for ty in range(y/ts, (y + height - 1)/ts + 1):
+            for tx in range(x/ts, (x + width - 1)/ts + 1):
+                tile = self.getTile(level, tx, ty)
+                if tile is None:
+                    continue
+                x0 = max(x, tx * ts)
+                x1 = min(x + width, (tx + 1) * ts)
+                y0 = max(y, ty * ts)
+                y1 = min(y + height, (ty + 1) * ts)
+                region[y0-y:y1-y, x0-x:x1-x] = tile[y0-ty*ts:y1-ty*ts, x0-tx*ts:x1-tx*ts]
+        return region
+
+    ## getTile
+    #
+    # @param level The level.
+    # @param tx The x index of the tile.
+    # @param ty The y index of the tile.
+    # @param create (Optional) Create the tile if it does not exist, default is False.
+    #
+    # @return The tile as a memory-mapped numpy array, or None if it does not exist.
+    #
+    def getTile(self, level, tx, ty, create = False):
+        key = (level, tx, ty)
+        if key in self.open_tiles:
+            tile = self.open_tiles.pop(key)
+        elif key in self.tiles:
+            tile = numpy.load(self.getTileName(key), mmap_mode = "r+")
+        elif create:
+            tile = numpy.lib.format.open_memmap(self.getTileName(key),
+                                                mode = "w+",
+                                                dtype = self.dtype,
+                                                shape = (self.tile_size, self.tile_size))
+            self.tiles.add(key)
+        else:
+            return None
+
+        self.open_tiles[key] = tile
+        while (len(self.open_tiles) > self.max_open):
+            self.open_tiles.popitem(last = False)
+        return tile
+
+    ## getTileName
+    #
+    # @param key The (level, tx, ty) key of the tile.
+    #
+    # @return The name of the tile file.
+    #
+    def getTileName(self, key):
+        return os.path.join(self.directory, "{0:d}_{1:d}_{2:d}.npy".format(*key))
+
+    ## saveInfo
+    #
+    # Saves the tile size, number of levels, data type and properties of the pyramid.
+    #
+    def saveInfo(self):
+        fp = open(os.path.join(self.directory, "pyramid.json"), "w")
+        json.dump({"dtype" : self.dtype.str,
+                   "levels" : self.levels,
+                   "properties" : self.properties,
+                   "tile_size" : self.tile_size}, fp)
+        fp.close()
+
+    ## setProperty
+    #
+    # Properties (e.g. the pixel size) are saved with the pyramid.
+    #
+    # @param name The name of the property.
+    # @param value The value of the property (this must be JSON serializable).
+    #
+    def setProperty(self, name, value):
+        self.properties[name] = value
+        self.saveInfo()
+
+    ## writeImage
+    #
+    # @param level The level.
+    # @param image A 2D numpy array.
+    # @param x The x position of the upper left corner of the image (in the pixels of the level).
+    # @param y The y position of the upper left corner of the image (in the pixels of the level).
+    #
+    def writeImage(self, level, image, x, y):
+        ts = self.tile_size
+        [height, width] = image.shape
+        for ty in range(y/ts, (y + height - 1)/ts + 1):
+            for tx in range(x/ts, (x + width - 1)/ts + 1):
+                tile = self.getTile(level, tx, ty, create = True)
+                x0 = max(x, tx * ts)
+                x1 = min(x + width, (tx + 1) * ts)
+                y0 = max(y, ty * ts)
+                y1 = min(y + height, (ty + 1) * ts)
+                tile[y0-ty*ts:y1-ty*ts, x0-tx*ts:x1-tx*ts] = image[y0-y:y1-y, x0-x:x1-x]
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import time
+
+    directory = tempfile.mkdtemp()
+    pyramid = TilePyramid(directory, max_open = 64)
+    image = numpy.random.randint(1, 1000, (512, 512)).astype(numpy.uint16)
+
+    start_time = time.time()
+    for i in range(20):
+        for j in range(20):
+            pyramid.addImage(image, i * 512 - 5000, j * 512 - 5000)
+    print "{0:d} tiles, {1:.1f} ms / image".format(len(pyramid.tiles), 1000.0 * (time.time() - start_time)/400.0)
+
+    region = pyramid.getRegion(0, -5000, -5000, 512, 512)
+    assert (region == image).all()
+    region = pyramid.getRegion(1, -2500, -2500, 256, 256)
+    assert (region == downsample(image, 0, 0)[0]).all()
+    print pyramid.getBounds(0), pyramid.getBounds(pyramid.levels - 1)
+
+    pyramid.close()
+    pyramid = TilePyramid(directory, tile_size = 128)
+    assert (pyramid.tile_size == 256)
+    assert (pyramid.getRegion(0, -5000, -5000, 512, 512) == image).all()
+    pyramid.close()
+    shutil.rmtree(directory)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -24,7 +24,9 @@ import numpy
 # Hamamatsu constants.
 DCAMCAP_EVENT_FRAMEREADY = int("0x0002", 0)
 
+DCAMERR_ABORT = int("0x80000102", 0)
 DCAMERR_NOERROR = 1  # I made this one up. It seems to be the "good" result.
+DCAMERR_TIMEOUT = int("0x80000106", 0)
 
 DCAMPROP_ATTR_HASVALUETEXT = int("0x10000000", 0)
 DCAMPROP_ATTR_READABLE = int("0x00010000", 0)
@@ -226,6 +228,7 @@ class HamamatsuCamera():
         self.camera_model = getModelInfo(camera_id)
         self.debug = False
         self.frame_bytes = 0
+        self.frame_numbers = []
         self.frame_x = 0
         self.frame_y = 0
         self.last_frame_number = 0
@@ -348,11 +351,13 @@ class HamamatsuCamera():
     # This will block waiting for new frames even if 
     # there new frames available when it is called.
     #
+    # @param timeout (Optional) The maximum time to wait for new frames in milliseconds, default is to wait forever.
+    #
     # @return [frames, [frame x size, frame y size]]
     #
-    def getFrames(self):
+    def getFrames(self, timeout = DCAMWAIT_TIMEOUT_INFINITE):
         frames = []
-        for n in self.newFrames():
+        for n in self.newFrames(timeout):
 
             # Lock the frame in the camera buffer & get address.
             data_address = ctypes.c_void_p(0)
@@ -560,19 +565,27 @@ class HamamatsuCamera():
     #
     # Return a list of the ids of all the new frames since the last check.
     #
-    # This will block waiting for at least one new frame.
+    # This will block waiting for at least one new frame, or until the
+    # timeout expires in which case the list is empty. The camera frame
+    # numbers of the new frames are stored in self.frame_numbers.
+    #
+    # @param timeout (Optional) The maximum time to wait in milliseconds, default is to wait forever.
     #
     # @return [id of the first frame, .. , id of the last frame]
     #
-    def newFrames(self):
+    def newFrames(self, timeout = DCAMWAIT_TIMEOUT_INFINITE):
 
         # Wait for a new frame.
         dwait = ctypes.c_int(DCAMCAP_EVENT_FRAMEREADY)
-        checkStatus(dcam.dcam_wait(self.camera_handle,
-                                   ctypes.byref(dwait),
-                                   ctypes.c_int(DCAMWAIT_TIMEOUT_INFINITE),
-                                   None),
-                    "dcam_wait")
+        if (dcam.dcam_wait(self.camera_handle,
+                           ctypes.byref(dwait),
+                           ctypes.c_int(timeout),
+                           None) != DCAMERR_NOERROR):
+            error = ctypes.c_uint32(dcam.dcam_getlasterror(self.camera_handle, None, ctypes.c_int32(0))).value
+            if (error == DCAMERR_TIMEOUT) or (error == DCAMERR_ABORT):
+                self.frame_numbers = []
+                return []
+            checkStatus(error, "dcam_wait")
 
         # Check how many new frames there are.
         b_index = ctypes.c_int32(0)
@@ -606,6 +619,11 @@ class HamamatsuCamera():
                 new_frames.append(i+1)
         self.buffer_index = cur_buffer_index
 
+        # The camera frame count of each of the new frames. Frames that
+        # were overwritten in the buffer before they could be read show
+        # up as gaps in these numbers.
+        self.frame_numbers = range(cur_frame_number - len(new_frames), cur_frame_number)
+
         if self.debug:
             print new_frames
 
@@ -762,11 +780,13 @@ class HamamatsuCameraMR(HamamatsuCamera):
     # FIXME: It does not always seem to block? The length of frames can
     #   be zero. Are frames getting dropped? Some sort of race condition?
     #
+    # @param timeout (Optional) The maximum time to wait for new frames in milliseconds, default is to wait forever.
+    #
     # @return [frames, [frame x size, frame y size]]
     #
-    def getFrames(self):
+    def getFrames(self, timeout = DCAMWAIT_TIMEOUT_INFINITE):
         frames = []
-        for n in self.newFrames():
+        for n in self.newFrames(timeout):
             frames.append(self.hcam_data[n])
 
         return [frames, [self.frame_x, self.frame_y]]
@@ -15,23 +15,40 @@ import nationalInstruments.nicontrol as nicontrol
 
 import coherent.obis as obis
 
+## initHardware
+#
+# Opens the lasers, this is slow as they are all on serial ports. This
+# is called in a worker thread at start up (see halLib.halStartup), so
+# the queues are only created here, they are started with the widget.
+#
+# @param hardware The hardware parameters of the module.
+# @param parameters The initial HAL parameters.
+#
+# @return A dictionary of the laser command queues.
+#
+def initHardware(hardware, parameters):
+    return {"cube642" : commandQueues.QCubeThread("COM5"),
+            "cube405" : commandQueues.QCubeThread("COM4"),
+            "obis561" : commandQueues.QSerialLaserComm(obis.Obis(port="COM9"))}
+
 #
 # Illumination power control specialized for Acadia (copied from Yosemite).
 #
 class AcadiaQIlluminationControlWidget(illuminationControl.QIlluminationControlWidget):
-    def __init__(self, settings_file_name, parameters, parent = None):
+    def __init__(self, settings_file_name, parameters, laser_queues, parent = None):
         print "init Sequoia IC widget"
         # setup the AOTF communication thread
         #self.aotf_queue = commandQueues.QAOTFThread()
         #self.aotf_queue.start(QtCore.QThread.NormalPriority)
 
-        self.cube642_queue = commandQueues.QCubeThread("COM5")
+        # the laser queues are created by initHardware()
+        self.cube642_queue = laser_queues["cube642"]
         self.cube642_queue.start(QtCore.QThread.NormalPriority)
 
-        self.cube405_queue = commandQueues.QCubeThread("COM4")
+        self.cube405_queue = laser_queues["cube405"]
         self.cube405_queue.start(QtCore.QThread.NormalPriority)
 
-        self.obis561_queue = commandQueues.QSerialLaserComm(obis.Obis(port="COM9")) 
+        self.obis561_queue = laser_queues["obis561"]
         self.obis561_queue.start(QtCore.QThread.NormalPriority)
 
         # setup the Obis642 communication thread
@@ -341,8 +358,13 @@ class AIlluminationControl(illuminationControl.IlluminationControl):
     #def __init__(self, parameters, tcp_control, parent = None):
     def __init__(self, hardware, parameters, parent=None):
         illuminationControl.IlluminationControl.__init__(self, parameters, parent) #No tcp
+        if hardware and hasattr(hardware, "device"):
+            laser_queues = hardware.device
+        else:
+            laser_queues = initHardware(hardware, parameters)
         self.power_control = AcadiaQIlluminationControlWidget("illumination/acadia_illumination_control_settings.xml",
                                                               parameters,
+                                                              laser_queues,
                                                               parent = self.ui.laserBox)
         self.shutter_control = AcadiaShutterControl(self.power_control.powerToVoltage,
                                                      self.ui.laserBox)
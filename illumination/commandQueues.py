@@ -1,7 +1,11 @@
 #!/usr/bin/python
 #
 # Queues for buffering commands to various pieces
-# of hardware. These queues are based on PyQt threads.
+# of hardware. The buffered commands of each device
+# are sent by its own thread, the device reactor, so
+# a slow device does not delay the others. A reactor
+# only wakes up when there is something to do and it
+# only sends the most recent request for each channel.
 # They are currently implemented for:
 #
 # Coherent Cube405 laser connected via serial port.
@@ -13,64 +17,261 @@
 # Hazen 6/09
 #
 
+import time
+import traceback
+
 from PyQt4 import QtCore
 
+# Debugging
+import sc_library.hdebug as hdebug
+
+## QDeviceReactor
+#
+# The thread that sends the buffered requests of a device queue.
+#
+# Requests are kept in the order in which they arrived. A new request
+# for a channel that already has a request waiting replaces the
+# waiting request, so when the user drags a slider only the most recent
+# value is sent, without losing the pending requests for other channels.
+# As there is only one thread per device, requests to a device are never
+# sent at the same time.
 #
-# Remove settings that apply to the current channel. This way
-# when you move the slider and generate 100 events only the last
-# one gets acted on, but pending events for other channels are not lost.
+# The vendor libraries (serial, USB) block until a request has been
+# sent, so a single thread for all the devices would make every laser
+# wait for the slowest device. The reactor of a device sleeps on a wait
+# condition until there is a request, so an idle device costs nothing.
 #
-def removeChannelDuplicates(queue, channel):
-    final_queue = []
-    for item in queue:
-        if item[1] == channel:
-            continue
-        final_queue.append(item)
-    return final_queue
+class QDeviceReactor(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param queue The device queue.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, queue, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.mutex = QtCore.QMutex()
+        self.pending = []
+        self.queue = queue
+        self.running = False
+        self.work_condition = QtCore.QWaitCondition()
+
+    ## addCommand
+    #
+    # @param key The device channel (or None if the device only has one channel).
+    # @param args The arguments for the setAmplitude() method of the queue.
+    #
+    def addCommand(self, key, args):
+        self.mutex.lock()
+        for command in self.pending:
+            if (command[0] == key):
+                command[1] = args
+                command[2] = time.time()
+                self.queue.coalesced += 1
+                break
+        else:
+            self.pending.append([key, args, time.time()])
+        self.work_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## getDepth
+    #
+    # @return The number of requests that are waiting to be sent.
+    #
+    def getDepth(self):
+        self.mutex.lock()
+        depth = len(self.pending)
+        self.mutex.unlock()
+        return depth
+
+    ## run
+    #
+    # Sends requests as long as there are some, otherwise waits for more.
+    #
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while self.running and (len(self.pending) == 0):
+                self.work_condition.wait(self.mutex)
+            if not self.running:
+                self.mutex.unlock()
+                break
+            [key, args, request_time] = self.pending.pop(0)
+            self.mutex.unlock()
+
+            try:
+                self.queue.setAmplitude(*args)
+            except:
+                hdebug.logText("QDeviceReactor: " + self.queue.name + " request failed")
+                hdebug.logText(traceback.format_exc())
+            self.queue.addLatency(time.time() - request_time)
+
+    ## startReactor
+    #
+    # Starts the thread (if it is not already running).
+    #
+    # @param priority The priority of the thread.
+    #
+    def startReactor(self, priority):
+        self.mutex.lock()
+        start = not self.running
+        self.running = True
+        self.mutex.unlock()
+        if start:
+            self.start(priority)
+
+    ## stopReactor
+    #
+    # Discards the requests that have not been sent yet and stops the
+    # thread. This waits for a request that is being sent to finish.
+    #
+    def stopReactor(self):
+        self.mutex.lock()
+        self.pending = []
+        self.running = False
+        self.work_condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
 
 
+## DeviceQueue
 #
-# Cube communication thread.
+# The base class for buffering communication with a device. The names of
+# the sub-classes end in "Thread" for historical reasons, each device
+# queue has its own thread (a QDeviceReactor).
+#
+# Sub-classes must provide a setAmplitude() method. This is called by the
+# device reactor with the arguments of the most recent addRequest().
+#
+class DeviceQueue(object):
+
+    ## __init__
+    #
+    # @param name A name for the device (used for the statistics).
+    # @param channel_arg (Optional) The position of the channel in the arguments of addRequest(), None if the device only has one channel.
+    #
+    def __init__(self, name, channel_arg = None):
+        self.channel_arg = channel_arg
+        self.coalesced = 0
+        self.executed = 0
+        self.max_latency = 0.0
+        self.name = name
+        self.reactor = QDeviceReactor(self)
+        self.stats_mutex = QtCore.QMutex()
+        self.total_latency = 0.0
+
+    ## addLatency
+    #
+    # Called by the reactor after a request has been sent.
+    #
+    # @param latency The time between the request and the end of sending it in seconds.
+    #
+    def addLatency(self, latency):
+        self.stats_mutex.lock()
+        self.executed += 1
+        self.total_latency += latency
+        if (latency > self.max_latency):
+            self.max_latency = latency
+        self.stats_mutex.unlock()
+
+    ## addRequest
+    #
+    # Add a request to the command queue. Older requests for the
+    # same channel that have not been sent yet are discarded.
+    #
+    # @param *args The arguments for setAmplitude().
+    #
+    def addRequest(self, *args):
+        key = None
+        if self.channel_arg is not None:
+            key = args[self.channel_arg]
+        self.reactor.addCommand(key, list(args))
+
+    ## getStatistics
+    #
+    # @return A dictionary containing the queue depth, the number of sent and discarded requests and the mean and maximum latency in seconds.
+    #
+    def getStatistics(self):
+        self.stats_mutex.lock()
+        mean_latency = 0.0
+        if (self.executed > 0):
+            mean_latency = self.total_latency/float(self.executed)
+        stats = {"name" : self.name,
+                 "depth" : self.reactor.getDepth(),
+                 "executed" : self.executed,
+                 "coalesced" : self.coalesced,
+                 "mean_latency" : mean_latency,
+                 "max_latency" : self.max_latency}
+        self.stats_mutex.unlock()
+        return stats
+
+    ## setAmplitude
+    #
+    # Directly set the amplitude.
+    #
+    def setAmplitude(self, *args):
+        pass
+
+    ## start
+    #
+    # Starts handling requests.
+    #
+    # @param priority (Optional) The priority of the thread of the device, default is normal.
+    #
+    def start(self, priority = QtCore.QThread.NormalPriority):
+        self.reactor.startReactor(priority)
+
+    ## stopThread
+    #
+    # Stops handling requests. Sub-classes should call this before
+    # shutting down the device.
+    #
+    def stopThread(self):
+        self.reactor.stopReactor()
+        stats = self.getStatistics()
+        hdebug.logText("{0:s}: {1:d} requests, {2:d} discarded, latency {3:.1f}ms mean, {4:.1f}ms max".format(self.name,
+                                                                                                            stats["executed"],
+                                                                                                            stats["coalesced"],
+                                                                                                            1000.0 * stats["mean_latency"],
+                                                                                                            1000.0 * stats["max_latency"]))
+
+    ## wait
+    #
+    # For compatibility with the old QThread based queues.
+    #
+    # @return True.
+    #
+    def wait(self, msecs = None):
+        return True
+
+
+#
+# Cube communication queue.
 #
 # This "buffers" communication with a Coherent cube laser.
 #
 # All communication with a cube should go 
-# through this thread to avoid two processes trying 
+# through this queue to avoid two processes trying 
 # to talk to the laser at the same time.
 #
-class QCubeThread(QtCore.QThread):
+class QCubeThread(DeviceQueue):
     def __init__(self, port = None, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, "cube " + str(port))
         self.cube_mutex = QtCore.QMutex()
-        self.running = 1
 
-        import coherent.cube405 as cube405
-        if port:
-            self.cube = cube405.Cube405(port)
-        else:
-            self.cube = cube405.Cube405()
-        if not(self.cube.getStatus()):
-            self.cube.shutDown()
-            self.cube = 0
-
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
+        try:
+            import coherent.cube405 as cube405
+            if port:
+                self.cube = cube405.Cube405(port)
             else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    def addRequest(self, on, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, amplitude])
-        self.buffer_mutex.unlock()
+                self.cube = cube405.Cube405()
+            if not(self.cube.getStatus()):
+                self.cube.shutDown()
+                self.cube = 0
+        except:
+            hdebug.logText("QCubeThread: failed to load coherent.cube405 (" + str(port) + ").")
+            hdebug.logText(traceback.format_exc())
+            self.cube = 0
 
     def analogModulationOff(self):
         self.cube_mutex.lock()
@@ -99,29 +300,24 @@ class QCubeThread(QtCore.QThread):
         self.cube_mutex.unlock()
 
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
         if self.cube:
             self.cube.shutDown()
 
 #
-# Stradus communication thread.
+# Stradus communication queue.
 #
 # This "buffers" communication with a Stradus laser.
 #
 # All communication with the Stradus should go 
-# through this thread to avoid two processes trying 
+# through this queue to avoid two processes trying 
 # to talk to the laser at the same time.
 #
 
-class QStradusThread(QtCore.QThread):
+class QStradusThread(DeviceQueue):
     def __init__(self, port, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, "stradus " + str(port))
         self.stradus_mutex = QtCore.QMutex()
-        self.running = 1
 
         import vortran.stradus as stradus
         self.stradus = stradus.Stradus(port)
@@ -129,23 +325,6 @@ class QStradusThread(QtCore.QThread):
             self.stradus.shutDown()
             self.stradus = 0
 
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    def addRequest(self, on, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, amplitude])
-        self.buffer_mutex.unlock()
-
     def analogModulationOff(self):
         self.stradus_mutex.lock()
         if self.stradus:
@@ -188,9 +367,7 @@ class QStradusThread(QtCore.QThread):
         self.stradus_mutex.unlock()
 
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
         if self.stradus:
             print "stopThread"
             self.stradus.shutDown()
@@ -202,7 +379,7 @@ class QStradusThread(QtCore.QThread):
 #
 # This "buffers" communication with a serial device.
 #
-class QSerialComm(QtCore.QThread):
+class QSerialComm(DeviceQueue):
 
     ## __init__
     #
@@ -210,45 +387,14 @@ class QSerialComm(QtCore.QThread):
     # @param parent (Optional) The PyQt parent of this object.
     #
     def __init__(self, sdevice, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, sdevice.__class__.__name__)
         self.sdevice_mutex = QtCore.QMutex()
-        self.running = 1
 
         self.sdevice = sdevice
         if not (self.sdevice.getStatus()):
             self.sdevice.shutDown()
             self.sdevice = False
 
-    ## run
-    #
-    # Processes the most recent request in the queue, deletes all the others.
-    #
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    ## addRequest
-    #
-    # Add a request to the command queue.
-    #
-    # @param on True/False.
-    # @param amplitude The desired amplitude.
-    #
-    def addRequest(self, on, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, amplitude])
-        self.buffer_mutex.unlock()
-
     ## setAmplitude
     #
     # Directly set the amplitude.
@@ -264,9 +410,7 @@ class QSerialComm(QtCore.QThread):
     # Stop the command processing queue and shutdown the serial device.
     #
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
         if self.sdevice:
             self.sdevice.shutDown()
 
@@ -278,7 +422,7 @@ class QSerialComm(QtCore.QThread):
 # This "buffers" communication with a laser.
 #
 # All communication with the device should go 
-# through this thread to avoid two processes trying 
+# through this queue to avoid two processes trying 
 # to talk to the laser at the same time.
 #
 class QSerialLaserComm(QSerialComm):
@@ -337,29 +481,14 @@ class QSerialLaserComm(QSerialComm):
 
 #------------------------------------test thread below--------------------------------------#
 
-class QSapphTESTThread(QtCore.QThread):
+class QSapphTESTThread(DeviceQueue):
     def __init__(self, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, "sapphire")
         self.sapphire_mutex = QtCore.QMutex()
 
         import nationalInstruments.nicontrol as nicontrol
         self.nicontrol = nicontrol
         #self.addRequest(1,"PCIe-6353",0, 9.1)       # this command sets the "baseline" AOM voltage (AO0)
-        self.running = 1
-            
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
 
     def addRequest(self, on, board, channel, voltage):
         #self.buffer_mutex.lock()
@@ -391,9 +520,7 @@ class QSapphTESTThread(QtCore.QThread):
         #task.clearTask()
 
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
 ##        if self.sapphire:
 ##            print "stopThread"
 ##            self.stradus.shutDown()
@@ -403,29 +530,14 @@ class QSapphTESTThread(QtCore.QThread):
 #
 # QThorlabsLED Thread below
 #
-class QThorlabsLEDThread(QtCore.QThread):
+class QThorlabsLEDThread(DeviceQueue):
     def __init__(self, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, "thorlabs LED")
         self.sapphire_mutex = QtCore.QMutex()
 
         import nationalInstruments.nicontrol as nicontrol
         self.nicontrol = nicontrol
         #self.addRequest(1,"PCIe-6323", channel)
-        self.running = 1
-            
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
 
     def addRequest(self, on, board, channel, voltage):
         #self.buffer_mutex.lock()
@@ -449,52 +561,30 @@ class QThorlabsLEDThread(QtCore.QThread):
         #self.stradus_mutex.unlock()
 
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
 ##        if self.sapphire:
 ##            print "stopThread"
 ##            self.stradus.shutDown()
 
 
 #
-# Generic AOTF communication thread
+# Generic AOTF communication queue.
 #
 # This "buffers" communication with an AOTF, that doesn't
 # respond very quickly to requests. It sends the most recent request
-# and discards any backlog of older requests. It is necessary to
-# keep the slider moving "smoothly" when the user tries to drag it
-# up and down w/ the AOTF on.
+# (for each channel) and discards any backlog of older requests. It
+# is necessary to keep the slider moving "smoothly" when the user
+# tries to drag it up and down w/ the AOTF on.
 #
-# All communication with AOTF should go through this thread to avoid
+# All communication with AOTF should go through this queue to avoid
 # two processes trying to talk to the AOTF at the same time.
 #
-class QAOTFThread(QtCore.QThread):
+class QAOTFThread(DeviceQueue):
     def __init__(self, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
+        DeviceQueue.__init__(self, "AOTF", channel_arg = 1)
         self.aotf_mutex = QtCore.QMutex()
-        self.running = 1
         self.aotf = False
 
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, channel, amplitude] = self.buffer.pop()
-                self.buffer = removeChannelDuplicates(self.buffer, channel)
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, channel, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    def addRequest(self, on, channel, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, channel, amplitude])
-        self.buffer_mutex.unlock()
-
     def analogModulationOff(self):
         pass
 
@@ -514,16 +604,14 @@ class QAOTFThread(QtCore.QThread):
         pass
 
     def stopThread(self):
-        self.running = 0
-        while (self.isRunning()):
-            self.msleep(50)
+        DeviceQueue.stopThread(self)
         if self.aotf:
             self.aotf.shutDown()
             self.aotf = 0
 
 
 #
-# AA Opto-Electronics AOTF communication thread.
+# AA Opto-Electronics AOTF communication queue.
 #
 class QAAAOTFThread(QAOTFThread):
     def __init__(self, parent = None):
@@ -562,15 +650,19 @@ class QAAAOTFThread(QAOTFThread):
 
 
 #
-# Crystal Technologies AOTF communication thread.
+# Crystal Technologies AOTF communication queue.
 #
 class QCTAOTFThread(QAOTFThread):
     def __init__(self, parent = None):
         QAOTFThread.__init__(self, parent)
 
-        import crystalTechnologies.AOTF as AOTF
-        self.aotf = AOTF.AOTF()
-        if not(self.aotf.getStatus()):
+        try:
+            import crystalTechnologies.AOTF as AOTF
+            self.aotf = AOTF.AOTF()
+            if not(self.aotf.getStatus()):
+                self.aotf = 0
+        except:
+            print "failed to load crystalTechnologies.AOTF."
             self.aotf = 0
 
     def analogModulationOff(self):
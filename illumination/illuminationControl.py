@@ -13,6 +13,7 @@ from xml.dom import minidom, Node
 
 import qtWidgets.qtAppIcon as qtAppIcon
 
+import halLib.frameMetadata as frameMetadata
 import halLib.halModule as halModule
 import illumination.channelWidgets as channelWidgets
 import illumination.shutterControl as shutterControl
@@ -217,30 +218,22 @@ class QIlluminationControlWidget(QtGui.QWidget):
             if self.channels[i].amOn():
                 self.onOff(i,1)
 
-    ## saveHeader
+    ## getPowers
     #
-    # This adds the header line to the .power file that is recorded during filming.
+    # @return A list containing the current power of each channel.
     #
-    # @param fp The .power file's file-pointer.
+    def getPowers(self):
+        return [channel.getDisplayedAmplitude() for channel in self.channels]
+
+    ## getPowersHeader
+    #
+    # @return The header line of the .power file that is recorded during filming.
     #
-    def saveHeader(self, fp):
+    def getPowersHeader(self):
         str = "frame"
         for i in range(self.number_channels):
             str = str + " {0:d}".format(self.settings[i].channel)
-        fp.write(str + "\n")
-
-    ## savePowers
-    #
-    # This saves the current power in the .power file when a new frame is received.
-    #
-    # @param fp The .power file's file-pointer.
-    # @param frame A frame object.
-    #
-    def savePowers(self, fp, frame):
-        str = "{0:d}".format(frame)
-        for channel in self.channels:
-            str = str + " {0:.4f}".format(channel.getDisplayedAmplitude())
-        fp.write(str + "\n")
+        return str
 
     ## shutDown
     #
@@ -290,7 +283,8 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
         else:
             self.have_parent = False
 
-        self.fp = False
+        self.recorder = frameMetadata.getRecorder()
+        self.recording = False
         self.running_shutters = False
 
         # UI setup
@@ -351,6 +345,8 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
                 signal[2].connect(self.remoteSetPower)
             elif (signal[1] == "incPower"):
                 signal[2].connect(self.remoteIncPower)
+            elif (signal[1] == "newProgression"):
+                signal[2].connect(self.handleNewProgression)
 
             elif (signal[1] == "commMessage"):
                 signal[2].connect(self.handleCommMessage)
@@ -392,6 +388,34 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
         elif (m_type == "incPower"):
             self.remoteIncPower(m_data[0], m_data[1])
 
+        # Compile the shutter sequence of the next film in advance.
+        elif (m_type == "preStageShutters"):
+            self.shutter_control.precompileXML(m_data[0])
+
+    ## handleNewProgression
+    #
+    # Called at the start of filming when a power progression is used.
+    # If the shutters are running, and the shutter control can do it,
+    # the progression is merged into the shutter waveforms and the
+    # shutters are restarted with the new waveforms. The channels
+    # that are handled this way are added to the progression's list
+    # of hardware channels.
+    #
+    # This only works if the illumination control is started before the
+    # progression control, i.e. it comes first in the hardware XML file.
+    #
+    # @param progression A progressionControl.ProgressionTable object.
+    #
+    @hdebug.debug
+    def handleNewProgression(self, progression):
+        if self.running_shutters:
+            hardware_channels = self.shutter_control.setProgression(progression)
+            if (len(hardware_channels) > 0):
+                self.shutter_control.stopFilm()
+                self.shutter_control.setup()
+                self.shutter_control.startFilm()
+                progression.hardware_channels = hardware_channels
+
     ## handleOk
     #
     # Hide the dialog box.
@@ -412,6 +436,16 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
     def handleQuit(self, bool):
         self.close()
 
+    ## lazyModuleInit
+    #
+    # Sends the channel names to a module that was created after start up.
+    #
+    # @param module The new module.
+    #
+    @hdebug.debug
+    def lazyModuleInit(self, module):
+        halModule.sendToModule(module, self.hal_type, "channelNames", self.power_control.getChannelNames())
+
     ## manualControl
     #
     # Calls QIlluminationControl's manualControl method.
@@ -428,16 +462,16 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
 
     ## newFrame
     #
-    # Handles new frames. If there is a open file and the frame
-    # is a master frame then this calls QIlluminationControl's
-    # savePowers method.
+    # Handles new frames. If the powers are being recorded and the
+    # frame is a master frame then the current powers are added to
+    # the frame meta-data.
     #
     # @param frame A camera.Frame object
     # @param filming True/False if we are currently filming.
     #
     def newFrame(self, frame, filming):
-        if self.fp and frame.master:
-            self.power_control.savePowers(self.fp, frame.number)
+        if self.recording and frame.master:
+            self.recorder.setValue(frame.number, "power", self.power_control.getPowers())
 
     ## newParameters
     #
@@ -500,10 +534,15 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
     @hdebug.debug
     def startFilm(self, film_name, run_shutters):
 
-        # Recording the power.
+        # Recording the power, this is also saved as a .power file.
         if film_name:
-            self.fp = open(film_name + ".power", "w")
-            self.power_control.saveHeader(self.fp)
+            self.recording = True
+            n_channels = self.power_control.getNumberChannels()
+            self.recorder.addField("power", "float32", n_channels)
+            self.recorder.addTextExport(".power",
+                                        self.power_control.getPowersHeader(),
+                                        ["power"],
+                                        ["%d"] + n_channels * ["%.4f"])
 
         # Running the shutters.
         if run_shutters:
@@ -523,12 +562,11 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
     #
     @hdebug.debug
     def stopFilm(self, film_writer):
-        if self.fp:
-            self.fp.close()
-            self.fp = False
+        self.recording = False
 
         if self.running_shutters:
             self.shutter_control.stopFilm()
+            self.shutter_control.clearProgression()
 
             # aotf cleanup
             channels_used = self.shutter_control.getChannelsUsed()
@@ -7,6 +7,9 @@
 # Hazen 02/14
 #
 
+import numpy
+import os
+import traceback
 from PyQt4 import QtCore
 
 #from xml.dom import minidom, Node
@@ -14,6 +17,36 @@ import xml.etree.ElementTree as ElementTree
 
 import sc_library.hdebug as hdebug
 
+## PrecompileThread
+#
+# The thread that ShutterControl.precompileXML() uses to compile a shutter sequence.
+#
+class PrecompileThread(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param shutter_control The ShutterControl object.
+    # @param shutters_file The name of the shutter sequence xml file.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, shutter_control, shutters_file, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.precompiled = None
+        self.shutter_control = shutter_control
+        self.shutters_file = shutters_file
+
+    ## run
+    #
+    # Compiles the file, self.precompiled is [key, compiled sequence] if this worked.
+    #
+    def run(self):
+        try:
+            key = self.shutter_control.getCompiledKey(self.shutters_file)
+            self.precompiled = [key, self.shutter_control.compileXML(self.shutters_file)]
+        except:
+            hdebug.logText("failed to precompile shutter file " + self.shutters_file + " " + traceback.format_exc())
+
+
 ## ShutterControl
 #
 # Base class for shutter control.
@@ -40,10 +73,22 @@ class ShutterControl(QtCore.QObject):
         QtCore.QObject.__init__(self, parent)
         self.powerToVoltage = powerToVoltage
 
+        self.cycle_waveforms = None
         self.kinetic_value = 1.0
         self.oversampling_default = 100
         self.number_channels = 0
 
+        # Sub-classes whose waveforms set the power of the channels (i.e.
+        # analog waveforms) can set this to True to have the power
+        # progressions merged into the waveforms.
+        self.hardware_progressions = False
+
+        # The maximum length of the (merged) waveform of a single channel.
+        self.max_waveform_len = 1000000
+
+        # A shutter sequence that was compiled in advance by precompileXML().
+        self.precompile_thread = None
+
     ## cleanup
     #
     # Cleanup after filming.
@@ -52,57 +97,51 @@ class ShutterControl(QtCore.QObject):
     def cleanup(self):
         pass
 
-    ## getChannelsUsed
-    #
-    # Returns which channels are used in the current shutter sequence.
-    #
-    # @return A python array of channel indices.
-    #
-    @hdebug.debug
-    def getChannelsUsed(self):
-        return self.channels_used
-
-    ## newParameters
+    ## clearProgression
     #
-    # @param parameters A parameters object.
+    # Restores the shutter sequence waveforms if they were
+    # changed by setProgression().
     #
-    @hdebug.debug
-    def newParameters(self, parameters):
-        self.kinetic_value = parameters.kinetic_value
+    def clearProgression(self):
+        if self.cycle_waveforms is not None:
+            self.waveforms = self.cycle_waveforms
+            self.waveform_len = self.frames * self.oversampling
+            self.cycle_waveforms = None
 
-    ## parseXML
+    ## compileXML
     #
-    # This parses a XML file that defines a shutter sequence.
+    # This parses a XML file that defines a shutter sequence. The current
+    # shutter sequence is not changed, so this can also be called from a
+    # different thread (see precompileXML()).
     #
     # @param shutters_file The name of the shutter sequence xml file.
     #
-    @hdebug.debug
-    def parseXML(self, shutters_file):
-        self.channels_used = []
-        self.colors = []
-        self.frames = 0
-        self.waveforms = []
-        self.waveform_len = 0
+    # @return A dictionary containing the shutter sequence.
+    #
+    def compileXML(self, shutters_file):
+        channels_used = []
+        colors = []
+        waveforms = []
 
         # Load XML shutters file.
         xml = ElementTree.parse(shutters_file).getroot()
         assert xml.tag == "repeat", shutters_file + " is not a shutters file."
 
         # Use user-specified oversampling (if requested)
-        self.oversampling = self.oversampling_default
+        oversampling = self.oversampling_default
         if xml.find("oversampling") is not None:
-            self.oversampling = int(xml.find("oversampling").text)
+            oversampling = int(xml.find("oversampling").text)
 
         # The length of the sequence.
-        self.frames = int(xml.find("frames").text)
+        frames = int(xml.find("frames").text)
 
         #
         # We store a color to associate with each frame. This can be accessed by
         # other modules (such as the spot counter) to associate a color with the
         # a particular frame when, for example, updating the STORM image.
         #
-        for i in range(self.frames):
-            self.colors.append(0)
+        for i in range(frames):
+            colors.append(0)
 
         #
         # Create waveforms.
@@ -110,9 +149,8 @@ class ShutterControl(QtCore.QObject):
         # Blank waveforms are created for all channels, even those that are not used.
         #
         for i in range(self.number_channels):
-            for j in range(self.frames * self.oversampling):
-                self.waveforms.append(self.powerToVoltage(i, 0.0))
-        self.waveform_len = self.frames * self.oversampling
+            for j in range(frames * oversampling):
+                waveforms.append(self.powerToVoltage(i, 0.0))
 
         # Add in the events.
         for event in xml.findall("event"):
@@ -127,13 +165,13 @@ class ShutterControl(QtCore.QObject):
                 elif (node.tag == "power"):
                     power = float(node.text)
                 elif (node.tag == "on"):
-                    on = int(float(node.text) * float(self.oversampling))
+                    on = int(float(node.text) * float(oversampling))
                 elif (node.tag == "off"):
-                    off = int(float(node.text) * float(self.oversampling))
+                    off = int(float(node.text) * float(oversampling))
                 elif (node.tag == "color"):
                     color = []
-                    colors = node.text.split(",")
-                    for c in colors:
+                    colors_text = node.text.split(",")
+                    for c in colors_text:
                         x = int(c)
                         if x < 0:
                             x = 0
@@ -142,31 +180,111 @@ class ShutterControl(QtCore.QObject):
                         color.append(x)
             if (channel != -1) and (channel < self.number_channels):
                 assert on >= 0, "on out of range: " + str(on) + " " + str(channel)
-                assert on <= self.frames * self.oversampling, "on out of range: " + str(on) + " " + str(channel)
+                assert on <= frames * oversampling, "on out of range: " + str(on) + " " + str(channel)
                 assert off >= 0, "off out of range: " + str(on) + " " + str(channel)
-                assert off <= self.frames * self.oversampling, "off out of range: " + str(on) + " " + str(channel)
+                assert off <= frames * oversampling, "off out of range: " + str(on) + " " + str(channel)
 
                 # Channel waveform setup.
-                if channel not in self.channels_used:
-                    self.channels_used.append(channel)
+                if channel not in channels_used:
+                    channels_used.append(channel)
                 i = on
                 voltage = self.powerToVoltage(channel, power)
                 while i < off:
-                    self.waveforms[channel * self.frames * self.oversampling + i] = voltage
+                    waveforms[channel * frames * oversampling + i] = voltage
                     i += 1
 
                 # Color information setup.
                 if color:
-                    color_start = int(round(float(on)/float(self.oversampling)))
-                    color_end = int(round(float(off)/float(self.oversampling)))
+                    color_start = int(round(float(on)/float(oversampling)))
+                    color_end = int(round(float(off)/float(oversampling)))
                     i = color_start
                     while i < color_end:
-                        self.colors[i] = color
+                        colors[i] = color
                         i += 1
 
+        return {"channels_used" : channels_used,
+                "colors" : colors,
+                "frames" : frames,
+                "oversampling" : oversampling,
+                "waveform_len" : frames * oversampling,
+                "waveforms" : waveforms}
+
+    ## getChannelsUsed
+    #
+    # Returns which channels are used in the current shutter sequence.
+    #
+    # @return A python array of channel indices.
+    #
+    @hdebug.debug
+    def getChannelsUsed(self):
+        return self.channels_used
+
+    ## getCompiledKey
+    #
+    # @param shutters_file The name of the shutter sequence xml file.
+    #
+    # @return The key of the file in the compiled shutter sequences cache.
+    #
+    def getCompiledKey(self, shutters_file):
+        return [os.path.abspath(shutters_file), os.path.getmtime(shutters_file)]
+
+    ## newParameters
+    #
+    # @param parameters A parameters object.
+    #
+    @hdebug.debug
+    def newParameters(self, parameters):
+        self.kinetic_value = parameters.kinetic_value
+
+    ## parseXML
+    #
+    # Changes the current shutter sequence to the one in a XML file. If the
+    # file was compiled by precompileXML() (and has not changed since) then
+    # that version is used.
+    #
+    # @param shutters_file The name of the shutter sequence xml file.
+    #
+    @hdebug.debug
+    def parseXML(self, shutters_file):
+        precompiled = None
+        if self.precompile_thread is not None:
+            self.precompile_thread.wait()
+            precompiled = self.precompile_thread.precompiled
+            self.precompile_thread = None
+
+        compiled = None
+        if (precompiled is not None) and os.path.exists(shutters_file):
+            if (precompiled[0] == self.getCompiledKey(shutters_file)):
+                compiled = precompiled[1]
+        if compiled is None:
+            compiled = self.compileXML(shutters_file)
+
+        self.channels_used = compiled["channels_used"]
+        self.colors = compiled["colors"]
+        self.cycle_waveforms = None
+        self.frames = compiled["frames"]
+        self.oversampling = compiled["oversampling"]
+        self.waveforms = compiled["waveforms"]
+        self.waveform_len = compiled["waveform_len"]
+
         self.newColors.emit(self.colors)
         self.newCycleLength.emit(self.frames)
 
+    ## precompileXML
+    #
+    # Compiles a shutter sequence in a separate thread so that it is ready
+    # when it is needed (e.g. while the previous film is being taken). Only
+    # the most recent file is kept.
+    #
+    # @param shutters_file The name of the shutter sequence xml file.
+    #
+    @hdebug.debug
+    def precompileXML(self, shutters_file):
+        if self.precompile_thread is not None:
+            self.precompile_thread.wait()
+        self.precompile_thread = PrecompileThread(self, shutters_file)
+        self.precompile_thread.start(QtCore.QThread.LowPriority)
+
     ## prepare
     #
     # Called before setup to properly set the state of the hardware.
@@ -189,6 +307,54 @@ class ShutterControl(QtCore.QObject):
     def setup(self):
         pass
 
+    ## setProgression
+    #
+    # Merges a power progression into the shutter waveforms, so that
+    # the power changes are timed by the hardware. This is only done
+    # if the sub-class supports it and the length of the film is known.
+    # The shutter sequence is repeated for the length of the film, and
+    # the waveform of each channel that is used by both is scaled by
+    # the ratio of the power in each frame to the maximum power.
+    #
+    # The sub-class setup() method should use a counter length of
+    # frames * oversampling, not waveform_len, as the waveforms are
+    # now longer than the shutter sequence.
+    #
+    # @param progression A progressionControl.ProgressionTable object.
+    #
+    # @return A list of the channels whose power is now controlled by the waveforms.
+    #
+    @hdebug.debug
+    def setProgression(self, progression):
+        self.clearProgression()
+        if not self.hardware_progressions or not progression.fixed_length or (self.frames == 0):
+            return []
+
+        film_frames = progression.getFrames()
+        cycles = (film_frames + self.frames - 1)/self.frames
+        waveform_len = cycles * self.frames * self.oversampling
+        if (waveform_len > self.max_waveform_len):
+            hdebug.logText("Progression is too long for the shutter waveforms, using software timing.")
+            return []
+
+        channels = []
+        max_powers = progression.getMaxPowers()
+        waveforms = numpy.array(self.waveforms).reshape((self.number_channels, self.waveform_len))
+        waveforms = numpy.tile(waveforms, (1, cycles))
+        for i in progression.getActiveChannels():
+            if (i in self.channels_used) and (i < self.number_channels) and (max_powers[i] > 0.0):
+                powers = numpy.ones(cycles * self.frames)
+                powers[:film_frames] = progression.table[:film_frames,i]/max_powers[i]
+                v0 = self.powerToVoltage(i, 0.0)
+                waveforms[i] = v0 + (waveforms[i] - v0) * numpy.repeat(powers, self.oversampling)
+                channels.append(int(i))
+
+        if (len(channels) > 0):
+            self.cycle_waveforms = self.waveforms
+            self.waveforms = waveforms.flatten().tolist()
+            self.waveform_len = waveform_len
+        return channels
+
     ## shutDown
     #
     # Called to shutdown the hardware prior to the program exitting.
@@ -16,13 +16,14 @@ import nationalInstruments.nicontrol as nicontrol
 import illumination.shutterControl as shutterControl
 
 class AShutterControl(shutterControl.ShutterControl):
-    def __init__(self, powerToVoltage):
+    def __init__(self, powerToVoltage, parent = None):
+        shutterControl.ShutterControl.__init__(self, powerToVoltage, parent)
         self.ct_task = 0
         self.wv_task = 0
         self.board = "PCI-6722"
         self.oversampling = 100
         self.number_channels = 7
-        shutterControl.ShutterControl.__init__(self, powerToVoltage)
+        self.hardware_progressions = True
 
     def cleanup(self):
         if self.ct_task:
@@ -31,13 +32,13 @@ class AShutterControl(shutterControl.ShutterControl):
             self.ct_task = 0
             self.wv_task = 0
 
-    def setup(self, kinetic_cycle_time):
+    def setup(self):
         assert self.ct_task == 0, "Attempt to call setup without first calling cleanup."
         #
         # the counter runs slightly faster than the camera so that it is ready
         # to catch the next camera "fire" immediately after the end of the cycle.
         #
-        frequency = (1.001/kinetic_cycle_time) * float(self.oversampling)
+        frequency = (1.001/self.kinetic_value) * float(self.oversampling)
 
         # set up the analog channels
         self.wv_task = nicontrol.WaveformOutput(self.board, 0)
@@ -47,9 +48,11 @@ class AShutterControl(shutterControl.ShutterControl):
         # set up the waveform
         self.wv_task.setWaveform(self.waveforms, frequency)
 
-        # set up the counter
+        # set up the counter, this is retriggered by the camera at the
+        # start of each cycle, so the counter length is the length of a
+        # cycle even if a power progression was merged into the waveforms.
         self.ct_task = nicontrol.CounterOutput(self.board, 0, frequency, 0.5)
-        self.ct_task.setCounter(self.waveform_len)
+        self.ct_task.setCounter(self.frames * self.oversampling)
         self.ct_task.setTrigger(0)
 
     def startFilm(self):
@@ -0,0 +1,669 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Builds a mosaic of the sample while HAL is running.
+#
+# When recording is enabled, frames from the camera are placed in a
+# halLib.tilePyramid on disk at the current stage position. A frame
+# is only added when the stage is not moving (the last two stage
+# positions were the same) and at most once per interval, so at most
+# a few images are written per second. The frames are oriented as in
+# the camera display and the stage position is converted to the
+# display orientation with the inverse of the stage control Translator
+# transform (which converts displacements in the display to stage
+# displacements). The center of the frame is placed at the stage
+# position. The frames are written into the pyramid (which takes a
+# while for large frames) in a separate thread.
+#
+# The mosaic view only reads the tiles of the level of the pyramid
+# that matches the current zoom, so panning and zooming only ever
+# touch the (few) tiles that are visible. The view is not updated
+# while the thread is writing a frame. Pan by dragging, zoom with the
+# mouse wheel and double click to move the stage to a position.
+#
+# Hardware XML parameters (all optional):
+#
+#   camera - The camera to use, default is "camera1".
+#   directory - The directory to store the tiles in, default is the "mosaic" sub-directory of the data directory.
+#   interval - The minimum time between frames in seconds, default is 0.5.
+#   levels - The number of levels of the pyramid, default is 8.
+#   max_open - The maximum number of tiles to keep open, default is 256.
+#   tile_size - The size of the tiles in pixels, default is 256.
+#
+# The size of the pixels of the mosaic is the (binned) pixel size
+# of the camera (the nm_per_pixel parameter) when the mosaic was
+# started. Frames with a different pixel size are re-scaled.
+#
+# Hazen 10/14
+#
+
+import math
+import numpy
+import os
+import time
+
+from PyQt4 import QtCore, QtGui
+
+import halLib.halModule as halModule
+import halLib.tilePyramid as tilePyramid
+import qtWidgets.qtAppIcon as qtAppIcon
+import stagecontrol.stageControl as stageControl
+
+import sc_library.tcpControl as tcpControl
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+
+## MosaicView
+#
+# Displays (part of) a tile pyramid.
+#
+class MosaicView(QtGui.QWidget):
+    positionClicked = QtCore.pyqtSignal(float, float)
+
+    ## __init__
+    #
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parent = None):
+        QtGui.QWidget.__init__(self, parent)
+        self.center_x = 0.0
+        self.center_y = 0.0
+        self.drag_start = None
+        self.field_of_view = None
+        self.image = None
+        self.image_data = None
+        self.image_key = None
+        self.image_rect = None
+        self.mutex = None
+        self.pyramid = None
+        self.scale = 1.0
+
+        self.setMinimumSize(400, 400)
+        self.setMouseTracking(False)
+
+    ## fitView
+    #
+    # Zoom so that all of the mosaic is visible.
+    #
+    def fitView(self):
+        if self.pyramid is None:
+            return
+        self.mutex.lock()
+        bounds = self.pyramid.getBounds(0)
+        self.mutex.unlock()
+        if bounds is None:
+            return
+        [x, y, w, h] = bounds
+        self.center_x = x + 0.5 * w
+        self.center_y = y + 0.5 * h
+        self.scale = min(float(self.width())/float(w), float(self.height())/float(h))
+        self.update()
+
+    ## getLevel
+    #
+    # @return The level of the pyramid that matches the current zoom.
+    #
+    def getLevel(self):
+        level = int(math.floor(math.log(1.0/self.scale, 2.0)))
+        return max(0, min(self.pyramid.levels - 1, level))
+
+    ## mouseDoubleClickEvent
+    #
+    # @param event A PyQt mouse event.
+    #
+    def mouseDoubleClickEvent(self, event):
+        [x, y] = self.screenToMosaic(event.x(), event.y())
+        self.positionClicked.emit(x, y)
+
+    ## mouseMoveEvent
+    #
+    # Pan the view.
+    #
+    # @param event A PyQt mouse event.
+    #
+    def mouseMoveEvent(self, event):
+        if self.drag_start is not None:
+            [x, y, center_x, center_y] = self.drag_start
+            self.center_x = center_x - (event.x() - x)/self.scale
+            self.center_y = center_y - (event.y() - y)/self.scale
+            self.update()
+
+    ## mousePressEvent
+    #
+    # @param event A PyQt mouse event.
+    #
+    def mousePressEvent(self, event):
+        if (event.button() == QtCore.Qt.LeftButton):
+            self.drag_start = [event.x(), event.y(), self.center_x, self.center_y]
+
+    ## mouseReleaseEvent
+    #
+    # @param event A PyQt mouse event.
+    #
+    def mouseReleaseEvent(self, event):
+        self.drag_start = None
+
+    ## paintEvent
+    #
+    # @param event A PyQt paint event.
+    #
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.black)
+        if self.pyramid is None:
+            return
+
+        self.renderImage()
+        if self.image is not None:
+            painter.drawImage(self.image_rect, self.image)
+
+        if self.field_of_view is not None:
+            [x, y, w, h] = self.field_of_view
+            [sx, sy] = self.mosaicToScreen(x, y)
+            painter.setPen(QtGui.QColor(255, 0, 0))
+            painter.drawRect(QtCore.QRectF(sx, sy, w * self.scale, h * self.scale))
+
+    ## mosaicToScreen
+    #
+    # @param x The x position in the mosaic (in level 0 pixels).
+    # @param y The y position in the mosaic (in level 0 pixels).
+    #
+    # @return [x, y] in widget coordinates.
+    #
+    def mosaicToScreen(self, x, y):
+        return [(x - self.center_x) * self.scale + 0.5 * self.width(),
+                (y - self.center_y) * self.scale + 0.5 * self.height()]
+
+    ## renderImage
+    #
+    # Converts the visible part of the level of the pyramid that matches the
+    # current zoom into a QImage. The QImage is only made again when the
+    # visible tiles or the pyramid changed. If the pyramid is being written
+    # the previous QImage is used (the view is updated again when the
+    # frame has been added).
+    #
+    def renderImage(self):
+        level = self.getLevel()
+        size = 2 ** level
+        [x0, y0] = self.screenToMosaic(0, 0)
+        [x1, y1] = self.screenToMosaic(self.width(), self.height())
+        lx0 = int(math.floor(x0/size))
+        ly0 = int(math.floor(y0/size))
+        lw = int(math.ceil(x1/size)) - lx0 + 1
+        lh = int(math.ceil(y1/size)) - ly0 + 1
+
+        [sx, sy] = self.mosaicToScreen(lx0 * size, ly0 * size)
+        image_rect = QtCore.QRectF(sx, sy, lw * size * self.scale, lh * size * self.scale)
+
+        key = [level, lx0, ly0, lw, lh, self.pyramid.version]
+        if (key == self.image_key):
+            self.image_rect = image_rect
+            return
+
+        if not self.mutex.tryLock():
+            return
+        region = self.pyramid.getRegion(level, lx0, ly0, lw, lh)
+        self.mutex.unlock()
+        self.image_key = key
+        self.image_rect = image_rect
+
+        filled = region[(region > 0)]
+        if (filled.size == 0):
+            self.image = None
+            return
+
+        # Convert to 8 bits using the range of the visible pixels.
+        display_min = float(filled.min())
+        display_max = float(filled.max())
+        if (display_max <= display_min):
+            display_max = display_min + 1.0
+        temp = numpy.clip(255.0 * (region - display_min)/(display_max - display_min), 0.0, 255.0).astype(numpy.uint8)
+        temp[(region == 0)] = 0
+
+        # The QImage uses the memory of the numpy array so we need to keep a reference to it.
+        self.image_data = temp
+        self.image = QtGui.QImage(temp.data, temp.shape[1], temp.shape[0], temp.shape[1], QtGui.QImage.Format_Indexed8)
+        self.image.setColorTable(map(lambda x: QtGui.qRgb(x, x, x), range(256)))
+
+    ## screenToMosaic
+    #
+    # @param x The x position in widget coordinates.
+    # @param y The y position in widget coordinates.
+    #
+    # @return [x, y] in the mosaic (in level 0 pixels).
+    #
+    def screenToMosaic(self, x, y):
+        return [(x - 0.5 * self.width())/self.scale + self.center_x,
+                (y - 0.5 * self.height())/self.scale + self.center_y]
+
+    ## setFieldOfView
+    #
+    # @param field_of_view [x, y, width, height] of the camera field of view in the mosaic (in level 0 pixels).
+    #
+    def setFieldOfView(self, field_of_view):
+        self.field_of_view = field_of_view
+        self.update()
+
+    ## setPyramid
+    #
+    # @param pyramid A tilePyramid.TilePyramid object.
+    # @param mutex The QMutex that protects the pyramid.
+    #
+    def setPyramid(self, pyramid, mutex):
+        self.mutex = mutex
+        self.pyramid = pyramid
+        self.image_key = None
+        self.update()
+
+    ## wheelEvent
+    #
+    # Zoom in or out around the mouse position.
+    #
+    # @param event A PyQt wheel event.
+    #
+    def wheelEvent(self, event):
+        [x, y] = self.screenToMosaic(event.x(), event.y())
+        if (event.delta() > 0):
+            self.scale = min(8.0, 1.25 * self.scale)
+        else:
+            self.scale = max(0.5 ** (self.pyramid.levels + 1), self.scale/1.25)
+        self.center_x = x - (event.x() - 0.5 * self.width())/self.scale
+        self.center_y = y - (event.y() - 0.5 * self.height())/self.scale
+        self.update()
+
+
+## MosaicThread
+#
+# Writes the frames into the tile pyramid. The images are only added
+# in the main thread, the thread writes them into every level of the
+# pyramid. Other users of the pyramid have to lock the mutex.
+#
+class MosaicThread(QtCore.QThread):
+    imageAdded = QtCore.pyqtSignal(int)
+
+    ## __init__
+    #
+    # @param pyramid A tilePyramid.TilePyramid object.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, pyramid, parent = None):
+        QtCore.QThread.__init__(self, parent)
+
+        self.images = []
+        self.mutex = QtCore.QMutex()
+        self.pyramid = pyramid
+        self.pyramid_mutex = QtCore.QMutex()
+        self.running = True
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## addImage
+    #
+    # @param image A 2D numpy array (this is not copied).
+    # @param x The x position of the upper left corner of the image in level 0 pixels.
+    # @param y The y position of the upper left corner of the image in level 0 pixels.
+    #
+    def addImage(self, image, x, y):
+        self.mutex.lock()
+        self.images.append([image, x, y])
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## clear
+    #
+    # Discards the images that have not been added yet and deletes the mosaic.
+    #
+    def clear(self):
+        self.mutex.lock()
+        self.images = []
+        self.mutex.unlock()
+        self.pyramid_mutex.lock()
+        self.pyramid.clear()
+        self.pyramid_mutex.unlock()
+
+    ## close
+    #
+    # Waits for the thread to add the remaining images, then closes the pyramid.
+    #
+    def close(self):
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+        self.pyramid.close()
+
+    ## run
+    #
+    # The thread loop, emits an imageAdded signal with the
+    # number of tiles after every image.
+    #
+    def run(self):
+        while True:
+            self.mutex.lock()
+            if self.running and (len(self.images) == 0):
+                self.wait_condition.wait(self.mutex)
+            images = self.images
+            self.images = []
+            running = self.running
+            self.mutex.unlock()
+
+            for [image, x, y] in images:
+                self.pyramid_mutex.lock()
+                self.pyramid.addImage(image, x, y)
+                tiles = len(self.pyramid.tiles)
+                self.pyramid_mutex.unlock()
+                self.imageAdded.emit(tiles)
+
+            if not running and (len(images) == 0):
+                break
+
+
+## Mosaic
+#
+# Mosaic dialog box.
+#
+class Mosaic(QtGui.QDialog, halModule.HalModule):
+    commMessage = QtCore.pyqtSignal(object)
+
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parameters A parameters object.
+    # @param parent The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parameters, parent):
+        QtGui.QDialog.__init__(self, parent)
+        halModule.HalModule.__init__(self)
+
+        self.camera = "camera1"
+        self.camera_params = None
+        self.interval = 0.5
+        self.last_add_time = 0.0
+        self.last_position = None
+        self.parameters = None
+        self.stage_position = None
+        self.translator = stageControl.Translator()
+        self.um_per_pixel = None
+
+        directory = os.path.join(parameters.directory, "mosaic")
+        levels = 8
+        max_open = 256
+        tile_size = 256
+        if hardware:
+            if hasattr(hardware, "camera"):
+                self.camera = hardware.camera
+            if hasattr(hardware, "directory"):
+                directory = hardware.directory
+            if hasattr(hardware, "interval"):
+                self.interval = hardware.interval
+            if hasattr(hardware, "levels"):
+                levels = hardware.levels
+            if hasattr(hardware, "max_open"):
+                max_open = hardware.max_open
+            if hasattr(hardware, "tile_size"):
+                tile_size = hardware.tile_size
+
+        self.pyramid = tilePyramid.TilePyramid(directory,
+                                               tile_size = tile_size,
+                                               levels = levels,
+                                               max_open = max_open)
+        self.um_per_pixel = self.pyramid.getProperty("um_per_pixel")
+
+        self.mosaic_thread = MosaicThread(self.pyramid)
+        self.mosaic_thread.imageAdded.connect(self.handleImageAdded)
+        self.mosaic_thread.start(QtCore.QThread.LowPriority)
+
+        # UI setup
+        self.setWindowTitle(parameters.setup_name + " Mosaic")
+        self.setWindowIcon(qtAppIcon.QAppIcon())
+
+        self.view = MosaicView(self)
+        self.view.setPyramid(self.pyramid, self.mosaic_thread.pyramid_mutex)
+        self.status_label = QtGui.QLabel(directory, self)
+        self.record_check_box = QtGui.QCheckBox("Record", self)
+        self.fit_button = QtGui.QPushButton("Fit", self)
+        self.clear_button = QtGui.QPushButton("Clear", self)
+        self.ok_button = QtGui.QPushButton("Close", self)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addWidget(self.record_check_box)
+        button_layout.addWidget(self.fit_button)
+        button_layout.addWidget(self.clear_button)
+        button_layout.addStretch(1)
+        button_layout.addWidget(self.ok_button)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self.view, 1)
+        layout.addWidget(self.status_label)
+        layout.addLayout(button_layout)
+
+        self.clear_button.clicked.connect(self.handleClear)
+        self.fit_button.clicked.connect(self.handleFit)
+        self.ok_button.clicked.connect(self.handleOk)
+        self.view.positionClicked.connect(self.handlePositionClicked)
+
+        self.setModal(False)
+
+    ## addFrame
+    #
+    # Adds a frame to the mosaic at the current stage position. The
+    # frame is copied and written into the pyramid by the thread.
+    #
+    # @param frame A frame object.
+    #
+    def addFrame(self, frame):
+        frame_um = self.getFramePixelSize()
+        if self.um_per_pixel is None:
+            self.um_per_pixel = frame_um
+            self.mosaic_thread.pyramid_mutex.lock()
+            self.pyramid.setProperty("um_per_pixel", self.um_per_pixel)
+            self.mosaic_thread.pyramid_mutex.unlock()
+
+        image = self.orientImage(frame)
+        ratio = frame_um/self.um_per_pixel
+        if (abs(ratio - 1.0) > 1.0e-3):
+            rows = numpy.floor(numpy.arange(int(image.shape[0] * ratio))/ratio).astype(numpy.int)
+            cols = numpy.floor(numpy.arange(int(image.shape[1] * ratio))/ratio).astype(numpy.int)
+            image = image[rows][:, cols]
+        else:
+            image = image.copy()
+
+        [x, y] = self.stageToMosaic(self.stage_position[0], self.stage_position[1])
+        x = x/self.um_per_pixel - 0.5 * image.shape[1]
+        y = y/self.um_per_pixel - 0.5 * image.shape[0]
+        self.mosaic_thread.addImage(numpy.ascontiguousarray(image), x, y)
+        self.view.setFieldOfView([x, y, image.shape[1], image.shape[0]])
+
+    ## cleanup
+    #
+    @hdebug.debug
+    def cleanup(self):
+        self.mosaic_thread.close()
+
+    ## connectSignals
+    #
+    # @param signals An array of signals that we might be interested in connecting to.
+    #
+    @hdebug.debug
+    def connectSignals(self, signals):
+        for signal in signals:
+            if (signal[1] == "stagePosition"):
+                signal[2].connect(self.handleStagePosition)
+
+    ## getFramePixelSize
+    #
+    # @return The size of the (binned) camera pixels in microns.
+    #
+    def getFramePixelSize(self):
+        nm_per_pixel = 1000.0
+        if hasattr(self.parameters, "nm_per_pixel"):
+            nm_per_pixel = self.parameters.nm_per_pixel
+        x_bin = 1
+        if hasattr(self.camera_params, "x_bin"):
+            x_bin = self.camera_params.x_bin
+        return 0.001 * nm_per_pixel * x_bin
+
+    ## getSignals
+    #
+    # @return The signals this module provides.
+    #
+    @hdebug.debug
+    def getSignals(self):
+        return [[self.hal_type, "commMessage", self.commMessage]]
+
+    ## handleClear
+    #
+    # Delete the mosaic.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleClear(self, boolean):
+        reply = QtGui.QMessageBox.question(self,
+                                           "Warning!",
+                                           "Delete all the tiles in " + self.pyramid.directory + "?",
+                                           QtGui.QMessageBox.Yes,
+                                           QtGui.QMessageBox.No)
+        if (reply == QtGui.QMessageBox.Yes):
+            self.mosaic_thread.clear()
+            self.um_per_pixel = None
+            self.view.setFieldOfView(None)
+
+    ## handleFit
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleFit(self, boolean):
+        self.view.fitView()
+
+    ## handleImageAdded
+    #
+    # @param tiles The number of tiles in the pyramid.
+    #
+    def handleImageAdded(self, tiles):
+        self.status_label.setText("{0:d} tiles in {1:s}".format(tiles, self.pyramid.directory))
+        self.view.update()
+
+    ## handleOk
+    #
+    # Hide the window.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleOk(self, boolean):
+        self.hide()
+
+    ## handlePositionClicked
+    #
+    # Move the stage so that the position is in the center of the field of view.
+    #
+    # @param x The x position in the mosaic (in level 0 pixels).
+    # @param y The y position in the mosaic (in level 0 pixels).
+    #
+    @hdebug.debug
+    def handlePositionClicked(self, x, y):
+        if self.um_per_pixel is not None:
+            [stage_x, stage_y] = self.translator.translate(x * self.um_per_pixel, y * self.um_per_pixel)
+            self.commMessage.emit(tcpControl.TCPMessage("moveTo", [stage_x, stage_y]))
+
+    ## handleStagePosition
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    # @param stage_z The stage position in z in microns.
+    #
+    def handleStagePosition(self, stage_x, stage_y, stage_z):
+        self.last_position = self.stage_position
+        self.stage_position = [stage_x, stage_y]
+
+    ## newFrame
+    #
+    # @param frame A frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrame(self, frame, filming):
+        if self.record_check_box.isChecked() and (frame.which_camera == self.camera):
+            if (self.stage_position is not None) and (self.stage_position == self.last_position):
+                current_time = time.time()
+                if ((current_time - self.last_add_time) >= self.interval):
+                    self.last_add_time = current_time
+                    self.addFrame(frame)
+
+    ## newParameters
+    #
+    # @param parameters A parameters object.
+    #
+    @hdebug.debug
+    def newParameters(self, parameters):
+        self.parameters = parameters
+        self.translator.newParameters(parameters)
+        self.camera_params = parameters
+        if hasattr(parameters, self.camera):
+            self.camera_params = getattr(parameters, self.camera)
+
+    ## orientImage
+    #
+    # @param frame A frame object.
+    #
+    # @return The frame data oriented as in the camera display.
+    #
+    def orientImage(self, frame):
+        image_data = frame.getData().reshape((frame.image_y, frame.image_x))
+
+        if self.camera_params.flip_horizontal:
+            image_data = numpy.fliplr(image_data)
+
+        if self.camera_params.flip_vertical:
+            image_data = numpy.flipud(image_data)
+
+        if self.camera_params.transpose:
+            image_data = numpy.transpose(image_data)
+
+        return image_data
+
+    ## stageToMosaic
+    #
+    # Converts a stage position to the orientation of the camera display
+    # with the inverse of the translator transform. The transform only
+    # swaps and flips the axises so the inverse is the transpose.
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    #
+    # @return [x, y] in microns.
+    #
+    def stageToMosaic(self, stage_x, stage_y):
+        [a, c] = self.translator.translate(1.0, 0.0)
+        [b, d] = self.translator.translate(0.0, 1.0)
+        return [a * stage_x + c * stage_y, b * stage_x + d * stage_y]
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
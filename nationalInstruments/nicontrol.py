@@ -28,6 +28,7 @@ DAQmx_Val_GroupByChannel = 0
 DAQmx_Val_High = 10192
 DAQmx_Val_Hz = 10373
 DAQmx_Val_Low = 10214
+DAQmx_Val_OverwriteUnreadSamps = 10252
 DAQmx_Val_Rising = 10280
 DAQmx_Val_Volts = 10348
 DAQmx_Val_RSE = 10083
@@ -281,6 +282,22 @@ class AnalogInput(NIDAQTask):
                                                   c_long(DAQmx_Val_FiniteSamps),
                                                   c_ulonglong(self.samples)))
 
+    # Continuous acquisition into the DAQ (ring) buffer, the samples can then
+    # be read in blocks of samples with getRecentAverages() without stopping
+    # the task. Once the buffer is full the oldest samples are overwritten.
+    def configureContinuousAcquisition(self, samples, sample_rate_Hz, buffer_seconds = 1.0):
+        self.samples = samples
+        buffer_samples = max(2 * samples, int(buffer_seconds * sample_rate_Hz))
+        checkStatus(nidaqmx.DAQmxCfgSampClkTiming(self.taskHandle,
+                                                  "",
+                                                  c_double(sample_rate_Hz),
+                                                  c_long(DAQmx_Val_Rising),
+                                                  c_long(DAQmx_Val_ContSamps),
+                                                  c_ulonglong(buffer_samples)))
+        checkStatus(nidaqmx.DAQmxCfgInputBuffer(self.taskHandle, c_ulong(buffer_samples)))
+        checkStatus(nidaqmx.DAQmxSetReadOverWrite(self.taskHandle, c_long(DAQmx_Val_OverwriteUnreadSamps)))
+        self.data = numpy.zeros((self.channels, self.samples))
+
     def getData(self):
         # allocate space to store the data.
         c_data_type = c_double * (self.samples * self.channels)
@@ -298,6 +315,30 @@ class AnalogInput(NIDAQTask):
         assert c_samples_read.value == self.samples, "Failed to read the right number of samples " + str(c_samples_read.value) + " " + str(self.samples)
         return data
 
+    # Returns the average of the next block of samples (of a continuous
+    # acquisition) for each channel, so every sample is only used once. If
+    # more than one block of samples is waiting in the buffer the older
+    # samples are skipped, so the average is always of the newest samples.
+    # This blocks (in DAQmx) until the samples have been acquired.
+    def getRecentAverages(self, timeout = 1.0):
+        available = c_ulong(0)
+        checkStatus(nidaqmx.DAQmxGetReadAvailSampPerChan(self.taskHandle, byref(available)))
+        skip = max(0, available.value - self.samples)
+        if (skip > 0):
+            checkStatus(nidaqmx.DAQmxSetReadOffset(self.taskHandle, c_long(skip)))
+        c_samples_read = c_long(0)
+        checkStatus(nidaqmx.DAQmxReadAnalogF64(self.taskHandle,
+                                               c_long(self.samples),
+                                               c_double(timeout),
+                                               c_long(DAQmx_Val_GroupByChannel),
+                                               self.data.ctypes.data_as(POINTER(c_double)),
+                                               c_ulong(self.channels*self.samples),
+                                               byref(c_samples_read),
+                                               c_long(0)))
+        if (skip > 0):
+            checkStatus(nidaqmx.DAQmxSetReadOffset(self.taskHandle, c_long(0)))
+        return numpy.mean(self.data, axis = 1)
+
 
 #
 # Counter output class
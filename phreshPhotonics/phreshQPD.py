@@ -24,9 +24,18 @@ else:
 #
 # PhreshQPD interface class.
 #
+# By default the QPD is sampled continuously and each scan returns the
+# average of the next update_samples samples (5ms at 100kHz), so each
+# sample is only used in one scan and the readings are not delayed by
+# averaging over older samples. With continuous = False each scan
+# starts the acquisition, waits for samples samples (50ms) and stops
+# it again.
+#
 class PhreshQPD:
-    def __init__(self, samples = 5000, sample_rate_Hz = 100000):
+    def __init__(self, samples = 5000, sample_rate_Hz = 100000, continuous = True, update_samples = 500):
+        self.continuous = continuous
         self.samples = samples
+        self.update_samples = update_samples
 
     def collectData(self):
         # Collect the data.
@@ -36,7 +45,31 @@ class PhreshQPD:
 
         return data
 
+    def configureTask(self, sample_rate_Hz):
+        if self.continuous:
+            self.qpd_task.configureContinuousAcquisition(self.update_samples, sample_rate_Hz)
+            self.qpd_task.startTask()
+        else:
+            self.qpd_task.configureAcquisition(self.samples, sample_rate_Hz)
+
+    def getAverages(self, channels):
+        if self.continuous:
+            return self.qpd_task.getRecentAverages()
+
+        data = self.collectData()
+
+        # Compute the average using C helper library (for speed purposes).
+        average_type = ctypes.c_double * channels
+        average = average_type()
+        averager.averager(ctypes.byref(data), 
+                          ctypes.byref(average), 
+                          ctypes.c_int(self.samples),
+                          ctypes.c_int(channels))
+        return average
+
     def shutDown(self):
+        if self.continuous:
+            self.qpd_task.stopTask()
         self.qpd_task.clearTask()
 
 
@@ -49,23 +82,15 @@ class PhreshQPD:
 #  Y diff - AI channel 2
 #
 class PhreshQPDSTORM3(PhreshQPD):
-    def __init__(self, samples = 5000, sample_rate_Hz = 100000):
-        PhreshQPD.__init__(self, samples = samples, sample_rate_Hz = sample_rate_Hz)
+    def __init__(self, samples = 5000, sample_rate_Hz = 100000, continuous = True, update_samples = 500):
+        PhreshQPD.__init__(self, samples = samples, sample_rate_Hz = sample_rate_Hz, continuous = continuous, update_samples = update_samples)
         self.qpd_task = nicontrol.AnalogInput("PCI-MIO-16E-4", 0)
         self.qpd_task.addChannel(1)
         self.qpd_task.addChannel(2)
-        self.qpd_task.configureAcquisition(samples, sample_rate_Hz)
+        self.configureTask(sample_rate_Hz)
 
     def qpdScan(self):
-        data = self.collectData()
-
-        # Compute the average using C helper library (for speed purposes).
-        average_type = ctypes.c_double * 3
-        average = average_type()
-        averager.averager(ctypes.byref(data), 
-                          ctypes.byref(average), 
-                          ctypes.c_int(self.samples),
-                          ctypes.c_int(3))
+        average = self.getAverages(3)
         return [1000.0 * average[0], 1000.0 * average[1], 1000.0 * average[2]]
 
 
@@ -77,24 +102,15 @@ class PhreshQPDSTORM3(PhreshQPD):
 #  X diff - AI channel 1
 #
 class PhreshQPDPRISM2(PhreshQPD):
-    def __init__(self, samples = 5000, sample_rate_Hz = 100000):
-        PhreshQPD.__init__(self, samples = samples, sample_rate_Hz = sample_rate_Hz)
+    def __init__(self, samples = 5000, sample_rate_Hz = 100000, continuous = True, update_samples = 500):
+        PhreshQPD.__init__(self, samples = samples, sample_rate_Hz = sample_rate_Hz, continuous = continuous, update_samples = update_samples)
 #        self.qpd_task = nicontrol.AnalogInput("PCI-MIO-16E-4", 0)
         self.qpd_task = nicontrol.AnalogInput("PCIe-6321", 0)
         self.qpd_task.addChannel(1)
-        self.qpd_task.configureAcquisition(samples, sample_rate_Hz)
+        self.configureTask(sample_rate_Hz)
 
     def qpdScan(self):
-        data = self.collectData()
-
-        # Compute the average using C helper library (for speed purposes).
-        average_type = ctypes.c_double * 2
-        average = average_type()
-        averager.averager(ctypes.byref(data), 
-                          ctypes.byref(average), 
-                          ctypes.c_int(self.samples),
-#                          ctypes.c_int(1))
-                          ctypes.c_int(2))
+        average = self.getAverages(2)
         return [1000.0 * average[0] - 25.4, 1000.0 * average[1] - 40.8, 0.0]
 #        return [1000.0 * average[0], 0.0, 0.0]
 
@@ -12,13 +12,23 @@
 # getting distracted by constantly having to adjust 
 # the laser powers.
 #
+# At the start of a film the progression is compiled into a
+# table of powers with one row for each frame and one column
+# for each channel. If possible the illumination control merges
+# the power changes into the shutter waveforms so that they are
+# timed by the DAQ card. The power of the other channels is
+# changed (in software) as the frames arrive from the camera.
+#
 # Hazen 02/14
 #
 
+import numpy
 import os
 import sys
+import traceback
 from PyQt4 import QtCore, QtGui
 
+import halLib.frameMetadata as frameMetadata
 import halLib.halModule as halModule
 import qtWidgets.qtAppIcon as qtAppIcon
 
@@ -28,6 +38,123 @@ import sc_library.hdebug as hdebug
 # UIs.
 import qtdesigner.progression_ui as progressionUi
 
+## The number of frames to compile progressions for at a time if the film length is not known.
+default_frames = 100000
+
+## loadPowerFile
+#
+# Load a powers file. This is a text file with a header line
+# followed by one line for each frame, the frame number followed
+# by the power of each channel.
+#
+# @param filename The name of the powers file.
+#
+# @return A numpy array with the power of each channel in each frame, or None if the file is empty.
+#
+def loadPowerFile(filename):
+    data = numpy.loadtxt(str(filename), skiprows = 1, ndmin = 2)
+    if (data.shape[0] > 0) and (data.shape[1] > 1):
+        return data[:,1:]
+    return None
+
+
+## ProgressionTable
+#
+# A progression compiled into a table of powers.
+#
+class ProgressionTable():
+
+    ## __init__
+    #
+    # @param active A list of True/False, one for each channel.
+    # @param table A numpy array of powers, (frames, channels). A row is the power during that frame.
+    # @param fixed_length True/False the table covers the whole film.
+    # @param extend (Optional) A function that compiles the rows of the table from the first frame to (not including) the last frame, used to compile more of a progression that does not have a fixed length.
+    #
+    def __init__(self, active, table, fixed_length, extend = None):
+        self.active = numpy.array(active, dtype = numpy.bool)
+        self.extend = extend
+        self.first = 0
+        self.fixed_length = fixed_length
+        self.table = numpy.clip(table, 0.0, 1.0)
+        self.initial = self.table[0].copy()
+
+        # The illumination control adds the channels whose power changes
+        # it has merged into the shutter waveforms to this list.
+        self.hardware_channels = []
+
+        self.current = self.initial.copy()
+
+    ## getActiveChannels
+    #
+    # @return A list of the indices of the active channels.
+    #
+    def getActiveChannels(self):
+        return map(int, numpy.nonzero(self.active)[0])
+
+    ## getChanges
+    #
+    # Finds the software timed channels whose power needs to change
+    # for the next frame.
+    #
+    # @param frame_number The number of the frame that was just acquired.
+    #
+    # @return A list of [channel, power] pairs.
+    #
+    def getChanges(self, frame_number):
+        row = self.getPowers(frame_number + 1)
+        software = self.active.copy()
+        software[self.hardware_channels] = False
+        changed = numpy.nonzero(software & (row != self.current))[0]
+        self.current[changed] = row[changed]
+        return map(lambda i: [int(i), float(row[i])], changed)
+
+    ## getFrames
+    #
+    # @return The number of frames in the table (the first frame is self.first).
+    #
+    def getFrames(self):
+        return self.table.shape[0]
+
+    ## getInitialPowers
+    #
+    # The hardware timed channels are set to their maximum power as the
+    # shutter waveforms are scaled relative to this power.
+    #
+    # @return An array containing the power of each channel at the start of the film.
+    #
+    def getInitialPowers(self):
+        powers = self.initial.copy()
+        for i in self.hardware_channels:
+            powers[i] = self.getMaxPowers()[i]
+        self.current = self.initial.copy()
+        return powers
+
+    ## getMaxPowers
+    #
+    # @return An array containing the maximum power of each channel.
+    #
+    def getMaxPowers(self):
+        return numpy.max(self.table, axis = 0)
+
+    ## getPowers
+    #
+    # If the frame is past the end of the table and the progression can
+    # be extended then the table is replaced by the next default_frames
+    # frames, starting with the previous frame as the frames are
+    # requested in order.
+    #
+    # @param frame_number The frame number.
+    #
+    # @return An array containing the power of each channel during this frame.
+    #
+    def getPowers(self, frame_number):
+        if (self.extend is not None) and (frame_number >= (self.first + self.table.shape[0])):
+            self.first = frame_number - 1
+            self.table = numpy.clip(self.extend(self.first, self.first + default_frames), 0.0, 1.0)
+        return self.table[min(max(frame_number - self.first, 0), self.table.shape[0] - 1)]
+
+
 ## Channels
 #
 # Channels class which is specialized for various
@@ -47,28 +174,16 @@ class Channels():
         self.height = 40
         self.powers = []
 
-    ## newFrame
-    #
-    # Called when we get a new frame from the camera.
-    #
-    # @param frame_number The frame number of the frame.
-    #
-    def newFrame(self, frame_number):
-        pass
-
-    ## startFilm
+    ## compile
     #
     # Called at the start of a film.
     #
-    def startFilm(self):
-        pass
-
-    ## stopFilm
+    # @param frames The number of frames in the film, or None if this is not known.
     #
-    # Called when the film is stopped.
+    # @return A ProgressionTable object, or None if there is no progression.
     #
-    def stopFilm(self):
-        pass
+    def compile(self, frames):
+        return None
 
 ## MathChannels
 #
@@ -156,30 +271,54 @@ class MathChannels(Channels):
         channel[2].setValue(inc)
         channel[3].setValue(time)
 
-    ## startFilm
+    ## compile
+    #
+    # The power of each active channel is changed every "time" frames.
+    # If the number of frames is not known the first default_frames
+    # frames are compiled and the table is extended during the film.
     #
-    # This is called when the filming starts. It returns the
-    # desired initial powers for the various channels.
+    # @param frames The number of frames in the film, or None if this is not known.
     #
-    # @return Returns an array of arrays containing the active channels and their initial powers.
+    # @return A ProgressionTable object.
     #
-    def startFilm(self):
+    def compile(self, frames):
+        settings = []
         for i, channel in enumerate(self.channels):
-            self.which_checked[i] = False
-            self.powers[i] = (float(channel[1].value()))
-            if channel[0].isChecked():
-                self.which_checked[i] = True
-        return [self.which_checked, self.powers]
+            self.which_checked[i] = channel[0].isChecked()
+            self.powers[i] = float(channel[1].value())
+            settings.append([self.powers[i], float(channel[2].value()), int(channel[3].value())])
+        extend = lambda first, last: self.compileFrames(settings, first, last)
 
-    ## stopFilm
+        if frames is None:
+            return ProgressionTable(self.which_checked, extend(0, default_frames), False, extend)
+        else:
+            return ProgressionTable(self.which_checked, extend(0, max(frames, 1)), True)
+
+    ## compileFrames
     #
-    # This is called when the film stops. It resets the powers
-    # to their initial values.
+    # @param settings A list of [initial power, increment, frames per increment] for each channel.
+    # @param first The first frame.
+    # @param last The last frame (not included).
     #
-    def stopFilm(self):
-        for i, channel in enumerate(self.channels):
-            self.powers[i] = (float(channel[1].value()))
-        return [self.which_checked, self.powers]
+    # @return A numpy array of powers, (frames, channels).
+    #
+    def compileFrames(self, settings, first, last):
+        table = numpy.zeros((last - first, len(settings)))
+        for i, [initial, inc, frames] in enumerate(settings):
+            steps = numpy.arange(first, last)/frames
+            table[:,i] = self.progression(initial, inc, steps)
+        return table
+
+    ## progression
+    #
+    # @param initial The initial power.
+    # @param inc The increment.
+    # @param steps A numpy array containing the number of increments for each frame.
+    #
+    # @return A numpy array containing the power for each frame.
+    #
+    def progression(self, initial, inc, steps):
+        return initial * numpy.ones(steps.size)
 
 ## LinearChannels
 #
@@ -202,26 +341,16 @@ class LinearChannels(MathChannels):
         for channel in self.channels:
             channel[2].setMaximum(1.0)
 
-    ## newFrame
-    #
-    # Called when we get a new frame from the camera. Returns the which
-    # channels (if any) need to have their power adjusted.
+    ## progression
     #
-    # @param frame_number The frame number of the current frame.
+    # @param initial The initial power.
+    # @param inc The amount to add to the power at each step.
+    # @param steps A numpy array containing the number of increments for each frame.
     #
-    # @return Returns an array of arrays containing the active channels and how much to increment their power by.
+    # @return A numpy array containing the power for each frame.
     #
-    def newFrame(self, frame_number):
-        active = []
-        increment = []
-        for i, channel in enumerate(self.channels):
-            if self.which_checked[i] and ((frame_number % channel[3].value()) == 0):
-                active.append(True)
-                increment.append(float(channel[2].value()))
-            else:
-                active.append(False)
-                increment.append(float(channel[2].value()))
-        return [active, increment]
+    def progression(self, initial, inc, steps):
+        return initial + inc * steps
 
 ## ExponentialChannels
 #
@@ -245,29 +374,19 @@ class ExponentialChannels(MathChannels):
             channel[2].setValue(1.05)
             channel[2].setMaximum(9.9)
 
-    ## newFrame
-    #
-    # Called when we get a new frame from the camera. Returns the which
-    # channels (if any) need to have their power adjusted.
+    ## progression
     #
-    # @param frame_number The frame number of the current frame.
+    # @param initial The initial power.
+    # @param inc The amount to multiply the power by at each step.
+    # @param steps A numpy array containing the number of increments for each frame.
     #
-    # @return Returns an array of arrays containing the active channels and how much to increment their power by.
+    # @return A numpy array containing the power for each frame.
     #
-    def newFrame(self, frame_number):
-        active = []
-        increment = []
-        for i, channel in enumerate(self.channels):
-            if self.which_checked[i] and ((frame_number % channel[3].value()) == 0):
-                active.append(True)
-                new_power = float(channel[2].value()) * self.powers[i]
-                inc = new_power - self.powers[i]
-                increment.append(inc)
-                self.powers[i] = new_power
-            else:
-                active.append(False)
-                increment.append(float(channel[2].value()))
-        return [active, increment]
+    def progression(self, initial, inc, steps):
+        # Don't calculate powers that would be clipped anyway.
+        if (inc > 1.0) and (initial > 0.0):
+            steps = numpy.minimum(steps, int(numpy.log(1.0/initial)/numpy.log(inc)) + 1)
+        return initial * numpy.power(inc, steps)
 
 ## FileChannels
 #
@@ -282,104 +401,91 @@ class FileChannels(Channels):
     #
     def __init__(self, parent):
         Channels.__init__(self, parent)
-        self.active = []
-        self.start_powers = []
-        self.file_ptr = False
+        self.preload_thread = None
+        self.table = None
 
-    ## getNextPowers
+    ## compile
     #
-    # Read and parse the next line of the powers file, or False 
-    # if we have reached the end of the file.
+    # The powers file is replayed from the start, after the end
+    # of the file the powers do not change.
     #
-    # @return Return an array containing the powers, or False.
+    # @param frames The number of frames in the film, or None if this is not known.
     #
-    def getNextPowers(self):
-        line = self.file_ptr.readline()
-        powers = False
-        if line:
-            powers = []
-            powers_text = line.split(" ")[1:]
-            for i in range(len(powers_text)):
-                powers.append(float(powers_text[i]))
-        return powers
+    # @return A ProgressionTable object, or None if there is no powers file.
+    #
+    def compile(self, frames):
+        if self.table is None:
+            return None
+        table = self.table
+        if (frames is not None) and (frames > table.shape[0]):
+            table = numpy.concatenate((table, numpy.tile(table[-1], (frames - table.shape[0], 1))))
+        return ProgressionTable(numpy.ones(table.shape[1], dtype = numpy.bool),
+                                table,
+                                (frames is not None))
 
     ## newFile
     #
-    # Open a powers file & read the first line to get the initial
-    # power values.
+    # Load a powers file (see loadPowerFile()). If the file was loaded
+    # by preloadFile() (and has not changed since) then that version
+    # is used.
+    #
+    # @param filename The name of the powers file.
     #
     def newFile(self, filename):
+        preloaded = None
+        if self.preload_thread is not None:
+            self.preload_thread.wait()
+            preloaded = self.preload_thread.preloaded
+            self.preload_thread = None
+
+        self.table = None
         if os.path.exists(filename):
-            self.file_ptr = open(filename, "r")
-            self.file_ptr.readline()
-            self.active = []
-            self.start_powers = []
-            powers = self.getNextPowers()
-            if powers:
-                for power in powers:
-                    self.active.append(True)
-                    self.powers.append(power)
-                    self.start_powers.append(power)
-        else:
-            self.file_ptr = False
+            key = [os.path.abspath(filename), os.path.getmtime(filename)]
+            if (preloaded is not None) and (preloaded[0] == key):
+                self.table = preloaded[1]
+            else:
+                self.table = loadPowerFile(filename)
 
-    ## newFrame
+    ## preloadFile
     #
-    # Called when we get a new frame from the camera. Returns the which
-    # channels (if any) need to have their power adjusted.
-    #
-    # @param frame_number The frame number of the current frame.
-    #
-    # @return Returns an array of arrays containing the active channels and how much to increment their power by.
-    #
-    def newFrame(self, frame_number):
-        if self.file_ptr:
-            powers = self.getNextPowers()
-            active = []
-            increment = []
-            if powers:
-                for i in range(len(powers)):
-                    if powers[i] != self.powers[i]:
-                        active.append(True)
-                        increment.append(powers[i] - self.powers[i])
-                        self.powers[i] = powers[i]
-                    else:
-                        active.append(False)
-                        increment.append(False)
-            return [active, increment]
-        else:
-            return [[], []]
+    # Loads a powers file in a separate thread so that it is ready when
+    # newFile() is called (e.g. for the next film in a sequence).
+    #
+    # @param filename The name of the powers file.
+    #
+    def preloadFile(self, filename):
+        if self.preload_thread is not None:
+            self.preload_thread.wait()
+        self.preload_thread = PreloadThread(filename)
+        self.preload_thread.start(QtCore.QThread.LowPriority)
 
-    ## startFilm
+
+## PreloadThread
+#
+# The thread that FileChannels.preloadFile() uses to load a powers file.
+#
+class PreloadThread(QtCore.QThread):
+
+    ## __init__
     #
-    # This is called when the filming starts. It returns the
-    # desired initial powers for the various channels. It also
-    # rewinds the file pointer to beginning of the powers file.
-    #
-    # @return Returns an array of arrays containing the active channels and their initial powers.
-    #
-    def startFilm(self):
-        if self.file_ptr:
-            # reset file ptr
-            self.file_ptr.seek(0)
-            self.file_ptr.readline()
-            # reset internal power record
-            for i in range(len(self.start_powers)):
-                self.powers[i] = self.start_powers[i]
-            return [self.active, self.start_powers]
-        else:
-            return [[], []]
+    # @param filename The name of the powers file.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, filename, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.filename = filename
+        self.preloaded = None
 
-    ## stopFilm
+    ## run
     #
-    # This is called when the film stops. It resets the powers
-    # to their initial values.
+    # Loads the file, self.preloaded is [[file name, modification time], powers table] if this worked.
     #
-    def stopFilm(self):
-        if self.file_ptr:
-            return [self.active, self.start_powers]
-        else:
-            return [[], []]
+    def run(self):
+        try:
+            key = [os.path.abspath(self.filename), os.path.getmtime(self.filename)]
+            self.preloaded = [key, loadPowerFile(self.filename)]
+        except:
+            hdebug.logText("failed to preload powers file " + self.filename + " " + traceback.format_exc())
 
 
 ## ProgressionControl
@@ -387,7 +493,7 @@ class FileChannels(Channels):
 # Progression control dialog box
 #
 class ProgressionControl(QtGui.QDialog, halModule.HalModule):
-    incPower = QtCore.pyqtSignal(int, float)
+    newProgression = QtCore.pyqtSignal(object)
     setPower = QtCore.pyqtSignal(int, float)
 
     ## __init__
@@ -408,6 +514,8 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
         self.linear_channels = False
         self.file_channels = False
         self.parameters = parameters
+        self.progression = None
+        self.recorder = frameMetadata.getRecorder()
         self.use_was_checked = False
         self.which_checked = []
 
@@ -514,7 +622,7 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
     #
     @hdebug.debug
     def getSignals(self):
-        return [[self.hal_type, "incPower", self.incPower],
+        return [[self.hal_type, "newProgression", self.newProgression],
                 [self.hal_type, "setPower", self.setPower]]
 
     ## handleCommMessage
@@ -529,7 +637,10 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
         m_type = message.getType()
         m_data = message.getData()
 
-        if (m_type == "progressionLockout"):
+        if (m_type == "preStageProgressionFile"):
+            if self.file_channels:
+                self.file_channels.preloadFile(m_data[0])
+        elif (m_type == "progressionLockout"):
             self.tcpHandleProgressionLockout()
         elif (m_type == "progressionFile"):
             self.tcpHandleProgressionFile(m_data[0])
@@ -575,19 +686,18 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
     ## newFrame
     #
     # This is called when we get new frames from the camera. It
-    # calls the newFrame method of the active channels object.
-    # If this returns that power updates are necessary then it
-    # emits the appropriate progIncPower signals.
+    # records the progression powers of the frame in the frame
+    # meta-data and emits setPower signals for the (software timed)
+    # channels whose power is different in the next frame.
     #
     # @param frame The current frame object.
     # @param filming True/False if we are currently filming.
     #
     def newFrame(self, frame, filming):
-        if filming and self.channels and frame.master:
-            [active, increment] = self.channels.newFrame(frame.number)
-            for i in range(len(active)):
-                if active[i]:
-                    self.incPower.emit(int(i), increment[i])
+        if filming and self.progression and frame.master:
+            self.recorder.setValue(frame.number, "progression", self.progression.getPowers(frame.number))
+            for [channel, power] in self.progression.getChanges(frame.number):
+                self.setPower.emit(channel, power)
 
     ## newParameters
     #
@@ -623,30 +733,30 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
 
     ## setInitialPower
     #
-    # This emits progSetPower signals to set the power. This is called
-    # at the start & end of filming.
+    # This emits setPower signals to set the power of the active
+    # channels. This is called at the start & end of filming.
     #
-    # @param active Boolean array specifying whether or not a channel is active.
-    # @param power The power to set the channel too.
+    # @param power The power to set the channels too.
     #
-    def setInitialPower(self, active, power):
-        for i in range(len(active)):
-            if active[i]:
-                self.setPower.emit(int(i), power[i])
+    def setInitialPower(self, power):
+        for i in self.progression.getActiveChannels():
+            self.setPower.emit(int(i), power[i])
 
     ## startFilm
     #
     # Called at the start of filming. If the progression dialog is
     # open and the use progressions check box is checked it figures 
     # out which tab is visible to determine which is the active channel
-    # object. Then it sets the intial powers as specified by the
-    # active channel.
+    # object. The progression is compiled and offered to the
+    # illumination control (which may take care of some of the
+    # channels), then the intial powers are set.
     #
     # @param film_name The name of the film without any extensions, or False if the film is not being saved.
     # @param run_shutters True/False the shutters should be run or not.
     #
     def startFilm(self, film_name, run_shutters):
         self.channels = False
+        self.progression = None
         if (self.isVisible() and self.parameters.use_progressions):
             # determine which tab is active.
             if self.ui.linearTab.isVisible():
@@ -655,8 +765,16 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
                 self.channels = self.exp_channels
             elif self.ui.fileTab.isVisible():
                 self.channels = self.file_channels
-            [active, power] = self.channels.startFilm()
-            self.setInitialPower(active, power)
+
+            frames = None
+            if (self.parameters.acq_mode == "fixed_length"):
+                frames = self.parameters.frames
+            self.progression = self.channels.compile(frames)
+
+        if self.progression:
+            self.recorder.addField("progression", "float32", self.progression.table.shape[1])
+            self.newProgression.emit(self.progression)
+            self.setInitialPower(self.progression.getInitialPowers())
 
     ## stopFilm
     #
@@ -666,9 +784,9 @@ class ProgressionControl(QtGui.QDialog, halModule.HalModule):
     # @param film_writer The film writer object.
     #
     def stopFilm(self, film_writer):
-        if self.channels:
-            [active, power] = self.channels.stopFilm()
-            self.setInitialPower(active, power)
+        if self.progression:
+            self.setInitialPower(self.progression.initial)
+            self.progression = None
         if self.use_was_checked:
             self.use_was_checked = False
             self.ui.progressionsCheckBox.setChecked(True)
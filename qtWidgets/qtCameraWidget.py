@@ -37,6 +37,10 @@ class QCameraWidget(QtGui.QWidget):
         self.setMouseTracking(True)
 
         self.buffer = False
+        self.capture_display = False
+        self.colortable = False
+        self.display_buffer = None
+        self.display_range = [0, 1]
 
         # These are for dragging (to move the stage).
         self.ctrl_key_down = False
@@ -49,9 +53,19 @@ class QCameraWidget(QtGui.QWidget):
         self.flip_vertical = parameters.flip_vertical
         self.transpose = parameters.transpose
 
+        # The last frame and the (visible part of the) frame as a QImage,
+        # the 8 bit data of the image and where to draw it in the widget.
+        self.frame = False
         self.image = False
-        self.image_min = 0
+        self.image_data = None
         self.image_max = 1
+        self.image_min = 0
+        self.image_rect = QtCore.QRectF()
+
+        # The lookup table for converting camera values to display values
+        # and the display range that it was calculated for.
+        self.lut = None
+        self.lut_range = None
 
         # This is the amount of image magnification.
         # Only integer values are allowed.
@@ -60,7 +74,11 @@ class QCameraWidget(QtGui.QWidget):
         self.mouse_x = 0
         self.mouse_y = 0
 
+        # The color table in the form expected by QImage.setColorTable().
+        self.qt_colortable = None
+
         self.roi_rubber_band = False
+        self.roi_statistics = []
 
         self.show_grid = False
         self.show_info = True
@@ -138,6 +156,30 @@ class QCameraWidget(QtGui.QWidget):
         margin = int(0.1 * float(self.image_max - self.image_min))
         return [self.image_min - margin, self.image_max + margin]
 
+    ## getColorTable
+    #
+    # The color table is only converted to the QImage format when it changes.
+    #
+    # @return The current color table as a list of qRgb values.
+    #
+    def getColorTable(self):
+        if self.qt_colortable is None:
+            if self.colortable:
+                self.qt_colortable = map(lambda x: QtGui.qRgb(x[0], x[1], x[2]), self.colortable[:256])
+            else:
+                self.qt_colortable = map(lambda x: QtGui.qRgb(x, x, x), range(256))
+        return self.qt_colortable
+
+    ## getDisplayRect
+    #
+    # @return The rectangle (in widget coordinates) that the whole image is drawn in.
+    #
+    def getDisplayRect(self):
+        if self.transpose:
+            return QtCore.QRect(0, 0, self.y_final, self.x_final)
+        else:
+            return QtCore.QRect(0, 0, self.x_final, self.y_final)
+
     ## getEventLocation
     #
     # Returns the location of an external event in the window, normalized
@@ -258,6 +300,7 @@ class QCameraWidget(QtGui.QWidget):
     #
     def newColorTable(self, colortable):
         self.colortable = colortable
+        self.qt_colortable = None
 
     ## newParameters
     #
@@ -267,6 +310,7 @@ class QCameraWidget(QtGui.QWidget):
     #
     def newParameters(self, parameters, colortable, display_range):
         self.colortable = colortable
+        self.qt_colortable = None
         self.display_range = display_range
         self.drag_multiplier = parameters.drag_multiplier
         self.flip_horizontal = parameters.flip_horizontal
@@ -277,6 +321,18 @@ class QCameraWidget(QtGui.QWidget):
 
         self.calcFinalSize()
 
+    ## newStatistics
+    #
+    # Handles new frame statistics. These are calculated in a separate thread,
+    # see qtWidgets.qtFrameStatistics.
+    #
+    # @param frame_stats A qtFrameStatistics.FrameStatistics object.
+    #
+    def newStatistics(self, frame_stats):
+        self.image_min = frame_stats.full.image_min
+        self.image_max = frame_stats.full.image_max
+        self.roi_statistics = frame_stats.rois
+
     ## newRange
     #
     # @param range [minimum, maximum]
@@ -284,10 +340,31 @@ class QCameraWidget(QtGui.QWidget):
     def newRange(self, range):
         self.display_range = range
 
+    ## orientImage
+    #
+    # @param frame A frame object.
+    #
+    # @return The frame data as a 2D numpy array, flipped and/or transposed. This
+    #    is a view, the re-orientation is done by rescaleImage().
+    #
+    def orientImage(self, frame):
+        image_data = frame.getData().reshape((frame.image_y, frame.image_x))
+
+        if self.flip_horizontal:
+            image_data = numpy.fliplr(image_data)
+
+        if self.flip_vertical:
+            image_data = numpy.flipud(image_data)
+
+        if self.transpose:
+            image_data = numpy.transpose(image_data)
+
+        return image_data
+
     ## paintEvent
     #
-    # self.image is the image from the camera scaled to the buffer
-    #    size.
+    # self.image is the visible part of the image from the camera,
+    #    which is drawn in self.image_rect.
     #
     # self.buffer is where the image is temporarily re-drawn prior 
     #    to final display. In theory this reduces display flickering.
@@ -296,12 +373,17 @@ class QCameraWidget(QtGui.QWidget):
     #
     def paintEvent(self, event):
         if self.image:
-            painter = QtGui.QPainter(self.buffer)
 
-            # Draw current image into the buffer, appropriately scaled.
-            # Only draw what is actually visible.
+            # Render the image again if the visible region changed (i.e.
+            # the user scrolled) since the last frame.
             vr = self.visibleRegion().boundingRect()
-            painter.drawImage(vr, self.image, vr)
+            if not self.image_rect.contains(QtCore.QRectF(vr.intersected(self.getDisplayRect()))):
+                self.renderImage()
+
+            # Draw current image into the buffer, appropriately scaled.
+            painter = QtGui.QPainter(self.buffer)
+            painter.fillRect(vr, QtGui.QColor(0, 0, 0))
+            painter.drawImage(self.image_rect, self.image)
 
             # Draw the grid into the buffer.
             if self.show_grid:
@@ -319,30 +401,106 @@ class QCameraWidget(QtGui.QWidget):
                 painter.setPen(QtGui.QColor(255, 255, 255))
                 painter.drawEllipse(mid_x, mid_y, 40, 40)
 
+            # Draw the statistics ROIs & their mean intensity into the buffer.
+            if self.show_info and self.roi_statistics and (self.x_size > 0) and (self.y_size > 0):
+                x_scale = float(self.x_final)/float(self.x_size)
+                y_scale = float(self.y_final)/float(self.y_size)
+                painter.setPen(QtGui.QColor(255, 255, 0))
+                for [[x, y, w, h], stats] in self.roi_statistics:
+                    painter.drawRect(int(x * x_scale), int(y * y_scale), int(w * x_scale), int(h * y_scale))
+                    painter.drawText(int(x * x_scale) + 2, int(y * y_scale) - 2, "{0:.1f}".format(stats.mean))
+
             # Transfer the buffer to the screen.
             painter = QtGui.QPainter(self)
             painter.drawPixmap(0, 0, self.buffer)
 
             # Draw a version for any external devices that want a copy
             # of whatever is currently displayed by this widget.
-            a_pixmap = QtGui.QPixmap(vr.width(), vr.height())
-            painter = QtGui.QPainter(a_pixmap)
-            painter.drawImage(a_pixmap.rect(), self.image, vr)
-            self.displayCaptured.emit(a_pixmap)
+            if self.capture_display:
+                a_pixmap = QtGui.QPixmap(vr.width(), vr.height())
+                a_pixmap.fill(QtGui.QColor(0, 0, 0))
+                painter = QtGui.QPainter(a_pixmap)
+                painter.drawImage(self.image_rect.translated(-vr.x(), -vr.y()), self.image)
+                painter.end()
+                self.displayCaptured.emit(a_pixmap)
+
+    ## renderImage
+    #
+    # Converts the part of the last frame that is visible into a QImage at the
+    # final magnification. Only the visible part is re-oriented, converted to
+    # 8 bits and scaled. At integer magnifications the pixels are replicated,
+    # otherwise the image is scaled (nearest neighbor) when it is drawn.
+    #
+    def renderImage(self):
+        image_data = self.orientImage(self.frame)
+
+        # Determine which camera pixels are visible.
+        display_rect = self.getDisplayRect()
+        [image_h, image_w] = image_data.shape
+        x_scale = float(display_rect.width())/float(image_w)
+        y_scale = float(display_rect.height())/float(image_h)
+        vr = self.visibleRegion().boundingRect().intersected(display_rect)
+        if vr.isEmpty():
+            vr = display_rect
+        c0 = max(0, int(vr.left()/x_scale))
+        c1 = min(image_w, int(numpy.ceil((vr.right() + 1)/x_scale)))
+        r0 = max(0, int(vr.top()/y_scale))
+        r1 = min(image_h, int(numpy.ceil((vr.bottom() + 1)/y_scale)))
+
+        temp = self.rescaleImage(image_data[r0:r1,c0:c1])
+
+        # Pixel replication at integer magnifications.
+        zoom = int(round(x_scale))
+        if (zoom > 1) and (x_scale == zoom) and (y_scale == zoom):
+            temp = numpy.repeat(numpy.repeat(temp, zoom, axis = 0), zoom, axis = 1)
+
+        # The QImage uses the memory of the numpy array so we need to keep a reference to it.
+        self.image_data = temp
+        self.image = QtGui.QImage(temp.data, temp.shape[1], temp.shape[0], temp.shape[1], QtGui.QImage.Format_Indexed8)
+        self.image_rect = QtCore.QRectF(c0 * x_scale, r0 * y_scale, (c1 - c0) * x_scale, (r1 - r0) * y_scale)
+
+        # Set the images color table.
+        self.setColorTable()
+
+    ## rescaleImage
+    #
+    # Converts the camera data to 8 bit display values using a lookup table. The
+    # table is only recalculated when the display range changes. The image can
+    # be a (non-contiguous) view, for example a flipped or transposed image, in
+    # which case the re-orientation happens as part of the table lookup.
+    #
+    # @param image_data A numpy.uint16 array.
+    #
+    # @return A (C contiguous) numpy.uint8 array. This array is re-used, so its
+    #    contents are only valid until the next call to this method.
+    #
+    def rescaleImage(self, image_data):
+        if (self.lut_range != self.display_range):
+            [range_min, range_max] = self.display_range
+            lut = numpy.arange(65536, dtype = numpy.float32)
+            lut = 255.0*(lut - range_min)/(range_max - range_min)
+            self.lut = numpy.clip(lut, 0.0, 255.0).astype(numpy.uint8)
+            self.lut_range = self.display_range
+
+        if (self.display_buffer is None) or (self.display_buffer.shape != image_data.shape):
+            self.display_buffer = numpy.empty(image_data.shape, dtype = numpy.uint8)
+
+        numpy.take(self.lut, image_data, out = self.display_buffer, mode = "clip")
+        return self.display_buffer
+
+    ## setCaptureDisplay
+    #
+    # @param capture True/False emit displayCaptured with a copy of what is displayed.
+    #
+    def setCaptureDisplay(self, capture):
+        self.capture_display = capture
 
     ## setColorTable
     #
     # Changes the color table of the current image.
     #
     def setColorTable(self):
-        if self.colortable:
-            for i in range(256):
-                self.image.setColor(i, QtGui.qRgb(self.colortable[i][0], 
-                                                  self.colortable[i][1], 
-                                                  self.colortable[i][2]))
-        else:
-            for i in range(256):
-                self.image.setColor(i,QtGui.qRgb(i,i,i))
+        self.image.setColorTable(self.getColorTable())
 
     ## setMagnification
     #
@@ -388,56 +546,22 @@ class QCameraWidget(QtGui.QWidget):
     ## updateImageWithFrame
     #
     # This takes the image from the camera, scales it, resizes it and converts it
-    # into a QImage that can be drawn in the display. It also emits the intensityInfo
-    # signal with the current intensity of the pixel of interest.
+    # into a QImage that can be drawn in the display (see renderImage()). It also
+    # emits the intensityInfo signal with the current intensity of the pixel of
+    # interest.
     #
     # @param frame A frame object.
     #
     def updateImageWithFrame(self, frame):
         if frame:
-            w = frame.image_x
-            h = frame.image_y
-            image_data = frame.getData()
-            image_data = image_data.reshape((h,w))
-            self.image_min = numpy.min(image_data)
-            self.image_max = numpy.max(image_data)
-
-            reoriented = False
-            if self.flip_horizontal:
-                reoriented = True
-                image_data = numpy.fliplr(image_data)
-
-            if self.flip_vertical:
-                reoriented = True
-                image_data = numpy.flipud(image_data)
-
-            if self.transpose:
-                reoriented = True
-                image_data = numpy.transpose(image_data)
-        
-            if reoriented:
-                image_data = numpy.ascontiguousarray(image_data)
-
-            temp = image_data.astype(numpy.float32)
-            temp = 255.0*(temp - self.display_range[0])/(self.display_range[1] - self.display_range[0])
-            temp[(temp > 255.0)] = 255.0
-            temp[(temp < 0.0)] = 0.0
-            temp = temp.astype(numpy.uint8)
-
-            # Create QImage & draw at final magnification.
-            if self.transpose:
-                temp_image = QtGui.QImage(temp.data, h, w, QtGui.QImage.Format_Indexed8)
-                self.image = temp_image.scaled(self.y_final, self.x_final)
-            else:
-                temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-                self.image = temp_image.scaled(self.x_final, self.y_final)
-            self.image.ndarray = temp
-
-            # Set the images color table.
-            self.setColorTable()
+            self.frame = frame
+            self.renderImage()
             self.update()
 
             if self.show_info:
+                w = frame.image_x
+                h = frame.image_y
+                image_data = self.orientImage(frame)
                 x_loc = self.x_click
                 y_loc = self.y_click
                 value = 0
@@ -0,0 +1,245 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Qt Thread for calculating frame statistics (minimum, maximum,
+# mean, percentiles and a histogram) for the whole frame and for
+# any number of user selected ROIs. This keeps these calculations
+# off the GUI thread. Large frames are sub-sampled with a stride,
+# which is accurate enough for display purposes.
+#
+
+from PyQt4 import QtCore
+
+import numpy
+
+## calcStatistics
+#
+# Calculates the statistics of an image (or a part of an image).
+#
+# @param image A 2D numpy array.
+# @param max_size (Optional) The image is sub-sampled so that it is no more than this many pixels on a side.
+# @param bins (Optional) The number of histogram bins.
+# @param max_intensity (Optional) The upper end of the histogram range.
+#
+# @return A Statistics object.
+#
+def calcStatistics(image, max_size = 512, bins = 64, max_intensity = 65535):
+    step = max(1, (max(image.shape) + max_size - 1)/max_size)
+    sample = image[::step,::step]
+    stats = Statistics()
+    if (sample.size > 0):
+        stats.image_min = int(numpy.min(sample))
+        stats.image_max = int(numpy.max(sample))
+        stats.mean = float(numpy.mean(sample))
+        stats.percentiles = numpy.percentile(sample, stats.percentile_levels)
+        stats.histogram = numpy.histogram(sample, bins = bins, range = (0, max_intensity))[0]
+    stats.step = step
+    return stats
+
+
+## FrameStatistics
+#
+# The statistics for a single frame.
+#
+class FrameStatistics():
+
+    ## __init__
+    #
+    # @param which_camera Which camera the frame came from.
+    # @param number The frame number.
+    # @param full A Statistics object for the whole frame.
+    # @param rois A list of [[x, y, width, height], Statistics] pairs, one for each ROI.
+    #
+    def __init__(self, which_camera, number, full, rois):
+        self.full = full
+        self.number = number
+        self.rois = rois
+        self.which_camera = which_camera
+
+
+## Statistics
+#
+# The statistics of an image or a part of an image.
+#
+class Statistics():
+
+    ## __init__
+    #
+    def __init__(self):
+        self.histogram = None
+        self.image_max = 0
+        self.image_min = 0
+        self.mean = 0.0
+        self.percentile_levels = [1.0, 50.0, 99.0]
+        self.percentiles = [0, 0, 0]
+        self.step = 1
+
+
+## QFrameStatisticsThread
+#
+# The thread class, which does all the calculations. Only the most
+# recent frame is kept, so if the thread falls behind it just skips
+# frames. ROIs are in (re-oriented) display coordinates, i.e. the
+# same coordinates as the rubber band ROI of the camera widget.
+#
+class QFrameStatisticsThread(QtCore.QThread):
+    statisticsReady = QtCore.pyqtSignal(object)
+
+    ## __init__
+    #
+    # @param parameters A parameters object.
+    # @param max_rois (Optional) The maximum number of ROIs.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parameters, max_rois = 4, parent = None):
+        QtCore.QThread.__init__(self, parent)
+
+        self.flip_horizontal = parameters.flip_horizontal
+        self.flip_vertical = parameters.flip_vertical
+        self.frame = False
+        self.max_intensity = parameters.max_intensity
+        self.max_rois = max_rois
+        self.mutex = QtCore.QMutex()
+        self.rois = []
+        self.running = True
+        self.transpose = parameters.transpose
+        self.wait_condition = QtCore.QWaitCondition()
+
+    ## addROI
+    #
+    # Add a ROI. If there are already max_rois ROIs the oldest one is removed.
+    #
+    # @param roi [x, y, width, height] in pixels.
+    #
+    def addROI(self, roi):
+        self.mutex.lock()
+        self.rois.append(roi)
+        if (len(self.rois) > self.max_rois):
+            self.rois.pop(0)
+        self.mutex.unlock()
+
+    ## clearROIs
+    #
+    # Remove all the ROIs.
+    #
+    def clearROIs(self):
+        self.mutex.lock()
+        self.rois = []
+        self.mutex.unlock()
+
+    ## newImage
+    #
+    # A new image for the thread to analyze.
+    #
+    # @param frame A frame object.
+    #
+    def newImage(self, frame):
+        self.mutex.lock()
+        self.frame = frame
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+    ## newParameters
+    #
+    # The ROIs are cleared as they might not be valid for the new camera settings.
+    #
+    # @param parameters A parameters object.
+    #
+    def newParameters(self, parameters):
+        self.mutex.lock()
+        self.flip_horizontal = parameters.flip_horizontal
+        self.flip_vertical = parameters.flip_vertical
+        self.max_intensity = parameters.max_intensity
+        self.rois = []
+        self.transpose = parameters.transpose
+        self.mutex.unlock()
+
+    ## run
+    #
+    # The thread loop.
+    #
+    def run(self):
+        while (self.running):
+            self.mutex.lock()
+            if not self.frame:
+                self.wait_condition.wait(self.mutex, 100)
+            frame = self.frame
+            rois = self.rois[:]
+            self.frame = False
+            self.mutex.unlock()
+
+            if frame:
+                image = frame.getData().reshape((frame.image_y, frame.image_x))
+
+                # These are all views, so the data is not copied.
+                if self.flip_horizontal:
+                    image = numpy.fliplr(image)
+                if self.flip_vertical:
+                    image = numpy.flipud(image)
+                if self.transpose:
+                    image = numpy.transpose(image)
+
+                full = calcStatistics(image, max_intensity = self.max_intensity)
+                roi_stats = []
+                for roi in rois:
+                    [x, y, w, h] = roi
+                    roi_stats.append([roi, calcStatistics(image[y:y+h,x:x+w], max_intensity = self.max_intensity)])
+
+                self.statisticsReady.emit(FrameStatistics(frame.which_camera,
+                                                          frame.number,
+                                                          full,
+                                                          roi_stats))
+
+    ## stopThread
+    #
+    # Tells the thread loop to stop running.
+    #
+    def stopThread(self):
+        self.mutex.lock()
+        self.running = False
+        self.wait_condition.wakeAll()
+        self.mutex.unlock()
+
+
+#
+# Testing
+#
+
+if __name__ == "__main__":
+    import time
+
+    image = numpy.random.randint(100, 200, (2048, 2048)).astype(numpy.uint16)
+
+    repeats = 20
+    start = time.time()
+    for i in range(repeats):
+        stats = calcStatistics(image)
+    end = time.time()
+    print "Time to process an image: ", ((end - start)/repeats), " seconds"
+    print stats.image_min, stats.image_max, stats.mean, stats.percentiles
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -111,6 +111,19 @@ class QParametersBox(QtGui.QWidget):
         if (len(self.radio_buttons) == 1):
             radio_button.click()
 
+    ## findParameters
+    #
+    # @param parameters_file The name of a parameters file.
+    #
+    # @return The index of the parameters from this file, or -1 if they have not been added.
+    #
+    def findParameters(self, parameters_file):
+        path = os.path.abspath(parameters_file)
+        for i, button in enumerate(self.radio_buttons):
+            if (os.path.abspath(button.getParameters().parameters_file) == path):
+                return i
+        return -1
+
     ## getCurrentParameters
     #
     # @return The current parameters object.
@@ -12,31 +12,7 @@ from PyQt4 import QtCore, QtGui
 import sys
 from xml.dom import minidom, Node
 
-have_aotf = 1
-try:
-    import crystalTechnologies.AOTF as AOTF
-except:
-    print "failed to load crystalTechnologies.AOTF."
-    have_aotf = 0
-
-have_cube = 1
-try:
-    import coherent.cube405 as cube405
-except:
-    print "failed to load coherent.cube405"
-    have_cube = 0
-
-#
-# Remove AOTF settings that apply to the current channel. This way
-# when you move the slider and generate 100 events only the last
-# one gets acted on, but pending events for other channels are not lost.
-#
-def removeChannelDuplicates(queue, channel):
-    final_queue = []
-    for item in queue:
-        if item[1] == channel: continue
-        final_queue.append(item)
-    return final_queue
+import illumination.commandQueues as commandQueues
 
 #
 # Channel settings object, created based on the XML descriptor file
@@ -223,181 +199,6 @@ class QChannel():
         elif self.channel_settings.use_cube405:
             self.cube_queue.setAmplitude(on, self.current_amplitude)
 
-    
-# Cube405 communication thread.
-#
-# This "buffers" communication with the Cube 405.
-#
-# All communication with the Cube 405 should go 
-# through this thread to avoid two processes trying 
-# to talk to the laser at the same time.
-#
-class QCubeThread(QtCore.QThread):
-    def __init__(self, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
-        self.cube_mutex = QtCore.QMutex()
-        self.running = 1
-
-        global have_cube
-        if have_cube:
-            self.cube = cube405.Cube405()
-            if not(self.cube.getStatus()):
-                self.cube.shutDown()
-                self.cube = 0
-        else:
-            self.cube = 0
-
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, amplitude] = self.buffer.pop()
-                self.buffer = []
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    def addRequest(self, on, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, amplitude])
-        self.buffer_mutex.unlock()
-
-    def analogModulationOff(self):
-        self.cube_mutex.lock()
-        if self.cube:
-            self.cube.setExtControl(0)
-        self.cube_mutex.unlock()
-
-    def analogModulationOn(self):
-        self.cube_mutex.lock()
-        if self.cube:
-            self.cube.setExtControl(1)
-        self.cube_mutex.unlock()
-
-    def setAmplitude(self, on, amplitude):
-        self.cube_mutex.lock()
-        if self.cube:
-            if on:
-                self.cube.setPower(amplitude)
-            else:
-                self.cube.setPower(0)
-        else:
-            if on:
-                print "CUBE: ", amplitude
-            else:
-                print "CUBE: ", 0
-        self.cube_mutex.unlock()
-
-    def stopThread(self):
-        self.running = 0
-        if self.cube:
-            self.cube.shutDown()
-
-
-# AOTF communication thread.
-#
-# This "buffers" communication with the AOTF, which doesn't
-# respond very quickly to requests. It sends the most recent request
-# and discards any backlog of older requests. It is necessary to
-# keep the slider moving "smoothly" when the user tries to drag it
-# up and down w/ the AOTF on.
-#
-# All communication with AOTF should go through this thread to avoid
-# two processes trying to talk to the AOTF at the same time.
-#
-
-class QAOTFThread(QtCore.QThread):
-    def __init__(self, parent = None):
-        QtCore.QThread.__init__(self, parent)
-        self.buffer = []
-        self.buffer_mutex = QtCore.QMutex()
-        self.aotf_mutex = QtCore.QMutex()
-        self.running = 1
-
-        # connect to the AOTF
-        global have_aotf
-        if have_aotf:
-            self.aotf = AOTF.AOTF()
-            if not(self.aotf.getStatus()):
-                self.aotf = 0
-        else:
-            self.aotf = 0
-
-    def run(self):
-        while (self.running):
-            self.buffer_mutex.lock()
-            if len(self.buffer) > 0:
-                [on, channel, amplitude] = self.buffer.pop()
-                self.buffer = removeChannelDuplicates(self.buffer, channel)
-                self.buffer_mutex.unlock()
-                self.setAmplitude(on, channel, amplitude)
-            else:
-                self.buffer_mutex.unlock()
-            self.msleep(10)
-
-    def addRequest(self, on, channel, amplitude):
-        self.buffer_mutex.lock()
-        self.buffer.append([on, channel, amplitude])
-        self.buffer_mutex.unlock()
-
-    def analogModulationOff(self):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            self.aotf.analogModulationOff()
-        self.aotf_mutex.unlock()
-
-    def analogModulationOn(self):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            self.aotf.analogModulationOn()
-        self.aotf_mutex.unlock()
-
-    def fskOnOff(self, channel, on):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            if on:
-                self.aotf.fskOn(channel)
-            else:
-                self.aotf.fskOff(channel)
-        self.aotf_mutex.unlock()
-
-    def setAmplitude(self, on, channel, amplitude):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            if on:
-                self.aotf.setAmplitude(channel, amplitude)
-            else:
-                self.aotf.setAmplitude(channel, 0)
-        else:
-            print "AOTF:"
-            if on:
-                print "\t", channel, amplitude
-            else:
-                print "\t", channel, 0
-        self.aotf_mutex.unlock()
-
-    def setFrequencies(self, channel, frequencies):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            self.aotf.setFrequencies(channel, frequencies)
-        self.aotf_mutex.unlock()
-
-    def setFrequency(self, channel, frequency):
-        self.aotf_mutex.lock()
-        if self.aotf:
-            self.aotf.setFrequency(channel, frequency)
-        self.aotf_mutex.unlock()
-
-    def stopThread(self):
-        if self.aotf:
-            self.aotf.shutDown()
-            self.aotf = 0
-        self.running = 0
-
 
 # Power control widget
 #
@@ -408,18 +209,30 @@ class QAOTFThread(QtCore.QThread):
 # be editing the power_control_settings.xml file anyway so
 # one could probably count on it not being so confusing...
 #
+# The AOTF and cube communication queues of the illumination
+# control can be passed in, so that the devices are not opened
+# twice and no second set of device threads is started. Queues
+# that the widget creates itself are stopped by shutDown().
+#
 class QPowerControlWidget(QtGui.QWidget):
-    def __init__(self, settings_file_name, parameters, parent = None):
+    def __init__(self, settings_file_name, parameters, aotf_queue = None, cube_queue = None, parent = None):
         QtGui.QWidget.__init__(self, parent)
         self.debug = 1
-
-        # setup the AOTF communication thread
-        self.aotf_queue = QAOTFThread()
-        self.aotf_queue.start(QtCore.QThread.NormalPriority)
-
-        # setup the Cube communication thread
-        self.cube_queue = QCubeThread()
-        self.cube_queue.start(QtCore.QThread.NormalPriority)
+        self.own_queues = []
+
+        # setup the AOTF communication queue
+        self.aotf_queue = aotf_queue
+        if self.aotf_queue is None:
+            self.aotf_queue = commandQueues.QCTAOTFThread()
+            self.aotf_queue.start()
+            self.own_queues.append(self.aotf_queue)
+
+        # setup the Cube communication queue
+        self.cube_queue = cube_queue
+        if self.cube_queue is None:
+            self.cube_queue = commandQueues.QCubeThread()
+            self.cube_queue.start()
+            self.own_queues.append(self.cube_queue)
 
         # parse the settings file
         xml = minidom.parse(settings_file_name)
@@ -547,10 +360,8 @@ class QPowerControlWidget(QtGui.QWidget):
 
     def shutDown(self):
         self.allOff()
-        self.aotf_queue.stopThread()
-        self.aotf_queue.wait()
-        self.cube_queue.stopThread()
-        self.cube_queue.wait()
+        for queue in self.own_queues:
+            queue.stopThread()
 
     def turnOnOff(self, channels, on):
         for channel in channels:
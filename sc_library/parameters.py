@@ -16,6 +16,18 @@ import xml.etree.ElementTree as ElementTree
 
 default_params = 0
 
+## Parsed parameters files, indexed by the absolute path of
+## the file. Each entry is [modification time, StormXMLObject].
+parsed_parameters = {}
+
+## Converters from the XML text to the value of the parameter.
+type_converters = {"boolean" : lambda x: (x == "True"),
+                   "float" : float,
+                   "float-array" : lambda x: map(float, x.split(",")),
+                   "int" : int,
+                   "int-array" : lambda x: map(int, x.split(",")),
+                   "string-array" : lambda x: x.split(",")}
+
 ## copyAttributes
 #
 # Copy the attributes from the original object to the duplicate
@@ -30,6 +42,27 @@ def copyAttributes(original, duplicate):
         if not hasattr(duplicate, k):
             setattr(duplicate, k, copy.copy(v))
 
+## copyValue
+#
+# Copies a parameter value. This is much faster than copy.deepcopy()
+# for the kinds of values that are found in a parameters object. Lists
+# are assumed to be homogeneous, i.e. either a list of lists or a list
+# of (immutable) values.
+#
+# @param value The value to copy.
+#
+# @return A copy of the value.
+#
+def copyValue(value):
+    if isinstance(value, list):
+        if (len(value) > 0) and isinstance(value[0], list):
+            return map(copyValue, value)
+        return value[:]
+    elif isinstance(value, StormXMLObject):
+        return value.copy()
+    else:
+        return value
+
 ## fileType
 #
 # Based on the root tag, returns the XML file type.
@@ -39,6 +72,8 @@ def copyAttributes(original, duplicate):
 # @returns An array containing "parameters", "shutters" or "unknown" as the first element and XML parsing errors (if any) as the second element.
 #
 def fileType(xml_file):
+    if getCachedParameters(xml_file):
+        return ["parameters", False]
     try:
         xml = ElementTree.parse(xml_file).getroot()
         if (xml.tag == "settings"):
@@ -50,6 +85,24 @@ def fileType(xml_file):
     except:
         return ["unknown", traceback.format_exc()]
 
+## getCachedParameters
+#
+# @param parameters_file The name of a parameters file.
+#
+# @return The (unprocessed) parameters object if the file has already been parsed and has not changed since, otherwise None.
+#
+def getCachedParameters(parameters_file):
+    key = os.path.abspath(parameters_file)
+    if key in parsed_parameters:
+        [mtime, xml_object] = parsed_parameters[key]
+        try:
+            if (os.path.getmtime(parameters_file) == mtime):
+                return xml_object
+        except OSError:
+            pass
+        del parsed_parameters[key]
+    return None
+
 ## Hardware
 #
 # Parses a hardware file to create a hardware object.
@@ -100,27 +153,37 @@ def Hardware(hardware_file):
 #
 # Parses a parameters file to create a parameters object.
 #
+# Files are only parsed once (or again if they have been modified), after
+# that a copy of the parsed file is used.
+#
 # @param parameters_file The name of the XML file containing the parameter definitions.
 # @param is_HAL (Optional) True/False HAL specific processing needs to be done.
 #
 # @return A parameters object.
 #
 def Parameters(parameters_file, is_HAL = False):
-    xml = ElementTree.parse(parameters_file).getroot()
-    assert xml.tag == "settings", parameters_file + " is not a setting file."
+    xml_object = getCachedParameters(parameters_file)
+    if xml_object is None:
+        mtime = os.path.getmtime(parameters_file)
+        xml = ElementTree.parse(parameters_file).getroot()
+        assert xml.tag == "settings", parameters_file + " is not a setting file."
+
+        # Read general settings
+        xml_object = StormXMLObject(xml)
 
-    # Read general settings
-    xml_object = StormXMLObject(xml)
+        # Read camera1/camera2 settings (only used with dual camera setups).
+        camera1 = xml.find("camera1")
+        if camera1:
+            xml_object.camera1 = StormXMLObject(camera1)
 
-    # Read camera1/camera2 settings (only used with dual camera setups).
-    camera1 = xml.find("camera1")
-    if camera1:
-        xml_object.camera1 = StormXMLObject(camera1)
+        camera2 = xml.find("camera2")
+        if camera2:
+            xml_object.camera2 = StormXMLObject(camera2)
 
-    camera2 = xml.find("camera2")
-    if camera2:
-        xml_object.camera2 = StormXMLObject(camera2)
+        parsed_parameters[os.path.abspath(parameters_file)] = [mtime, xml_object]
 
+    # The cached version is not changed.
+    xml_object = xml_object.copy()
     xml_object.parameters_file = parameters_file
 
     if (is_HAL):
@@ -145,7 +208,7 @@ def Parameters(parameters_file, is_HAL = False):
                 copyAttributes(default_params.camera2, xml_object.camera2)
         
         if use_as_default or (not default_params):
-            default_params = copy.deepcopy(xml_object)
+            default_params = xml_object.copy()
 
         # Define some camera specific derivative parameters
         if hasattr(xml_object, "camera1"):
@@ -224,14 +287,16 @@ class StormXMLObject(object):
 
     ## __init__
     #
-    # Dynamically create class based on xml data parsed with the minidom library.
+    # Dynamically create class based on xml data parsed with the ElementTree library.
+    # The values are collected in a dictionary which then becomes the attributes of
+    # the object.
     #
     # @param nodes A list of XML nodes.
     #
     def __init__(self, nodes):
 
 #        self.attributes = {}
-        self.warned = False
+        values = {"warned" : False}
 
         # FIXME: someday this is going to cause a problem..
         max_channels = 8
@@ -242,57 +307,39 @@ class StormXMLObject(object):
 
             # Parse default power setting.
             if (slot == "default_power"):
-                if not hasattr(self, "default_power"):
-                    self.on_off_state = []
-                    self.default_power = []
-                    for i in range(max_channels):
-                        self.default_power.append(1.0)
-                        self.on_off_state.append(0)
+                if not ("default_power" in values):
+                    values["on_off_state"] = [0] * max_channels
+                    values["default_power"] = [1.0] * max_channels
                 power = float(node.text)
                 channel = int(node.attrib["channel"])
-                self.default_power[channel] = power
+                values["default_power"][channel] = power
 
             # power buttons
             elif (slot == "button"):
-                if not hasattr(self, "power_buttons"):
-                    self.power_buttons = []
-                    for i in range(max_channels):
-                        self.power_buttons.append([])
+                if not ("power_buttons" in values):
+                    values["power_buttons"] = [[] for i in range(max_channels)]
                 channel = int(node.attrib["channel"])
                 name = node.text
                 power = float(node.attrib["power"])
-                self.power_buttons[channel].append([name, power])
+                values["power_buttons"][channel].append([name, power])
 
-            # all the other settings
+            # all the other settings, anything without a converter
+            # is assumed to be a (non-unicode) string.
             elif node.attrib.get("type", 0):
-                node_type = node.attrib["type"]
-                node_value = node.text
-                if (node_type == "int"):
-                    setattr(self, slot, int(node_value))
-                elif (node_type == "int-array"):
-                    text_array = node_value.split(",")
-                    int_array = []
-                    for elt in text_array:
-                        int_array.append(int(elt))
-                    setattr(self, slot, int_array)
-                elif (node_type == "float"):
-                    setattr(self, slot, float(node_value))
-                elif (node_type == "float-array"):
-                    text_array = node_value.split(",")
-                    float_array = []
-                    for elt in text_array:
-                        float_array.append(float(elt))
-                    setattr(self, slot, float_array)
-                elif (node_type == "string-array"):
-                    setattr(self, slot, node_value.split(","))
-                elif (node_type == "boolean"):
-                    if node_value == "True":
-                        setattr(self, slot, True)
-                    else:
-                        setattr(self, slot, False)
-                # everything else is assumed to be a (non-unicode) string
-                else: 
-                    setattr(self, slot, str(node_value))
+                converter = type_converters.get(node.attrib["type"], str)
+                values[slot] = converter(node.text)
+
+        self.__dict__.update(values)
+
+    ## copy
+    #
+    # @return A copy of this object. Changing the copy does not change the original.
+    #
+    def copy(self):
+        duplicate = StormXMLObject([])
+        for k, v in self.__dict__.iteritems():
+            duplicate.__dict__[k] = copyValue(v)
+        return duplicate
 
     ## __getattribute__
     #
@@ -0,0 +1,864 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Runs an experiment script (a sequence of movies) from inside HAL.
+#
+# Each movie of the script is run by sending HAL and the other modules
+# the same messages that an external program would send using
+# tcpControl (parameters, setDirectory, moveTo, setLockTarget, findSum,
+# setPower, movie, etc.). While a movie is being taken the next movie
+# is staged, i.e. its parameters file is parsed (and cached by
+# sc_library.parameters), its shutter sequence and powers file are
+# compiled by the illumination and progression modules and its
+# directory is created, so that very little time is spent between
+# movies. The time between movies is reported at the end of the
+# script.
+#
+# Scripts are either XML files:
+#
+# <sequence>
+#   <movie>
+#     <name>movie_01</name>
+#     <length>1000</length>
+#     <parameters>storm_640.xml</parameters>
+#     <directory>C:/Data/140101/</directory>
+#     <stage_x>100.0</stage_x>
+#     <stage_y>200.0</stage_y>
+#     <delay>500</delay>
+#     <lock_target>0.0</lock_target>
+#     <find_sum/>
+#     <power channel="4">0.5</power>
+#     <progression_file>powers.txt</progression_file>
+#   </movie>
+#   ...
+# </sequence>
+#
+# Or JSON files containing a list of movies (or a dictionary with
+# a "movies" list) with the same fields, e.g.
+#
+# [{"name" : "movie_01", "length" : 1000, "powers" : [[4, 0.5]]}, ...]
+#
+# Only name and length are required. parameters is either the name of
+# a parameters file or the index of parameters that have already been
+# loaded. delay is the time to wait (in milliseconds) after moving the
+# stage. The lock actions are find_sum, optimize_sum and recenter_piezo.
+# find_sum can also be "if_lost", in which case the sum signal is only
+# searched for if the focus lock sum is below the lock_min_sum hardware
+# parameter.
+#
+# A script can also contain position lists. The movies of a position
+# list are taken at each of the positions (their names have the index
+# of the position added), the positions are either in a file (one "x, y"
+# line per position as saved by the stage control) or listed in the
+# script. The order in which the positions are visited is planned
+# (see halLib.positionPlanner) to minimize the stage travel.
+#
+# <position_list>
+#   <file>plate.txt</file>
+#   <order>tsp</order>
+#   <position>1000.0, 2000.0</position>
+#   <movie>
+#     ...
+#   </movie>
+# </position_list>
+#
+# In JSON files this is a {"position_list" : {"file" : .., "order" : ..,
+# "positions" : [[x, y], ..], "movies" : [..]}} entry.
+#
+# The stage starts moving to the next position as soon as the last
+# frame of the current movie has been taken, so that the move overlaps
+# with HAL finishing the movie. The time taken at each position and the
+# total time of each position list are reported at the end of the script.
+#
+# Hazen 10/14
+#
+
+import collections
+import glob
+import json
+import numpy
+import os
+import time
+import traceback
+import xml.etree.ElementTree as ElementTree
+
+from PyQt4 import QtCore, QtGui
+
+import halLib.halModule as halModule
+import halLib.positionPlanner as positionPlanner
+import qtWidgets.qtAppIcon as qtAppIcon
+
+import sc_library.parameters as params
+import sc_library.tcpControl as tcpControl
+
+# Debugging
+import sc_library.hdebug as hdebug
+
+
+## countMovies
+#
+# @param script A list of SequenceStep and PositionList objects.
+#
+# @return The number of movies in the script.
+#
+def countMovies(script):
+    movies = 0
+    for item in script:
+        if isinstance(item, PositionList):
+            movies += item.positions.shape[0] * len(item.movies)
+        else:
+            movies += 1
+    return movies
+
+## expandSequence
+#
+# Replaces the position lists of a script with the movies at each position.
+#
+# @param script A list of SequenceStep and PositionList objects.
+# @param start The [x, y] starting stage position, or None if this is not known.
+#
+# @return A list of SequenceStep objects.
+#
+def expandSequence(script, start):
+    steps = []
+    position = start
+    for item in script:
+        if isinstance(item, PositionList):
+            item_steps = item.getSteps(position)
+        else:
+            item_steps = [item]
+        for step in item_steps:
+            if step.stage:
+                position = step.stage
+        steps.extend(item_steps)
+    return steps
+
+## getFlag
+#
+# @param values A dictionary of movie values.
+# @param name The name of the value.
+#
+# @return True/False if the value is set.
+#
+def getFlag(values, name):
+    value = values.get(name, False)
+    if isinstance(value, basestring):
+        return (value.lower() in ["1", "true", "yes"])
+    return bool(value)
+
+## loadSequence
+#
+# @param filename The name of a XML or JSON script file.
+#
+# @return A list of SequenceStep and PositionList objects.
+#
+def loadSequence(filename):
+    directory = os.path.dirname(filename)
+    script = []
+    if (os.path.splitext(filename)[1].lower() == ".json"):
+        fp = open(filename)
+        entries = json.load(fp)
+        fp.close()
+        if isinstance(entries, dict):
+            entries = entries["movies"]
+        for entry in entries:
+            if ("position_list" in entry):
+                script.append(PositionList(entry["position_list"], directory))
+            else:
+                script.append(SequenceStep(entry))
+        return script
+
+    xml = ElementTree.parse(filename).getroot()
+    assert xml.tag == "sequence", filename + " is not a sequence file."
+    for node in xml:
+        if (node.tag == "movie"):
+            script.append(SequenceStep(parseMovieXML(node)))
+        elif (node.tag == "position_list"):
+            values = {"movies" : [], "positions" : []}
+            for child in node:
+                if (child.tag == "movie"):
+                    values["movies"].append(parseMovieXML(child))
+                elif (child.tag == "position"):
+                    values["positions"].append(map(float, child.text.split(",")))
+                else:
+                    values[child.tag] = child.text.strip()
+            script.append(PositionList(values, directory))
+    return script
+
+## parseMovieXML
+#
+# @param movie A movie XML element.
+#
+# @return A dictionary of the movie values.
+#
+def parseMovieXML(movie):
+    values = {"powers" : []}
+    for node in movie:
+        if (node.tag == "power"):
+            values["powers"].append([node.attrib["channel"], node.text])
+        elif (node.text is None) or (len(node.text.strip()) == 0):
+            values[node.tag] = True
+        else:
+            values[node.tag] = node.text.strip()
+    return values
+
+
+## PositionList
+#
+# A list of stage positions and the movies to take at each of them.
+#
+class PositionList():
+
+    ## __init__
+    #
+    # @param values A dictionary with the positions file and / or a list of [x, y] positions, the movies and (optionally) the order and name of the position list.
+    # @param directory The directory of the script (a relative positions file name is relative to this).
+    #
+    def __init__(self, values, directory):
+        self.file_travel = 0.0
+        self.movies = values["movies"]
+        self.name = str(values.get("name", "positions"))
+        self.order = str(values.get("order", "tsp"))
+        self.travel = 0.0
+
+        # The positions in the file come first.
+        positions = []
+        if ("file" in values):
+            positions_file = str(values["file"])
+            if not os.path.exists(positions_file):
+                positions_file = os.path.join(directory, positions_file)
+            self.name = str(values.get("name", os.path.basename(positions_file)))
+            positions = numpy.loadtxt(positions_file, delimiter = ",", ndmin = 2)[:,:2].tolist()
+        positions.extend(values.get("positions", []))
+        self.positions = numpy.array(positions, dtype = numpy.float64).reshape((-1, 2))
+
+        assert (len(self.movies) > 0), self.name + " does not have any movies."
+        assert (self.order in ["file", "nearest", "tsp"]), "unknown position order " + self.order
+
+    ## getSteps
+    #
+    # Plans the order in which to visit the positions.
+    #
+    # @param start The [x, y] starting stage position, or None if this is not known.
+    #
+    # @return A list of SequenceStep objects.
+    #
+    def getSteps(self, start):
+        if (self.positions.shape[0] == 0):
+            return []
+        if start is None:
+            start = self.positions[0]
+        order = positionPlanner.planOrder(self.positions, start, self.order)
+        self.travel = positionPlanner.pathLength(self.positions, order, start)
+        self.file_travel = positionPlanner.pathLength(self.positions, range(self.positions.shape[0]), start)
+
+        steps = []
+        for i in order:
+            for j, movie in enumerate(self.movies):
+                values = dict(movie)
+                values["name"] = str(movie["name"]) + "_p{0:04d}".format(i)
+                if (j == 0):
+                    values["stage_x"] = self.positions[i,0]
+                    values["stage_y"] = self.positions[i,1]
+                step = SequenceStep(values)
+                step.position_list = self
+                steps.append(step)
+        return steps
+
+
+## SequenceStep
+#
+# A single movie of a script.
+#
+class SequenceStep():
+
+    ## __init__
+    #
+    # @param values A dictionary of the movie values (as strings or numbers).
+    #
+    def __init__(self, values):
+        self.delay = int(values.get("delay", 0))
+        self.directory = None
+        self.find_sum = getFlag(values, "find_sum")
+        if (str(values.get("find_sum", "")).lower() == "if_lost"):
+            self.find_sum = "if_lost"
+        self.length = int(values["length"])
+        self.lock_target = None
+        self.name = str(values["name"])
+        self.optimize_sum = getFlag(values, "optimize_sum")
+        self.parameters = None
+        self.powers = map(lambda x: [int(x[0]), float(x[1])], values.get("powers", []))
+        self.progression_file = None
+        self.recenter_piezo = getFlag(values, "recenter_piezo")
+        self.stage = None
+
+        if ("directory" in values):
+            self.directory = str(values["directory"])
+        if ("lock_target" in values):
+            self.lock_target = float(values["lock_target"])
+        if ("parameters" in values):
+            self.parameters = values["parameters"]
+            if isinstance(self.parameters, basestring):
+                if self.parameters.isdigit():
+                    self.parameters = int(self.parameters)
+                else:
+                    self.parameters = str(self.parameters)
+        if ("progression_file" in values):
+            self.progression_file = str(values["progression_file"])
+        if ("stage_x" in values) and ("stage_y" in values):
+            self.stage = [float(values["stage_x"]), float(values["stage_y"])]
+
+        # These are set when the movie is staged.
+        self.shutters = None
+        self.staged = False
+        self.staging_error = None
+        self.staging_time = 0.0
+
+        # These are set when the script is run.
+        self.dead_time = None
+        self.end_time = None
+        self.move_time = None
+        self.position_list = None
+        self.start_time = None
+
+    ## getActions
+    #
+    # @return A list of [tcpControl.TCPMessage (or None), wait] actions. wait is None, "lock" (wait for the focus lock to complete the action), "lock_if_lost" (only do the action if the lock is lost), "movie" (wait for the movie to finish) or the time to wait in milliseconds if there is no message.
+    #
+    def getActions(self):
+        actions = []
+        if self.directory:
+            actions.append([tcpControl.TCPMessage("setDirectory", [self.directory]), None])
+        if self.parameters is not None:
+            actions.append([tcpControl.TCPMessage("parameters", [self.parameters]), None])
+        if self.progression_file:
+            actions.append([tcpControl.TCPMessage("progressionType", ["file"]), None])
+            actions.append([tcpControl.TCPMessage("progressionFile", [self.progression_file]), None])
+        # The stage may have started moving before the previous movie finished.
+        delay = self.delay
+        if self.stage:
+            if self.move_time is None:
+                actions.append([tcpControl.TCPMessage("moveTo", self.stage), None])
+            else:
+                delay -= int(1000.0 * (time.time() - self.move_time))
+        if (delay > 0):
+            actions.append([None, delay])
+        if self.recenter_piezo:
+            actions.append([tcpControl.TCPMessage("recenterPiezo", []), "lock"])
+        if self.lock_target is not None:
+            actions.append([tcpControl.TCPMessage("setLockTarget", [self.lock_target]), None])
+        if (self.find_sum == "if_lost"):
+            actions.append([tcpControl.TCPMessage("findSum", []), "lock_if_lost"])
+        elif self.find_sum:
+            actions.append([tcpControl.TCPMessage("findSum", []), "lock"])
+        if self.optimize_sum:
+            actions.append([tcpControl.TCPMessage("optimizeSum", []), "lock"])
+        for [channel, power] in self.powers:
+            actions.append([tcpControl.TCPMessage("setPower", [channel, power]), None])
+        actions.append([tcpControl.TCPMessage("movie", [self.name, self.length]), "movie"])
+        return actions
+
+
+## StagingThread
+#
+# Does the part of staging a movie that does not involve the other
+# modules, i.e. parsing the parameters file and creating the directory.
+#
+class StagingThread(QtCore.QThread):
+
+    ## __init__
+    #
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.step = None
+
+    ## run
+    #
+    # The thread.
+    #
+    def run(self):
+        step = self.step
+        start_time = time.time()
+        try:
+            if step.directory:
+                if not os.path.exists(step.directory):
+                    os.makedirs(step.directory)
+                if (len(glob.glob(os.path.join(step.directory, step.name) + ".*")) > 0):
+                    hdebug.logText("sequencer: " + step.name + " will overwrite an existing movie.")
+
+            # This is parsed again (using the cached version) by HAL.
+            if isinstance(step.parameters, str):
+                parameters = params.Parameters(step.parameters)
+                step.shutters = parameters.shutters
+                if not os.path.exists(step.shutters):
+                    step.shutters = os.path.dirname(step.parameters) + "/" + step.shutters
+        except:
+            step.staging_error = traceback.format_exc()
+        step.staging_time = time.time() - start_time
+
+    ## stage
+    #
+    # Start staging a movie.
+    #
+    # @param step A SequenceStep object.
+    #
+    def stage(self, step):
+        self.wait()
+        self.step = step
+        self.start()
+
+
+## Sequencer
+#
+# Sequencer dialog box.
+#
+# This looks like a TCP client to HAL, i.e. HAL disables the record
+# button while the script is running and notifies us (with tcpComplete)
+# when each movie is finished.
+#
+class Sequencer(QtGui.QDialog, halModule.HalModule):
+    commGotConnection = QtCore.pyqtSignal()
+    commLostConnection = QtCore.pyqtSignal()
+    commMessage = QtCore.pyqtSignal(object)
+
+    ## __init__
+    #
+    # @param hardware A hardware object.
+    # @param parameters A parameters object.
+    # @param parent The PyQt parent of this object.
+    #
+    @hdebug.debug
+    def __init__(self, hardware, parameters, parent):
+        QtGui.QDialog.__init__(self, parent)
+        halModule.HalModule.__init__(self)
+
+        self.actions = collections.deque()
+        self.complete_time = None
+        self.dead_times = []
+        self.last_frame_time = None
+        self.lock_min_sum = 50.0
+        self.lock_sum = None
+        self.running = False
+        self.script = []
+        self.script_directory = ""
+        self.setup_times = []
+        self.stage_position = None
+        self.step_index = -1
+        self.steps = []
+        self.waiting = None
+
+        if hardware and hasattr(hardware, "lock_min_sum"):
+            self.lock_min_sum = hardware.lock_min_sum
+
+        self.staging_thread = StagingThread(self)
+        self.staging_thread.finished.connect(self.handleStaged)
+
+        # UI setup
+        self.setWindowTitle(parameters.setup_name + " Sequencer")
+        self.setWindowIcon(qtAppIcon.QAppIcon())
+
+        self.script_label = QtGui.QLabel("No script loaded", self)
+        self.status_text = QtGui.QPlainTextEdit(self)
+        self.status_text.setReadOnly(True)
+        self.load_button = QtGui.QPushButton("Load", self)
+        self.run_button = QtGui.QPushButton("Run", self)
+        self.run_button.setEnabled(False)
+        self.ok_button = QtGui.QPushButton("Close", self)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addWidget(self.load_button)
+        button_layout.addWidget(self.run_button)
+        button_layout.addStretch(1)
+        button_layout.addWidget(self.ok_button)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self.script_label)
+        layout.addWidget(self.status_text)
+        layout.addLayout(button_layout)
+
+        self.load_button.clicked.connect(self.handleLoad)
+        self.ok_button.clicked.connect(self.handleOk)
+        self.run_button.clicked.connect(self.handleRun)
+
+        self.setModal(False)
+
+    ## cleanup
+    #
+    @hdebug.debug
+    def cleanup(self):
+        self.staging_thread.wait()
+
+    ## connectSignals
+    #
+    # @param signals An array of signals that we might be interested in connecting to.
+    #
+    @hdebug.debug
+    def connectSignals(self, signals):
+        for signal in signals:
+            if (signal[1] == "focusLockStatus"):
+                signal[2].connect(self.handleLockStatus)
+            elif (signal[1] == "stagePosition"):
+                signal[2].connect(self.handleStagePosition)
+            elif (signal[1] == "tcpComplete"):
+                signal[2].connect(lambda message, source = signal[0]: self.handleComplete(source, message))
+
+    ## getSignals
+    #
+    # @return The signals this module provides.
+    #
+    @hdebug.debug
+    def getSignals(self):
+        return [[self.hal_type, "commGotConnection", self.commGotConnection],
+                [self.hal_type, "commLostConnection", self.commLostConnection],
+                [self.hal_type, "commMessage", self.commMessage]]
+
+    ## handleComplete
+    #
+    # Handles the tcpComplete signal from HAL (the movie is finished)
+    # and from the focus lock (the lock action is finished).
+    #
+    # @param source The module that sent the signal.
+    # @param message The message that would be sent to a TCP client.
+    #
+    @hdebug.debug
+    def handleComplete(self, source, message):
+        if (source == "hal") and (self.waiting == "movie"):
+            self.complete_time = time.time()
+            step = self.steps[self.step_index]
+            step.end_time = self.complete_time
+            self.logStatus(step.name + " finished.")
+        elif (source != "hal") and (self.waiting == "lock"):
+            pass
+        else:
+            return
+        self.waiting = None
+        QtCore.QTimer.singleShot(0, self.nextAction)
+
+    ## handleDelay
+    #
+    # Called at the end of a delay action.
+    #
+    @hdebug.debug
+    def handleDelay(self):
+        if (self.waiting == "delay"):
+            self.waiting = None
+            self.nextAction()
+
+    ## handleLoad
+    #
+    # Load a script file.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleLoad(self, boolean):
+        if self.running:
+            return
+        filename = str(QtGui.QFileDialog.getOpenFileName(self,
+                                                         "Load Script",
+                                                         self.script_directory,
+                                                         "*.xml *.json"))
+        if filename:
+            self.script_directory = os.path.dirname(filename)
+            try:
+                self.script = loadSequence(filename)
+            except:
+                self.script = []
+                hdebug.logText("failed to parse script file " + filename)
+                QtGui.QMessageBox.information(self,
+                                              "Script file parsing error",
+                                              traceback.format_exc())
+            movies = countMovies(self.script)
+            self.script_label.setText(filename[-60:] + " (" + str(movies) + " movies)")
+            self.run_button.setEnabled(movies > 0)
+
+    ## handleLockStatus
+    #
+    # Handles the focusLockStatus signal from the focus lock.
+    #
+    # @param offset The focus lock offset.
+    # @param power The focus lock sum signal.
+    #
+    def handleLockStatus(self, offset, power):
+        self.lock_sum = power
+
+    ## handleOk
+    #
+    # Hide the dialog box.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleOk(self, boolean):
+        self.hide()
+
+    ## handleRun
+    #
+    # Start / abort the script.
+    #
+    # @param boolean Dummy parameter.
+    #
+    @hdebug.debug
+    def handleRun(self, boolean):
+        if self.running:
+            self.logStatus("Aborted.")
+            if (self.waiting == "movie"):
+                self.commMessage.emit(tcpControl.TCPMessage("abortMovie", []))
+            self.stopSequence()
+        else:
+            self.startSequence()
+
+    ## handleStagePosition
+    #
+    # Handles the stagePosition signal from the stage control.
+    #
+    # @param stage_x The stage position in x in microns.
+    # @param stage_y The stage position in y in microns.
+    # @param stage_z The stage position in z in microns.
+    #
+    def handleStagePosition(self, stage_x, stage_y, stage_z):
+        self.stage_position = [stage_x, stage_y]
+
+    ## handleStaged
+    #
+    # Called when the staging thread is finished to have the other
+    # modules stage their part of the movie.
+    #
+    @hdebug.debug
+    def handleStaged(self):
+        step = self.staging_thread.step
+        if (step is None) or step.staged:
+            return
+        step.staged = True
+        if step.staging_error:
+            self.logStatus("Staging " + step.name + " failed.")
+            hdebug.logText("sequencer: staging " + step.name + " failed " + step.staging_error)
+        if step.shutters:
+            self.commMessage.emit(tcpControl.TCPMessage("preStageShutters", [step.shutters]))
+
+    ## logStatus
+    #
+    # @param text The text to add to the status display.
+    #
+    def logStatus(self, text):
+        self.status_text.appendPlainText(text)
+        hdebug.logText("sequencer: " + text)
+
+    ## moveEarly
+    #
+    # Start moving the stage to the position of a movie.
+    #
+    # @param index The index of the movie.
+    #
+    @hdebug.debug
+    def moveEarly(self, index):
+        if (index < len(self.steps)):
+            step = self.steps[index]
+            if step.stage and (step.move_time is None):
+                self.commMessage.emit(tcpControl.TCPMessage("moveTo", step.stage))
+                step.move_time = time.time()
+
+    ## newFrame
+    #
+    # Records the time between the last frame of a movie and the first frame
+    # of the next movie. When the last frame of a movie arrives the stage is
+    # moved to the position of the next movie.
+    #
+    # @param frame A frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrame(self, frame, filming):
+        if self.running and filming and frame.master and (self.waiting == "movie"):
+            current_time = time.time()
+            step = self.steps[self.step_index]
+            if (frame.number == 0) and (self.last_frame_time is not None):
+                step.dead_time = current_time - self.last_frame_time
+                self.dead_times.append(step.dead_time)
+            self.last_frame_time = current_time
+
+            if (frame.number == (step.length - 1)):
+                self.moveEarly(self.step_index + 1)
+
+    ## nextAction
+    #
+    # Performs the actions of the current movie until there is one that
+    # we have to wait for, then continues with the next movie.
+    #
+    @hdebug.debug
+    def nextAction(self):
+        while self.running and (self.waiting is None):
+            if (len(self.actions) == 0):
+                self.nextStep()
+                continue
+
+            [message, wait] = self.actions.popleft()
+            if (wait == "lock_if_lost"):
+                if (self.lock_sum is not None) and (self.lock_sum < self.lock_min_sum):
+                    wait = "lock"
+                else:
+                    continue
+
+            if message is None:
+                self.waiting = "delay"
+                QtCore.QTimer.singleShot(wait, self.handleDelay)
+            else:
+                self.waiting = wait
+                self.commMessage.emit(message)
+
+                # HAL starts the movie before returning.
+                if (message.getType() == "movie"):
+                    self.startedMovie()
+
+    ## nextStep
+    #
+    # Start the next movie of the script (or stop if there are no more movies).
+    #
+    @hdebug.debug
+    def nextStep(self):
+        self.step_index += 1
+        if (self.step_index >= len(self.steps)):
+            self.logStatus("Finished.")
+            self.stopSequence()
+            return
+
+        # Make sure that staging has finished.
+        self.staging_thread.wait()
+        self.handleStaged()
+
+        step = self.steps[self.step_index]
+        step.start_time = time.time()
+        self.logStatus("Starting " + step.name + " (" + str(self.step_index + 1) + " of " + str(len(self.steps)) + ")")
+        self.actions = collections.deque(step.getActions())
+
+    ## preStage
+    #
+    # Start staging a movie.
+    #
+    # @param index The index of the movie in the script.
+    #
+    @hdebug.debug
+    def preStage(self, index):
+        if (index < len(self.steps)):
+            step = self.steps[index]
+            if step.progression_file:
+                self.commMessage.emit(tcpControl.TCPMessage("preStageProgressionFile", [step.progression_file]))
+            self.staging_thread.stage(step)
+
+    ## reportTimes
+    #
+    # Shows the time between movies.
+    #
+    @hdebug.debug
+    def reportTimes(self):
+        if (len(self.setup_times) > 0):
+            self.logStatus("Setup time between movies, mean {0:.1f} ms, max {1:.1f} ms".format(1000.0 * sum(self.setup_times)/len(self.setup_times),
+                                                                                         1000.0 * max(self.setup_times)))
+        if (len(self.dead_times) > 0):
+            self.logStatus("Time between the last and first frame of consecutive movies, mean {0:.1f} ms, max {1:.1f} ms".format(1000.0 * sum(self.dead_times)/len(self.dead_times),
+                                                                                                                              1000.0 * max(self.dead_times)))
+
+        # Position lists.
+        position_lists = []
+        for step in self.steps:
+            if step.position_list and not (step.position_list in position_lists):
+                position_lists.append(step.position_list)
+        for position_list in position_lists:
+            steps = filter(lambda x: (x.position_list == position_list) and (x.end_time is not None), self.steps)
+            if (len(steps) == 0):
+                continue
+            positions = len(filter(lambda x: x.stage, steps))
+            self.logStatus("{0:s}: {1:d} positions in {2:.1f} s, travel {3:.0f} um ({4:.0f} um in file order)".format(position_list.name,
+                                                                                                                   positions,
+                                                                                                                   steps[-1].end_time - steps[0].start_time,
+                                                                                                                   position_list.travel,
+                                                                                                                   position_list.file_travel))
+            overheads = map(lambda x: x.dead_time, filter(lambda x: x.stage and (x.dead_time is not None), steps))
+            if (len(overheads) > 0):
+                self.logStatus("  time between positions, mean {0:.1f} ms, max {1:.1f} ms".format(1000.0 * sum(overheads)/len(overheads),
+                                                                                                1000.0 * max(overheads)))
+
+    ## startedMovie
+    #
+    # Called after HAL has started a movie. Records the time since the
+    # last movie finished and starts staging the next movie.
+    #
+    @hdebug.debug
+    def startedMovie(self):
+        if self.complete_time is not None:
+            setup_time = time.time() - self.complete_time
+            self.setup_times.append(setup_time)
+            self.logStatus("  setup time {0:.1f} ms".format(1000.0 * setup_time))
+        self.preStage(self.step_index + 1)
+
+    ## startSequence
+    #
+    # Start the script.
+    #
+    @hdebug.debug
+    def startSequence(self):
+        self.actions.clear()
+        self.complete_time = None
+        self.dead_times = []
+        self.last_frame_time = None
+        self.running = True
+        self.setup_times = []
+        self.step_index = -1
+        self.steps = expandSequence(self.script, self.stage_position)
+        self.waiting = None
+        for step in self.steps:
+            step.dead_time = None
+            step.end_time = None
+            step.move_time = None
+            step.staged = False
+            step.start_time = None
+
+        self.status_text.clear()
+        self.load_button.setEnabled(False)
+        self.run_button.setText("Abort")
+        self.commGotConnection.emit()
+
+        self.preStage(0)
+        self.nextAction()
+
+    ## stopSequence
+    #
+    # Stop the script.
+    #
+    @hdebug.debug
+    def stopSequence(self):
+        self.actions.clear()
+        self.running = False
+        self.waiting = None
+        self.reportTimes()
+
+        self.load_button.setEnabled(True)
+        self.run_button.setText("Run")
+        self.commLostConnection.emit()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
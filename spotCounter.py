@@ -7,6 +7,9 @@
 # provide the user with a rough idea of the quality of the data
 # that they are taking.
 #
+# The localizations that are found during a film are also saved
+# (as film_name.locs, see halLib/localizationList.py).
+#
 # Hazen 08/13
 #
 
@@ -17,6 +20,7 @@ import sip
 import qtWidgets.qtAppIcon as qtAppIcon
 
 import halLib.halModule as halModule
+import halLib.localizationList as localizationList
 import sc_library.parameters as params
 
 # Debugging.
@@ -447,10 +451,12 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
         QtGui.QMainWindow.__init__(self, parent)
         halModule.HalModule.__init__(self)
 
+        self.color_indices = [0]
         self.counters = [False, False]
         self.filming = 0
         self.filenames = [False, False]
         self.image_graphs = [False, False]
+        self.loc_writer = False
         self.number_cameras = 1
         self.parameters = parameters
         self.spot_counter = False
@@ -538,6 +544,8 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
     @hdebug.debug
     def cleanup(self):
         self.spot_counter.shutDown()
+        if self.loc_writer:
+            self.loc_writer.close()
 
     ## closeEvent
     #
@@ -631,6 +639,16 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
         if (len(colors) == 0):
             colors = [[255, 255, 255]]
         points_per_cycle = len(colors)
+
+        # The index of the color of each frame of the cycle, the colors are
+        # numbered in the order in which they first appear in the cycle.
+        unique_colors = []
+        self.color_indices = []
+        for color in colors:
+            if not (color in unique_colors):
+                unique_colors.append(color)
+            self.color_indices.append(unique_colors.index(color))
+
         total_points = points_per_cycle
         while total_points < 100:
             total_points += points_per_cycle
@@ -680,7 +698,8 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
 
     ## updateCounts
     #
-    # Called when the objects in a frame have been localized.
+    # Called when the objects in a frame have been localized. During
+    # a film that is being saved the localizations are also saved.
     #
     # @param which_camera This is one of "camera1" or "camera2"
     # @param frame_number The frame number of the frame that was analyzed.
@@ -689,16 +708,21 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
     # @param spots The total number of spots that were found.
     #
     def updateCounts(self, which_camera, frame_number, x_locs, y_locs, spots):
+        color = self.color_indices[frame_number % len(self.color_indices)]
         if (which_camera == "camera1"):
             self.spot_graphs[0].updateGraph(frame_number, spots)
             if self.filming:
                 self.counters[0].updateCounts(spots)
                 self.image_graphs[0].updateImage(frame_number, x_locs, y_locs, spots)
+                if self.loc_writer:
+                    self.loc_writer.addLocalizations(frame_number, 0, color, x_locs, y_locs, spots)
         elif (which_camera == "camera2"):
             self.spot_graphs[1].updateGraph(frame_number, spots)
             if self.filming:
                 self.counters[1].updateCounts(spots)
                 self.image_graphs[1].updateImage(frame_number, x_locs, y_locs, spots)
+                if self.loc_writer:
+                    self.loc_writer.addLocalizations(frame_number, 1, color, x_locs, y_locs, spots)
         else:
             print "spotCounter.update Unknown camera:", which_camera
         self.imageProcessed.emit()
@@ -720,6 +744,7 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
         self.filming = True
         self.filenames = [False, False]
         if film_name:
+            self.loc_writer = localizationList.LocalizationWriter(film_name + ".locs")
             if (self.number_cameras == 1):
                 self.filenames[0] = film_name + ".png"
             else:
@@ -735,6 +760,10 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
     @hdebug.debug
     def stopFilm(self, film_writer):
         self.filming = False
+        if self.loc_writer:
+            self.loc_writer.close()
+            hdebug.logText("spot counter: saved " + str(self.loc_writer.getNumber()) + " localizations")
+            self.loc_writer = False
         if self.filenames[0]:
             for i in range(self.number_cameras):
                 self.image_graphs[i].saveImage(self.filenames[i])
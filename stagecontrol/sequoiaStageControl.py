@@ -18,13 +18,24 @@ import stagecontrol.stageThread as stageThread
 # stage control dialog.
 import stagecontrol.stageControl as stageControl
 
+#
+# Opens the stage. This is called by HAL (in a separate thread) before
+# the stage control dialog is created.
+#
+def initHardware(hardware, parameters):
+    return marzhauser.MarzhauserRS232("COM11", wait_time = 1.0e-3)
+
 #
 # Stage control dialog specialized for Storm4
 # with RS232 Marzhauser motorized stage.
 #
 class AStageControl(stageControl.StageControl):
     def __init__(self, hardware, parameters, parent = None):
-        self.stage = stageThread.QStageThread(marzhauser.MarzhauserRS232("COM11", wait_time = 1.0e-3))
+        if hardware and hasattr(hardware, "device"):
+            stage = hardware.device
+        else:
+            stage = initHardware(hardware, parameters)
+        self.stage = stageThread.QStageThread(stage)
         self.stage.start(QtCore.QThread.NormalPriority)
         stageControl.StageControl.__init__(self, 
                                            parameters,
@@ -11,6 +11,7 @@ from PyQt4 import QtCore, QtGui
 
 import qtWidgets.qtAppIcon as qtAppIcon
 
+import halLib.frameMetadata as frameMetadata
 import halLib.halModule as halModule
 
 # Debugging
@@ -150,6 +151,7 @@ class Translator():
 # will be a QStageThread object for buffering purposes.
 #
 class StageControl(QtGui.QDialog, halModule.HalModule):
+    stagePosition = QtCore.pyqtSignal(float, float, float)
 
     ## __init__
     #
@@ -165,6 +167,9 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
         self.directory = ""
         self.drag_start_x = 0
         self.drag_start_y = 0
+        self.film_position = [0, 0, 0]
+        self.recorder = frameMetadata.getRecorder()
+        self.recording = False
         self.stage_x = 0
         self.stage_y = 0
         self.stage_z = 0
@@ -273,6 +278,14 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
             elif (signal[1] == "stepMove"):
                 signal[2].connect(self.moveRelative)
 
+    ## getSignals
+    #
+    # @return The signals this module provides.
+    #
+    @hdebug.debug
+    def getSignals(self):
+        return [[self.hal_type, "stagePosition", self.stagePosition]]
+
     ## handleAdd
     #
     # Add the current stage position to the saved positions combo box.
@@ -401,6 +414,7 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
         self.stage_z = stage_z
         self.ui.xposText.setText("%.3f" % self.stage_x)
         self.ui.yposText.setText("%.3f" % self.stage_y)
+        self.stagePosition.emit(self.stage_x, self.stage_y, self.stage_z)
 
     ## handleQuit
     #
@@ -480,6 +494,21 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
         if self.stage:
             self.stage.goAbsolute(x, y)
 
+    ## newFrame
+    #
+    # Adds the current stage position to the frame meta-data during filming.
+    # The position at the last frame is saved as the position of the film, as
+    # the stage may already be moving to the next position when the film stops.
+    #
+    # @param frame A camera.Frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrame(self, frame, filming):
+        if filming and frame.master:
+            self.film_position = [self.stage_x, self.stage_y, self.stage_z]
+            if self.recording:
+                self.recorder.setValue(frame.number, "stage", self.film_position)
+
     ## newParameters
     #
     # @param parameters A parameters object.
@@ -498,7 +527,11 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
     #
     @hdebug.debug
     def startFilm(self, film_name, run_shutters):
+        self.film_position = [self.stage_x, self.stage_y, self.stage_z]
         self.startLockout()
+        if film_name:
+            self.recording = True
+            self.recorder.addField("stage", "float64", 3)
 
     ## startLockout
     #
@@ -518,8 +551,9 @@ class StageControl(QtGui.QDialog, halModule.HalModule):
     @hdebug.debug
     def stopFilm(self, film_writer):
         self.stopLockout()
+        self.recording = False
         if film_writer:
-            film_writer.setStagePosition([self.stage_x, self.stage_y, self.stage_z])
+            film_writer.setStagePosition(self.film_position)
 
     ## stopLockout
     #
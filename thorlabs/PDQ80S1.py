@@ -7,6 +7,8 @@
 #
 
 from ctypes import *
+import numpy
+import threading
 import time
 import os
 
@@ -22,61 +24,45 @@ def loadPDQ():
 #
 # PDQ80S1 interface class.
 #
+# The device scans continuously. A reader thread drains the samples
+# (x diff, y diff, sum) in blocks into a numpy ring buffer and qpdScan()
+# returns the average of the most recent samples, after rejecting the
+# outliers (samples more than outlier_mads median absolute deviations,
+# or at least min_deviation counts, from the median). We mostly seem to
+# get spurious reads when the stage jumps a large distance to a new
+# position.
+#
+# If reading fails repeatedly the device is re-initialized, this used
+# to be necessary when PDQStopScan failed.
+#
 
 instantiated = 0
 class PDQ80S1:
-    def __init__(self, interval = 5):
+    def __init__(self, interval = 5, window = 10, block = 4, buffer_size = 4096, outlier_mads = 5.0, min_deviation = 40.0):
         global instantiated
         assert instantiated == 0, "Attempt to instantiate two PDQ80S1 qpd instances."
         instantiated = 1
 
         loadPDQ()
+        self.block = block
         self.interval = interval
-        self.initialize()
-
-    def doScan(self, points):
-        assert points > 0, "qpdScan: points less than 1 " + str(points)
-        assert points < 255, "qpdScan: points greater than 255 " + str(points)
-        sensor_data_type = c_short * 12
-        sensor_data = sensor_data_type()
-        x_ref = 0.0
-        y_ref = 0.0
-        s_ref = 0.0
-        x_diff = 0.0
-        y_diff = 0.0
-        sum = 0.0
-        for i in range(points):
-            assert pdq.PDQReadScan(sensor_data, 12, 1000) == 1, "PDQReadScan failed."
-            #
-            # This check was put in to see if we ever got spurious reads.
-            # We just average them in anyway, as we mostly only seem to
-            # get them when the stage jumps a large distance to a new position,
-            # so presumably they are only transiently a problem.
-            #
-            good = 1
-            if i != 0:
-                if abs(x_ref - sensor_data[0]) > 40:
-                    good = 0
-                    print "doScan (qpd), bad x", x_ref, sensor_data[0]
-                if abs(y_ref - sensor_data[1]) > 40:
-                    good = 0
-                    print "doScan (qpd), bad y", y_ref, sensor_data[1]
-                if abs(s_ref - sensor_data[2]) > 40:
-                    good = 0
-                    print "doScan (qpd), bad sum", s_ref, sensor_data[2]
-            if good:
-                x_ref = sensor_data[0]
-                y_ref = sensor_data[1]
-                s_ref = sensor_data[2]
-            x_diff += sensor_data[0]
-            y_diff += sensor_data[1]
-            sum += sensor_data[2]
-                
-        return [x_diff/points, y_diff/points, sum/points]
+        self.min_deviation = min_deviation
+        self.outlier_mads = outlier_mads
+        self.window = window
+
+        self.buffer = numpy.zeros((buffer_size, 3))
+        self.condition = threading.Condition()
+        self.last_read = 0
+        self.read_failures = 0
+        self.rejected = 0
+        self.running = True
+        self.samples = 0
+        self.start_time = time.time()
 
-    def initialize(self):
-        assert pdq.USBinitPDQ80S1() == 0, "USBinitPDQ80S1 failed."
-        self.setScanInterval(self.interval)
+        self.initialize()
+        self.thread = threading.Thread(target = self.readSamples, name = "PDQ80S1")
+        self.thread.daemon = True
+        self.thread.start()
 
     def getScanParameters(self):
         # the default seems to be a 10ms scan time.
@@ -85,33 +71,84 @@ class PDQ80S1:
         assert pdq.PDQRetrieveScanParameters(scan_parameters) == 0, "PDQRetrieveScanParameters failed."
         return [scan_parameters[0], scan_parameters[1], scan_parameters[2]]
 
-    def qpdScan(self, points):
-        #
-        # Originally I tried to scan for a fixed number of points
-        # but then you have the problem that if you miss one you'll
-        # hang forever. Presumably that was the idea behind the timeout
-        # parameter in PDQReadScan, but it is either meaningless or
-        # not in milliseconds as the documentation suggests?
-        #
-#        assert pdq.PDQStartScan(c_ubyte(points)) == 0, "PDQStartScan failed."
+    # Returns the measured and expected sample rates (Hz), the number of
+    # samples received and lost (compared to the scan interval), the number
+    # of failed reads and the number of samples rejected as outliers.
+    def getStatistics(self):
+        self.condition.acquire()
+        samples = self.samples
+        elapsed = time.time() - self.start_time
+        self.condition.release()
+        expected = 1000.0/float(self.interval)
+        return {"expected_rate" : expected,
+                "lost" : max(0, int(elapsed * expected) - samples),
+                "read_failures" : self.read_failures,
+                "rejected" : self.rejected,
+                "sample_rate" : samples/elapsed,
+                "samples" : samples}
+
+    def initialize(self):
+        assert pdq.USBinitPDQ80S1() == 0, "USBinitPDQ80S1 failed."
+        self.setScanInterval(self.interval)
         assert pdq.PDQStartScan(0) == 0, "PDQStartScan failed."
-        scan_data = self.doScan(points)
-        #
-        # PDQStopScan can fail, perhaps because the USB device gets behind?
-        # We try to save things by basically turning it off, turning it
-        # back on and trying again.
-        #
-#        assert pdq.PDQStopScan() == 0, "PDQStopScan failed."
-        resp = pdq.PDQStopScan()
-        while resp != 0:
-            print "  PDQStopScan failed, attempting to re-initialize the device"
-            time.sleep(0.1)
-            assert pdq.USBUninit() == 0, "USBUninit failed."
-            self.initialize()
-            assert pdq.PDQStartScan(0) == 0, "PDQStartScan failed."
-            self.doScan(points)
-            resp = pdq.PDQStopScan()
-        return scan_data
+
+    # Returns [x diff, y diff, sum] averaged over the most recent samples,
+    # waiting until there are points (default is the window size) samples
+    # that were not used by the previous call.
+    def qpdScan(self, points = None):
+        if points is None:
+            points = self.window
+        points = min(points, self.buffer.shape[0])
+        timeout = 2.0 + 0.002 * points * self.interval
+        self.condition.acquire()
+        end_time = time.time() + timeout
+        while (self.samples < (self.last_read + points)) and (time.time() < end_time):
+            self.condition.wait(timeout)
+        points = min(points, self.samples)
+        self.last_read = self.samples
+        indices = numpy.arange(self.samples - points, self.samples) % self.buffer.shape[0]
+        data = self.buffer[indices]
+        self.condition.release()
+        assert (points > 0), "qpdScan: timed out waiting for data."
+
+        # Outlier rejection.
+        median = numpy.median(data, axis = 0)
+        deviation = numpy.abs(data - median)
+        threshold = numpy.maximum(self.outlier_mads * 1.4826 * numpy.median(deviation, axis = 0), self.min_deviation)
+        good = numpy.all((deviation <= threshold), axis = 1)
+        self.rejected += points - int(numpy.count_nonzero(good))
+        return map(float, numpy.mean(data[good], axis = 0))
+
+    # Reader thread.
+    def readSamples(self):
+        sensor_data = numpy.zeros((self.block, 12), dtype = numpy.int16)
+        failures = 0
+        while self.running:
+
+            # Read a block of samples.
+            n = 0
+            while self.running and (n < self.block):
+                if (pdq.PDQReadScan(sensor_data[n].ctypes.data_as(POINTER(c_short)), 12, 1000) == 1):
+                    n += 1
+                    failures = 0
+                else:
+                    self.read_failures += 1
+                    failures += 1
+                    if (failures > 10):
+                        print "  PDQReadScan failed, attempting to re-initialize the device"
+                        time.sleep(0.1)
+                        pdq.PDQStopScan()
+                        assert pdq.USBUninit() == 0, "USBUninit failed."
+                        self.initialize()
+                        failures = 0
+
+            # Add them to the ring buffer.
+            self.condition.acquire()
+            indices = numpy.arange(self.samples, self.samples + n) % self.buffer.shape[0]
+            self.buffer[indices] = sensor_data[:n,:3]
+            self.samples += n
+            self.condition.notifyAll()
+            self.condition.release()
 
     def setScanInterval(self, interval):
         # interval is a integer time in milliseconds > 0
@@ -119,6 +156,9 @@ class PDQ80S1:
         assert pdq.PDQSendScanInterval(c_uint(interval), 0) == 0, "PDQSendScanInterval failed."
 
     def shutDown(self):
+        self.running = False
+        self.thread.join()
+        pdq.PDQStopScan()
         assert pdq.USBUninit() == 0, "USBUninit failed."
         global instantiated
         instantiated = 0
@@ -148,6 +188,7 @@ if __name__ == "__main__":
                 print i, qpd.qpdScan(10)
             else:
                 qpd.qpdScan(10)
+        print qpd.getStatistics()
         qpd.shutDown()
 
 